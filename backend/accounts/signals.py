@@ -1,8 +1,10 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from .models import User, UserProfile
 from bloodbank.models import BloodBank
-from donors.models import Donation
+from donors.demographics import invalidate_demographics
+from donors.eligibility import recompute_eligibility
+from donors.models import Donation, Donor
 from requests.models import BloodRequest
 import random
 import string
@@ -47,6 +49,19 @@ def assign_donation_tx_id(sender, instance: Donation, created: bool, **kwargs):
         Donation.objects.filter(pk=instance.pk).update(tx_id=code)
 
 
+@receiver(post_save, sender=Donation)
+@receiver(post_delete, sender=Donation)
+def refresh_donor_eligibility(sender, instance: Donation, **kwargs):
+    # A donation moves the donor's next eligible date
+    recompute_eligibility(Donor.objects.filter(pk=instance.donor_id))
+
+
+@receiver(post_save, sender=Donor)
+@receiver(post_delete, sender=Donor)
+def invalidate_donor_demographics(sender, **kwargs):
+    invalidate_demographics()
+
+
 @receiver(post_save, sender=BloodRequest)
 def assign_bloodrequest_request_id(sender, instance: BloodRequest, created: bool, **kwargs):
     if not instance.request_id:
@@ -0,0 +1,20 @@
+from django.contrib import admin
+from .models import StatusChange
+
+
+@admin.register(StatusChange)
+class StatusChangeAdmin(admin.ModelAdmin):
+    list_display = ('entity_type', 'entity_id', 'from_state', 'to_state', 'actor', 'bloodbank_id', 'created_at')
+    list_filter = ('entity_type', 'to_state', 'created_at')
+    search_fields = ('=entity_id',)
+    ordering = ('-created_at',)
+
+    # History is append-only
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,95 @@
+"""
+Writing and reading the status history.
+
+Transition paths collect their changes and call ``record_changes`` once, so
+each API call costs a single bulk insert however many entities it touched.
+"""
+import numpy as np
+from django.db.models import Min, OuterRef, Q, Subquery
+
+from .models import StatusChange
+
+
+def record_changes(entity_type, changes, actor=None):
+    """Bulk-insert ``(entity_id, from_state, to_state, bloodbank_id)`` changes (states by name)."""
+    codes = StatusChange.STATE_CODES
+    actor_id = getattr(actor, 'pk', actor)
+    return StatusChange.objects.bulk_create([
+        StatusChange(
+            entity_type=entity_type,
+            entity_id=entity_id,
+            from_state=codes.get(from_state),
+            to_state=codes[to_state],
+            actor_id=actor_id,
+            bloodbank_id=bloodbank_id,
+        )
+        for entity_id, from_state, to_state, bloodbank_id in changes
+    ])
+
+
+def record_change(entity_type, entity_id, from_state, to_state, bloodbank_id=None, actor=None):
+    return record_changes(entity_type, [(entity_id, from_state, to_state, bloodbank_id)], actor)[0]
+
+
+def timeline(entity_type, entity_id):
+    """Status changes of one entity, oldest first (an index range scan)."""
+    names = StatusChange.STATE_NAMES
+    rows = (
+        StatusChange.objects.filter(entity_type=entity_type, entity_id=entity_id)
+        .order_by('created_at', 'id')
+        .values_list('from_state', 'to_state', 'actor_id', 'bloodbank_id', 'created_at')
+    )
+    return [
+        {
+            'from_state': names.get(from_state),
+            'to_state': names[to_state],
+            'actor': actor_id,
+            'bloodbank': bloodbank_id,
+            'at': created_at,
+        }
+        for from_state, to_state, actor_id, bloodbank_id, created_at in rows
+    ]
+
+
+def time_to_approve(entity_type, bloodbank_id=None, percentiles=(50, 90, 99)):
+    """Hours from creation to first approval, as percentiles per approving bank.
+
+    Each entity counts towards the bank of its first approval, even if it was
+    approved again later by another bank. Entities without a recorded
+    creation (history predating the audit table) are ignored. One grouped
+    query (the first approval's bank is an index lookup per entity);
+    percentiles are computed with NumPy.
+    """
+    pending = StatusChange.STATE_CODES['pending']
+    approved = StatusChange.STATE_CODES['approved']
+    approvals = StatusChange.objects.filter(entity_type=entity_type, to_state=approved)
+    qs = StatusChange.objects.filter(entity_type=entity_type)
+    if bloodbank_id is not None:
+        qs = qs.filter(entity_id__in=approvals.filter(bloodbank_id=bloodbank_id).values('entity_id'))
+    first_approval = approvals.filter(entity_id=OuterRef('entity_id')).order_by('created_at', 'id')
+    rows = (
+        qs.values('entity_id')
+        .annotate(
+            created=Min('created_at', filter=Q(from_state__isnull=True, to_state=pending)),
+            approved_at=Min('created_at', filter=Q(to_state=approved)),
+        )
+        .filter(created__isnull=False, approved_at__isnull=False)
+        .annotate(approved_by_bank=Subquery(first_approval.values('bloodbank_id')[:1]))
+        .values_list('approved_by_bank', 'created', 'approved_at')
+        .order_by()
+    )
+    if bloodbank_id is not None:
+        rows = rows.filter(approved_by_bank=bloodbank_id)
+    by_bank = {}
+    for bank, created, approved_at in rows:
+        by_bank.setdefault(bank, []).append((approved_at - created).total_seconds() / 3600)
+
+    results = []
+    for bank, hours in sorted(by_bank.items(), key=lambda item: (item[0] is None, item[0])):
+        values = np.percentile(np.array(hours), percentiles)
+        results.append({
+            'bloodbank': bank,
+            'count': len(hours),
+            **{f'p{p}_hours': round(float(v), 2) for p, v in zip(percentiles, values)},
+        })
+    return results
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-17 11:58
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatusChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity_type', models.PositiveSmallIntegerField(choices=[(1, 'Blood request'), (2, 'Appointment')])),
+                ('entity_id', models.BigIntegerField()),
+                ('from_state', models.PositiveSmallIntegerField(blank=True, choices=[(1, 'pending'), (2, 'approved'), (3, 'rejected'), (4, 'fulfilled'), (5, 'cancelled'), (6, 'completed')], null=True)),
+                ('to_state', models.PositiveSmallIntegerField(choices=[(1, 'pending'), (2, 'approved'), (3, 'rejected'), (4, 'fulfilled'), (5, 'cancelled'), (6, 'completed')])),
+                ('bloodbank_id', models.BigIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('actor', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['created_at', 'id'],
+                'indexes': [models.Index(fields=['entity_type', 'entity_id', 'created_at'], name='statuschange_entity_idx'), models.Index(fields=['entity_type', 'to_state', 'bloodbank_id'], name='statuschange_sla_idx')],
+            },
+        ),
+    ]
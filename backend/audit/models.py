@@ -0,0 +1,52 @@
+from django.db import models
+from django.utils import timezone
+from accounts.models import User
+
+
+class StatusChange(models.Model):
+    """Append-only status history for blood requests and appointments.
+
+    Kept deliberately narrow: entity type and states are small integer codes,
+    and the entity, actor and bank are plain integer columns without foreign
+    key constraints, so history survives deletes and rows stay small.
+    """
+    BLOOD_REQUEST = 1
+    APPOINTMENT = 2
+
+    ENTITY_TYPES = (
+        (BLOOD_REQUEST, 'Blood request'),
+        (APPOINTMENT, 'Appointment'),
+    )
+
+    # Union of BloodRequest and Appointment statuses
+    STATES = (
+        (1, 'pending'),
+        (2, 'approved'),
+        (3, 'rejected'),
+        (4, 'fulfilled'),
+        (5, 'cancelled'),
+        (6, 'completed'),
+    )
+    STATE_CODES = {name: code for code, name in STATES}
+    STATE_NAMES = dict(STATES)
+
+    entity_type = models.PositiveSmallIntegerField(choices=ENTITY_TYPES)
+    entity_id = models.BigIntegerField()
+    from_state = models.PositiveSmallIntegerField(choices=STATES, null=True, blank=True)  # null on creation
+    to_state = models.PositiveSmallIntegerField(choices=STATES)
+    actor = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True,
+                              related_name='+')
+    bloodbank_id = models.BigIntegerField(null=True, blank=True)  # bank handling the entity, for per-bank SLAs
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['created_at', 'id']
+        indexes = [
+            # Timeline of one entity
+            models.Index(fields=['entity_type', 'entity_id', 'created_at'], name='statuschange_entity_idx'),
+            # Per-bank SLA aggregation
+            models.Index(fields=['entity_type', 'to_state', 'bloodbank_id'], name='statuschange_sla_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_entity_type_display()} {self.entity_id}: {self.from_state} -> {self.to_state}"
@@ -0,0 +1,44 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from .log import record_change, time_to_approve, timeline
+from .models import StatusChange
+
+
+REQUEST = StatusChange.BLOOD_REQUEST
+
+
+class TimeToApproveTests(TestCase):
+    def setUp(self):
+        self.start = timezone.now() - timedelta(days=1)
+
+    def change(self, entity_id, from_state, to_state, bloodbank_id=None, hours=0):
+        change = record_change(REQUEST, entity_id, from_state, to_state, bloodbank_id)
+        StatusChange.objects.filter(pk=change.pk).update(created_at=self.start + timedelta(hours=hours))
+
+    def test_entities_count_towards_their_first_approving_bank(self):
+        self.change(1, None, 'pending')
+        self.change(1, 'pending', 'approved', bloodbank_id=7, hours=2)
+        # A later approval elsewhere (after a rejection) does not move it
+        self.change(1, 'approved', 'rejected', bloodbank_id=9, hours=3)
+        self.change(1, 'rejected', 'approved', bloodbank_id=9, hours=5)
+        self.change(2, None, 'pending')
+        self.change(2, 'pending', 'approved', bloodbank_id=9, hours=4)
+
+        results = time_to_approve(REQUEST)
+        self.assertEqual([(row['bloodbank'], row['count'], row['p50_hours']) for row in results],
+                         [(7, 1, 2.0), (9, 1, 4.0)])
+        self.assertEqual([row['bloodbank'] for row in time_to_approve(REQUEST, bloodbank_id=9)], [9])
+        self.assertEqual(time_to_approve(REQUEST, bloodbank_id=9)[0]['count'], 1)
+
+    def test_history_without_a_creation_is_ignored(self):
+        self.change(3, 'pending', 'approved', bloodbank_id=7, hours=1)
+        self.assertEqual(time_to_approve(REQUEST), [])
+
+    def test_timeline_is_oldest_first(self):
+        self.change(4, None, 'pending')
+        self.change(4, 'pending', 'approved', bloodbank_id=7, hours=1)
+        self.assertEqual([(row['from_state'], row['to_state']) for row in timeline(REQUEST, 4)],
+                         [(None, 'pending'), ('pending', 'approved')])
@@ -0,0 +1,8 @@
+from rest_framework.routers import DefaultRouter
+from .views import StatusHistoryViewSet
+
+
+router = DefaultRouter()
+router.register(r'status-history', StatusHistoryViewSet, basename='status-history')
+
+urlpatterns = router.urls
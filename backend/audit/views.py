@@ -0,0 +1,79 @@
+from rest_framework import viewsets, permissions, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.response import Response
+from donors.models import Appointment
+from requests.models import BloodRequest
+from .log import time_to_approve, timeline
+from .models import StatusChange
+
+
+ENTITIES = {
+    'request': StatusChange.BLOOD_REQUEST,
+    'appointment': StatusChange.APPOINTMENT,
+}
+
+
+def _can_view(user, entity_type, entity_id):
+    """Same visibility as the entity's own viewset."""
+    if user.is_staff:
+        return True
+    if entity_type == StatusChange.BLOOD_REQUEST:
+        # Blood banks see all requests; others only their own
+        if hasattr(user, 'bloodbank'):
+            return True
+        return BloodRequest.objects.filter(pk=entity_id, requester=user).exists()
+    if hasattr(user, 'bloodbank'):
+        return Appointment.objects.filter(pk=entity_id, bloodbank=user.bloodbank).exists()
+    return Appointment.objects.filter(pk=entity_id, user=user).exists()
+
+
+class StatusHistoryViewSet(viewsets.GenericViewSet):
+    """Status timelines and approval SLAs from the append-only audit table."""
+    queryset = StatusChange.objects.all()
+    permission_classes = [permissions.IsAuthenticated]
+
+    def _entity_type(self):
+        entity = self.request.query_params.get('entity', 'request')
+        if entity not in ENTITIES:
+            return None
+        return ENTITIES[entity]
+
+    @action(detail=False, methods=['get'])
+    def timeline(self, request):
+        """Status changes of one entity, oldest first.
+        Query params: ?entity=request|appointment, ?id=
+        """
+        entity_type = self._entity_type()
+        if entity_type is None:
+            return Response({'error': 'entity must be request or appointment'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            entity_id = int(request.query_params.get('id', ''))
+        except ValueError:
+            return Response({'error': 'id is required'}, status=status.HTTP_400_BAD_REQUEST)
+        if not _can_view(request.user, entity_type, entity_id):
+            raise PermissionDenied('You cannot view the history of this item.')
+        return Response({
+            'entity': request.query_params.get('entity', 'request'),
+            'id': entity_id,
+            'changes': timeline(entity_type, entity_id),
+        })
+
+    @action(detail=False, methods=['get'])
+    def time_to_approve(self, request):
+        """Hours from creation to approval, p50/p90/p99 per bank (blood banks and staff).
+        Query params: ?entity=request|appointment, ?bloodbank=
+        """
+        user = request.user
+        if not (user.is_staff or hasattr(user, 'bloodbank')):
+            raise PermissionDenied('Only blood banks and staff can view approval times.')
+        entity_type = self._entity_type()
+        if entity_type is None:
+            return Response({'error': 'entity must be request or appointment'}, status=status.HTTP_400_BAD_REQUEST)
+        bloodbank_id = request.query_params.get('bloodbank')
+        if bloodbank_id:
+            try:
+                bloodbank_id = int(bloodbank_id)
+            except ValueError:
+                return Response({'error': 'bloodbank must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(time_to_approve(entity_type, bloodbank_id or None))
@@ -0,0 +1,120 @@
+"""
+Benchmark the grid-indexed nearest-bank search against a synthetic network.
+
+Creates N blood banks inside a transaction (clustered around cities, with
+a rural spread), runs k-nearest and radius searches from random points,
+checks them against a full scan, reports latency percentiles and queries
+per search, then rolls everything back.
+
+    python manage.py bench_nearest_banks --banks 50000 --searches 200
+"""
+import random
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from accounts.models import User
+from bloodbank.models import BloodBank
+from geo import grid
+
+
+CITIES = ((18.52, 73.86), (19.08, 72.88), (28.61, 77.21), (12.97, 77.59), (13.08, 80.27), (17.39, 78.49),
+          (22.57, 88.36), (26.91, 75.79), (26.85, 80.95), (21.15, 79.09))
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Time k-nearest and radius bank searches over many banks (data is rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--banks', type=int, default=50000)
+        parser.add_argument('--searches', type=int, default=200)
+        parser.add_argument('--k', type=int, default=10)
+        parser.add_argument('--radius-km', type=float, default=25.0)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            self.stdout.write('Benchmark data rolled back.')
+
+    def point(self, rng):
+        if rng.random() < 0.6:
+            lat, lon = rng.choice(CITIES)
+            return round(rng.gauss(lat, 0.3), 6), round(rng.gauss(lon, 0.3), 6)
+        return round(rng.uniform(8, 35), 6), round(rng.uniform(68, 97), 6)
+
+    def report(self, label, timings, queries):
+        timings = np.array(timings) * 1000
+        self.stdout.write(
+            f'{label}: p50 {np.percentile(timings, 50):.2f} ms, p95 {np.percentile(timings, 95):.2f} ms, '
+            f'max {timings.max():.2f} ms, {np.mean(queries):.1f} queries/search'
+        )
+
+    def run(self, options):
+        rng = random.Random(options['seed'])
+        n_banks = options['banks']
+        tag = f'bench{time.time_ns() % 10 ** 8}'
+
+        started = time.perf_counter()
+        users = User.objects.bulk_create([
+            User(username=f'{tag}-{i}', email=f'{tag}-{i}@bench.invalid', phone=f'{tag}{i}', user_type='bloodbank')
+            for i in range(n_banks)
+        ], batch_size=5000)
+        banks = []
+        for i, user in enumerate(users):
+            lat, lon = self.point(rng)
+            banks.append(BloodBank(
+                user=user, name=f'Bench Bank {i}', registration_number=f'{tag}-{i}', latitude=lat, longitude=lon,
+                grid_cell=grid.cell_of(lat, lon),  # bulk_create skips save()
+            ))
+        BloodBank.objects.bulk_create(banks, batch_size=5000)
+        self.stdout.write(f'Seeded {n_banks} banks in {time.perf_counter() - started:.1f}s')
+
+        queryset = BloodBank.objects.filter(status='approved', is_operational=True)
+        located = queryset.filter(latitude__isnull=False, longitude__isnull=False)
+        everything = list(located.values_list('latitude', 'longitude'))
+        lats = np.array([float(row[0]) for row in everything])
+        lons = np.array([float(row[1]) for row in everything])
+
+        k, radius = options['k'], options['radius_km']
+        nearest_times, nearest_queries, within_times, within_queries, scan_times = [], [], [], [], []
+        mismatches = 0
+        for _ in range(options['searches']):
+            lat, lon = self.point(rng)
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                found = grid.nearest(queryset, lat, lon, k)
+                nearest_times.append(time.perf_counter() - started)
+            nearest_queries.append(len(captured))
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                grid.within(queryset, lat, lon, radius)
+                within_times.append(time.perf_counter() - started)
+            within_queries.append(len(captured))
+
+            # The full scan it replaces, and the reference answer
+            started = time.perf_counter()
+            rows = list(located.values_list('id', 'latitude', 'longitude'))
+            distances = grid.haversine_km(lat, lon, np.array([float(r[1]) for r in rows]),
+                                          np.array([float(r[2]) for r in rows]))
+            np.argsort(distances)[:k]
+            scan_times.append(time.perf_counter() - started)
+            expected = np.sort(grid.haversine_km(lat, lon, lats, lons))[:k]
+            if not np.allclose([distance for _, distance in found], expected):
+                mismatches += 1
+
+        self.report(f'k-nearest (k={k})', nearest_times, nearest_queries)
+        self.report(f'within {radius:g} km', within_times, within_queries)
+        self.report('full scan', scan_times, [1])
+        self.stdout.write(f'{mismatches} of {options["searches"]} k-nearest results differed from the full scan')
+        self.stdout.write(self.style.SUCCESS('Nearest-bank benchmark complete'))
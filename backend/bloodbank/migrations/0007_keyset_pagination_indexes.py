@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bloodbank', '0006_alter_bloodbank_status_alter_campregistration_status'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='campregistration',
+            index=models.Index(fields=['registered_at', 'id'], name='campreg_registered_idx'),
+        ),
+    ]
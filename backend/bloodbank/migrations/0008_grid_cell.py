@@ -0,0 +1,44 @@
+# Generated by Django 4.2.7 on 2026-10-17 12:20
+
+from django.db import migrations, models
+
+
+def backfill_grid_cell(apps, schema_editor):
+    from geo.grid import cell_of
+
+    for model_name in ('BloodBank', 'DonationCamp'):
+        model = apps.get_model('bloodbank', model_name)
+        rows = list(model.objects.filter(latitude__isnull=False, longitude__isnull=False)
+                    .only('id', 'latitude', 'longitude'))
+        for row in rows:
+            row.grid_cell = cell_of(row.latitude, row.longitude)
+        model.objects.bulk_update(rows, ['grid_cell'], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bloodbank', '0007_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bloodbank',
+            name='grid_cell',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='donationcamp',
+            name='grid_cell',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_grid_cell, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='bloodbank',
+            index=models.Index(condition=models.Q(('grid_cell__isnull', False)), fields=['grid_cell', 'latitude', 'longitude'], name='bloodbank_grid_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='donationcamp',
+            index=models.Index(condition=models.Q(('grid_cell__isnull', False)), fields=['grid_cell', 'latitude', 'longitude'], name='donationcamp_grid_idx'),
+        ),
+    ]
@@ -3,6 +3,7 @@ from django.db import models
 # Create your models here.
 from django.db import models
 from accounts.models import User
+from geo.grid import cell_of
 
 class BloodBank(models.Model):
     STATUS_CHOICES = (
@@ -23,6 +24,8 @@ class BloodBank(models.Model):
     pincode = models.CharField(max_length=10, blank=True)
     latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    # See geo.grid; NULL without coordinates
+    grid_cell = models.BigIntegerField(null=True, blank=True, editable=False)
     license_document = models.FileField(upload_to='licenses/', null=True, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='approved')
     approved_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='approved_bloodbanks')
@@ -36,8 +39,18 @@ class BloodBank(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.grid_cell = cell_of(self.latitude, self.longitude)
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'grid_cell'}
+        super().save(*args, **kwargs)
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['grid_cell', 'latitude', 'longitude'], name='bloodbank_grid_idx',
+                         condition=models.Q(grid_cell__isnull=False)),
+        ]
 
     
 
@@ -51,6 +64,7 @@ class DonationCamp(models.Model):
     pincode = models.CharField(max_length=10, blank=True)
     latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    grid_cell = models.BigIntegerField(null=True, blank=True, editable=False)
     start_date = models.DateField()
     end_date = models.DateField(null=True, blank=True)
     contact_number = models.CharField(max_length=15, blank=True)
@@ -59,10 +73,20 @@ class DonationCamp(models.Model):
 
     class Meta:
         ordering = ['-start_date']
+        indexes = [
+            models.Index(fields=['grid_cell', 'latitude', 'longitude'], name='donationcamp_grid_idx',
+                         condition=models.Q(grid_cell__isnull=False)),
+        ]
 
     def __str__(self):
         return f"{self.name} - {self.city}"
 
+    def save(self, *args, **kwargs):
+        self.grid_cell = cell_of(self.latitude, self.longitude)
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'grid_cell'}
+        super().save(*args, **kwargs)
+
 
 class CampRegistration(models.Model):
     STATUS_CHOICES = (
@@ -87,6 +111,10 @@ class CampRegistration(models.Model):
     class Meta:
         ordering = ['-registered_at']
         unique_together = ('camp', 'user')  # Prevent duplicate registrations
+        indexes = [
+            # Keyset pagination on the default ordering
+            models.Index(fields=['registered_at', 'id'], name='campreg_registered_idx'),
+        ]
 
     def __str__(self):
         return f"{self.full_name} - {self.camp.name}"
\ No newline at end of file
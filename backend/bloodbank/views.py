@@ -2,13 +2,15 @@ from rest_framework import viewsets, permissions, decorators, response, status
 from .models import BloodBank, DonationCamp, CampRegistration
 from .serializers import BloodBankSerializer, DonationCampSerializer, CampRegistrationSerializer
 from django.db import transaction
+from geo.views import NearestMixin
 
 
-class BloodBankViewSet(viewsets.ModelViewSet):
+class BloodBankViewSet(NearestMixin, viewsets.ModelViewSet):
     queryset = BloodBank.objects.all().order_by('-created_at')
     serializer_class = BloodBankSerializer
     filterset_fields = ['city', 'state', 'status', 'is_operational']
     search_fields = ['name', 'registration_number', 'city', 'state']
+    search_index = 'bloodbank'
     ordering_fields = ['created_at', 'name']
 
     def list(self, request, *args, **kwargs):
@@ -31,6 +33,15 @@ class BloodBankViewSet(viewsets.ModelViewSet):
                 )
         return super().list(request, *args, **kwargs)
 
+    def nearby_queryset(self):
+        # Approved, operational banks unless the caller filters on those
+        qs = super().nearby_queryset()
+        if 'status' not in self.request.query_params:
+            qs = qs.filter(status='approved')
+        if 'is_operational' not in self.request.query_params:
+            qs = qs.filter(is_operational=True)
+        return qs
+
     @decorators.action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated])
     def my_inventory(self, request):
         # Return inventory rows for the current user's bloodbank
@@ -42,7 +53,7 @@ class BloodBankViewSet(viewsets.ModelViewSet):
         return response.Response(InventorySerializer(inv, many=True).data)
 
 
-class DonationCampViewSet(viewsets.ModelViewSet):
+class DonationCampViewSet(NearestMixin, viewsets.ModelViewSet):
     queryset = DonationCamp.objects.all().order_by('-start_date')
     serializer_class = DonationCampSerializer
     filterset_fields = ['city']
@@ -72,6 +83,7 @@ class CampRegistrationViewSet(viewsets.ModelViewSet):
     serializer_class = CampRegistrationSerializer
     filterset_fields = ['camp', 'status', 'blood_group']
     search_fields = ['full_name', 'email', 'phone', 'camp__name']
+    search_index = 'campregistration'
     ordering_fields = ['registered_at', 'full_name']
     permission_classes = [permissions.IsAuthenticated]
 
@@ -0,0 +1,136 @@
+"""
+Donor ages in the database, and the cached demographics rollup.
+
+Ages are turned into ``date_of_birth`` ranges against today's date
+(``age_range``), so age filters and age bands are index range predicates
+rather than a ``Donor.age`` computed for every row in Python. Ages are
+clamped to ``0..MAX_AGE_YEARS`` so the dates stay representable.
+
+The rollup counts donors by blood group, age band, gender and state with
+one grouped query. It is cached per day, since bands move as birthdays pass,
+and invalidated when a donor is written (see ``accounts.signals``; bulk
+writes call ``invalidate_demographics`` themselves). As with the inventory
+rollups, the timeout only bounds staleness for per-process caches.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, CharField, Count, Q, Value, When
+from django.utils import timezone
+
+from .eligibility import add_years
+from .models import Donor
+
+
+DEMOGRAPHICS_KEY = 'donors:demographics:{day}'
+MAX_AGE_YEARS = 150
+# (label, youngest, oldest); None is open-ended
+AGE_BANDS = (
+    ('under 18', None, 17),
+    ('18-24', 18, 24),
+    ('25-34', 25, 34),
+    ('35-44', 35, 44),
+    ('45-54', 45, 54),
+    ('55-65', 55, 65),
+    ('over 65', 66, None),
+)
+
+
+class InvalidAge(ValueError):
+    pass
+
+
+def age_param(params, name):
+    """Whole years from query parameter ``name``, clamped to ``0..MAX_AGE_YEARS``; ``None`` when absent."""
+    raw = (params.get(name) or '').strip()
+    if not raw:
+        return None
+    try:
+        years = int(raw)
+    except ValueError:
+        raise InvalidAge(f'{name} must be a whole number of years')
+    return min(max(years, 0), MAX_AGE_YEARS)
+
+
+def _timeout():
+    return getattr(settings, 'DONOR_DEMOGRAPHICS_CACHE_TIMEOUT', 300)
+
+
+def age_range(min_age=None, max_age=None, today=None):
+    """``Q`` on ``date_of_birth`` for donors aged ``min_age`` to ``max_age`` inclusive (either may be ``None``)."""
+    today = today or timezone.localdate()
+    condition = Q()
+    if min_age is not None:
+        min_age = min(max(min_age, 0), MAX_AGE_YEARS)
+    if max_age is not None:
+        max_age = min(max(max_age, 0), MAX_AGE_YEARS)
+    if min_age is not None:
+        condition &= Q(date_of_birth__lte=add_years(today, -min_age))
+    if max_age is not None:
+        condition &= Q(date_of_birth__gt=add_years(today, -(max_age + 1)))
+    return condition
+
+
+def age_band_case(today=None):
+    """Expression labelling each donor with their ``AGE_BANDS`` band."""
+    return Case(
+        *[When(age_range(youngest, oldest, today), then=Value(label)) for label, youngest, oldest in AGE_BANDS],
+        output_field=CharField(),
+    )
+
+
+def compute_demographics(today=None):
+    """Donor counts per (blood group, age band, gender, state) as of ``today``."""
+    today = today or timezone.localdate()
+    rows = (
+        Donor.objects
+        .annotate(band=age_band_case(today))
+        .values('blood_group', 'band', 'gender', 'state')
+        .annotate(donors=Count('id'))
+        .order_by()
+    )
+    band_order = {label: position for position, (label, _, _) in enumerate(AGE_BANDS)}
+    rows = sorted(rows, key=lambda row: (row['state'], row['blood_group'], band_order[row['band']], row['gender']))
+    return {
+        'generated_at': timezone.now(),
+        'as_of': today,
+        'age_bands': [label for label, _, _ in AGE_BANDS],
+        'results': [
+            {
+                'blood_group': row['blood_group'],
+                'age_band': row['band'],
+                'gender': row['gender'],
+                'state': row['state'],
+                'donors': row['donors'],
+            }
+            for row in rows
+        ],
+    }
+
+
+def demographics(blood_group=None, gender=None, state=None, age_band=None):
+    """Return the cached rollup, optionally filtered (case-insensitive for state)."""
+    today = timezone.localdate()
+    key = DEMOGRAPHICS_KEY.format(day=today.isoformat())
+    rollup = cache.get(key)
+    if rollup is None:
+        rollup = compute_demographics(today)
+        cache.set(key, rollup, _timeout())
+
+    results = rollup['results']
+    if blood_group:
+        results = [r for r in results if r['blood_group'] == blood_group]
+    if gender:
+        results = [r for r in results if r['gender'] == gender]
+    if state:
+        state = state.strip().lower()
+        results = [r for r in results if (r['state'] or '').lower() == state]
+    if age_band:
+        results = [r for r in results if r['age_band'] == age_band]
+    return {**rollup, 'results': results}
+
+
+def invalidate_demographics():
+    """Drop today's rollup once the current transaction commits."""
+    key = DEMOGRAPHICS_KEY.format(day=timezone.localdate().isoformat())
+    transaction.on_commit(lambda: cache.delete(key))
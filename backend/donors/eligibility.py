@@ -0,0 +1,164 @@
+"""
+Donor eligibility: when can each donor give blood next?
+
+``Donor.next_eligible_date`` is computed from the deferral rules below and
+stored, so "eligible donors of group X in city Y on date D" is a single
+range read on the ``(LOWER(city), blood_group, next_eligible_date)``
+index (see ``eligible_on``). ``NULL`` means not eligible at all: the
+donor is flagged ineligible, weighs too little, or is past the age limit.
+
+Rules (whole blood):
+
+* aged ``MIN_AGE`` to ``MAX_AGE`` inclusive, at least ``MIN_WEIGHT_KG``;
+* ``DEFERRAL_DAYS`` after the last donation, by gender, or
+  ``LOW_HEMOGLOBIN_DEFERRAL_DAYS`` when that donation's hemoglobin was
+  below ``MIN_HEMOGLOBIN``.
+
+The last donation is the later of ``Donor.last_donation_date`` (which
+donors may self-report) and their latest recorded ``Donation``.
+
+``Donor.is_eligible`` remains the manual (e.g. medical) override. The date
+is recomputed when a donor is saved and when donations are recorded (see
+``recompute_eligibility``). Ageing out is the only way an eligible donor's
+date changes without a write, so ``refresh_eligibility`` runs nightly over
+just the donors who aged out since the last run. A date that has merely
+been reached needs no work: ``next_eligible_date <= today`` already counts
+the donor as eligible.
+"""
+import calendar
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from .models import Donation, Donor
+
+
+MIN_AGE = 18
+MAX_AGE = 65
+MIN_WEIGHT_KG = Decimal('45')
+MIN_HEMOGLOBIN = Decimal('12.5')
+DEFERRAL_DAYS = {'M': 90, 'F': 120, 'O': 90}
+LOW_HEMOGLOBIN_DEFERRAL_DAYS = 180
+BATCH_SIZE = 2000
+_FIELDS = ('id', 'date_of_birth', 'gender', 'weight', 'is_eligible', 'last_donation_date', 'next_eligible_date')
+
+
+def add_years(day, years):
+    try:
+        return day.replace(year=day.year + years)
+    except ValueError:
+        # 29 February in a non-leap year
+        return day.replace(year=day.year + years, day=28)
+
+
+def next_eligible_date(date_of_birth, gender, weight, last_donation_date=None, last_hemoglobin=None,
+                       is_eligible=True, today=None):
+    """First day the donor may donate, or ``None`` if they are not eligible at all (as of ``today``)."""
+    if not is_eligible or date_of_birth is None or weight is None or Decimal(weight) < MIN_WEIGHT_KG:
+        return None
+    earliest = add_years(date_of_birth, MIN_AGE)
+    if last_donation_date:
+        days = DEFERRAL_DAYS.get(gender, DEFERRAL_DAYS['M'])
+        if last_hemoglobin is not None and Decimal(last_hemoglobin) < MIN_HEMOGLOBIN:
+            days = max(days, LOW_HEMOGLOBIN_DEFERRAL_DAYS)
+        earliest = max(earliest, last_donation_date + timedelta(days=days))
+    if max(earliest, today or timezone.localdate()) >= add_years(date_of_birth, MAX_AGE + 1):
+        return None
+    return earliest
+
+
+def _latest(field):
+    return Subquery(
+        Donation.objects.filter(donor=OuterRef('pk')).order_by('-donation_date', '-id').values(field)[:1]
+    )
+
+
+def _compute(donor, latest_date, latest_hemoglobin, today=None):
+    last = donor.last_donation_date
+    hemoglobin = None
+    if latest_date and (last is None or latest_date >= last):
+        last, hemoglobin = latest_date, latest_hemoglobin
+    return next_eligible_date(donor.date_of_birth, donor.gender, donor.weight, last, hemoglobin,
+                              donor.is_eligible, today)
+
+
+def eligibility_for(donor):
+    """``next_eligible_date`` for one (possibly unsaved) donor; reads their latest donation."""
+    latest_date = latest_hemoglobin = None
+    if donor.pk:
+        latest = (
+            Donation.objects.filter(donor_id=donor.pk).order_by('-donation_date', '-id')
+            .values_list('donation_date', 'hemoglobin_level').first()
+        )
+        if latest:
+            latest_date, latest_hemoglobin = latest
+    return _compute(donor, latest_date, latest_hemoglobin)
+
+
+def recompute_eligibility(queryset, batch_size=BATCH_SIZE, today=None):
+    """Recompute ``next_eligible_date`` for ``queryset``'s donors; returns how many changed.
+
+    Works in id-keyset batches of ``batch_size``: one read (latest donation
+    joined in with subqueries) and one ``bulk_update`` of the changed rows each.
+    """
+    changed = 0
+    last_id = 0
+    while True:
+        batch = list(
+            queryset.filter(id__gt=last_id).order_by('id').only(*_FIELDS)
+            .annotate(latest_date=_latest('donation_date'), latest_hemoglobin=_latest('hemoglobin_level'))
+            [:batch_size]
+        )
+        if not batch:
+            return changed
+        updates = []
+        for donor in batch:
+            value = _compute(donor, donor.latest_date, donor.latest_hemoglobin, today)
+            if value != donor.next_eligible_date:
+                donor.next_eligible_date = value
+                updates.append(donor)
+        if updates:
+            Donor.objects.bulk_update(updates, ['next_eligible_date'])
+            changed += len(updates)
+        last_id = batch[-1].id
+        if len(batch) < batch_size:
+            return changed
+
+
+def _aged_out_born_on_or_before(day):
+    """Latest date of birth whose ``MAX_AGE + 1``th birthday (per ``add_years``) is on or before ``day``."""
+    born = add_years(day, -(MAX_AGE + 1))
+    # 29 February birthdays fall on 28 February in non-leap years
+    if (born.month, born.day) == (2, 28) and calendar.isleap(born.year) and not calendar.isleap(day.year):
+        born += timedelta(days=1)
+    return born
+
+
+def refresh_eligibility(today=None, days=1, batch_size=BATCH_SIZE):
+    """Nightly pass: donors who aged out in the last ``days`` days; returns how many dates changed."""
+    today = today or timezone.localdate()
+    # Donors whose (MAX_AGE + 1)th birthday fell in (today - days, today]: a date_of_birth range on
+    # donor_dob_idx. Consecutive nightly windows tile the dates of birth with no gaps or overlaps.
+    return recompute_eligibility(
+        Donor.objects.filter(
+            next_eligible_date__isnull=False,
+            date_of_birth__gt=_aged_out_born_on_or_before(today - timedelta(days=days)),
+            date_of_birth__lte=_aged_out_born_on_or_before(today),
+        ),
+        batch_size,
+        today,
+    )
+
+
+def eligible_on(blood_group, city=None, state=None, on_date=None):
+    """Donors of ``blood_group`` in ``city`` (or ``state``) who may donate on ``on_date``: one index range read."""
+    on_date = on_date or timezone.localdate()
+    qs = Donor.objects.filter(blood_group=blood_group, next_eligible_date__lte=on_date)
+    if city:
+        qs = qs.alias(city_key=Lower('city')).filter(city_key=city.strip().lower())
+    if state:
+        qs = qs.alias(state_key=Lower('state')).filter(state_key=state.strip().lower())
+    return qs
@@ -0,0 +1,230 @@
+"""
+Fan emergency blood requests out to donors who could help.
+
+``fan_out`` selects donors of every group compatible with the request,
+in the request's city (or state when no city is given), whose
+``next_eligible_date`` (see ``donors.eligibility``) has been reached. The
+requester's own donor profile is left out.
+
+Donors are read group by group in keyset chunks of ``CHUNK_SIZE`` on
+``(LOWER(city), blood_group, next_eligible_date, id)`` (or the state
+equivalent). Each chunk is a bounded range read on the eligibility index
+and only ``CHUNK_SIZE`` rows are held at a time, so 100k matching donors
+cost about 100 small queries and flat memory.
+
+Each chunk goes to the configured sender as one batch. The sender is
+pluggable through ``DONOR_FANOUT_SENDER`` (a dotted path to a
+``BaseSender`` subclass). ``ConsoleSender`` logs the batch and
+``FileSender`` appends JSON lines to ``DONOR_FANOUT_FILE``. Point the
+setting at a queue- or SMS-backed sender in production.
+
+Creating a request only schedules its fan-out (``schedule_fan_out``): once
+the transaction commits it runs on a background thread, so the create
+returns straight away. A request is claimed by setting
+``BloodRequest.donors_notified_at`` before any donor is contacted, so only
+one worker sends it at a time, and ``fanout_completed_at`` is set once
+every batch has gone out. A sender error releases the claim. A claim left
+unfinished for ``DONOR_FANOUT_CLAIM_TIMEOUT`` seconds, say because the
+process stopped mid-send, may be taken again. ``manage.py
+fan_out_emergencies`` sends unclaimed requests and retries expired claims;
+run it every minute from cron or a scheduler. A retried request goes to
+all its donors again, so a donor may hear about it twice, but none are
+missed.
+"""
+import json
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from inventory.compatibility import compatible_donor_groups
+from requests.models import BloodRequest
+from .models import Donor
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SENDER = 'donors.fanout.ConsoleSender'
+DEFAULT_CLAIM_TIMEOUT = 600
+CHUNK_SIZE = 1000
+# Requests still worth fanning out
+OPEN_STATUSES = ('pending', 'approved')
+# Columns handed to senders for each donor
+RECIPIENT_FIELDS = ('id', 'user_id', 'full_name', 'blood_group', 'phone', 'email')
+
+
+class BaseSender:
+    """Delivers (or enqueues) one batch of donor notifications."""
+
+    def send_batch(self, blood_request, donors):
+        """``donors`` is a list of dicts with ``RECIPIENT_FIELDS``."""
+        raise NotImplementedError
+
+    def message(self, blood_request):
+        where = blood_request.hospital_name
+        if blood_request.city:
+            where = f'{where}, {blood_request.city}'
+        return (
+            f'Emergency: {blood_request.units_required} unit(s) of {blood_request.blood_group} blood needed '
+            f'at {where} by {blood_request.required_date}. Contact {blood_request.contact_number}.'
+        )
+
+
+class ConsoleSender(BaseSender):
+    """Logs each batch; the development stand-in."""
+
+    def send_batch(self, blood_request, donors):
+        logger.info('Request %s: notifying %d donors: %s', blood_request.id, len(donors), self.message(blood_request))
+
+
+class FileSender(BaseSender):
+    """Appends one JSON line per donor to ``DONOR_FANOUT_FILE``."""
+
+    def __init__(self, path=None):
+        self.path = path or getattr(settings, 'DONOR_FANOUT_FILE', 'donor_fanout.jsonl')
+
+    def send_batch(self, blood_request, donors):
+        message = self.message(blood_request)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for donor in donors:
+                f.write(json.dumps({'request': blood_request.id, 'message': message, **donor}) + '\n')
+
+
+def get_sender():
+    return import_string(getattr(settings, 'DONOR_FANOUT_SENDER', DEFAULT_SENDER))()
+
+
+def _scope(blood_request):
+    """``(alias, value)`` for the area to notify, or ``None`` without a location."""
+    if (blood_request.city or '').strip():
+        return 'city_key', blood_request.city.strip().lower()
+    if (blood_request.state or '').strip():
+        return 'state_key', blood_request.state.strip().lower()
+    return None
+
+
+def eligible_donors(blood_request, on_date=None):
+    """Queryset of donors to notify for ``blood_request`` (all compatible groups, unordered)."""
+    scope = _scope(blood_request)
+    if scope is None:
+        return Donor.objects.none()
+    alias, value = scope
+    qs = (
+        Donor.objects.alias(city_key=Lower('city'), state_key=Lower('state'))
+        .filter(**{alias: value}, next_eligible_date__lte=on_date or timezone.localdate(),
+                blood_group__in=compatible_donor_groups(blood_request.blood_group))
+        .exclude(user_id=blood_request.requester_id)
+    )
+    if alias == 'city_key' and (blood_request.state or '').strip():
+        # Same-named cities in different states
+        qs = qs.filter(state_key=blood_request.state.strip().lower())
+    return qs
+
+
+def iter_donor_chunks(blood_request, chunk_size=CHUNK_SIZE, on_date=None):
+    """Yield lists of donor dicts, one keyset range read per chunk."""
+    base = eligible_donors(blood_request, on_date)
+    for group in compatible_donor_groups(blood_request.blood_group):
+        after = Q()
+        while True:
+            chunk = list(
+                base.filter(after, blood_group=group)
+                .order_by('next_eligible_date', 'id')
+                .values(*RECIPIENT_FIELDS, 'next_eligible_date')[:chunk_size]
+            )
+            if not chunk:
+                break
+            yield [{field: donor[field] for field in RECIPIENT_FIELDS} for donor in chunk]
+            if len(chunk) < chunk_size:
+                break
+            last = chunk[-1]
+            after = (Q(next_eligible_date__gt=last['next_eligible_date'])
+                     | Q(next_eligible_date=last['next_eligible_date'], id__gt=last['id']))
+
+
+def fan_out(blood_request, sender=None, chunk_size=CHUNK_SIZE):
+    """Notify eligible compatible donors near ``blood_request`` in batches; returns the number notified."""
+    sender = sender or get_sender()
+    notified = 0
+    for chunk in iter_donor_chunks(blood_request, chunk_size):
+        sender.send_batch(blood_request, chunk)
+        notified += len(chunk)
+    logger.info('Request %s: fan-out reached %d donors', blood_request.id, notified)
+    return notified
+
+
+def _claimable():
+    """Open emergencies not yet fanned out, and not claimed by a worker that may still be sending."""
+    expired = timezone.now() - timedelta(seconds=getattr(settings, 'DONOR_FANOUT_CLAIM_TIMEOUT', DEFAULT_CLAIM_TIMEOUT))
+    return BloodRequest.objects.filter(
+        Q(donors_notified_at__isnull=True) | Q(donors_notified_at__lt=expired),
+        urgency='emergency', status__in=OPEN_STATUSES, fanout_completed_at__isnull=True,
+    )
+
+
+def fan_out_request(request_id, sender=None):
+    """Claim and fan out one emergency request; returns the number notified, or ``None`` if already claimed.
+
+    If sending fails the claim is released and the error re-raised, so the
+    next ``fan_out_pending`` run retries the request.
+    """
+    claimed_at = timezone.now()
+    if not _claimable().filter(pk=request_id).update(donors_notified_at=claimed_at):
+        return None
+    claim = BloodRequest.objects.filter(pk=request_id, donors_notified_at=claimed_at, fanout_completed_at__isnull=True)
+    try:
+        notified = fan_out(BloodRequest.objects.get(pk=request_id), sender)
+    except BaseException:
+        claim.update(donors_notified_at=None)
+        raise
+    claim.update(fanout_completed_at=timezone.now())
+    return notified
+
+
+def _fan_out_in_background(request_id):
+    try:
+        fan_out_request(request_id)
+    except Exception:
+        # A notification outage must not take the worker down
+        logger.exception('Donor fan-out failed for request %s', request_id)
+    finally:
+        connection.close()
+
+
+def schedule_fan_out(blood_request):
+    """Fan ``blood_request`` out once the current transaction commits, off the request thread."""
+    request_id = blood_request.id
+
+    def start():
+        if getattr(settings, 'DONOR_FANOUT_BACKGROUND', True):
+            threading.Thread(target=_fan_out_in_background, args=(request_id,), daemon=True).start()
+        else:
+            fan_out_request(request_id)
+
+    transaction.on_commit(start)
+
+
+def fan_out_pending(limit=None, sender=None):
+    """Fan out unclaimed or expired-claim emergencies, oldest first; returns ``(requests, donors)`` handled.
+
+    A request whose sender fails is logged and left for the next run.
+    """
+    pending = _claimable().order_by('created_at').values_list('id', flat=True)
+    handled = donors = 0
+    sender = sender or get_sender()
+    for request_id in list(pending[:limit] if limit else pending):
+        try:
+            notified = fan_out_request(request_id, sender)
+        except Exception:
+            logger.exception('Donor fan-out failed for request %s', request_id)
+            continue
+        if notified is not None:
+            handled += 1
+            donors += notified
+    return handled, donors
@@ -0,0 +1,24 @@
+"""
+Send the donor fan-out for open emergency requests that have not finished it.
+
+Requests are normally fanned out right after they are created; this picks
+up any the background thread missed, whose sender failed, or whose claim
+expired unfinished (see ``donors.fanout``). Meant to run every minute from
+cron or a scheduler:
+
+    python manage.py fan_out_emergencies [--limit N]
+"""
+from django.core.management.base import BaseCommand
+
+from donors.fanout import fan_out_pending
+
+
+class Command(BaseCommand):
+    help = 'Fan out unfinished emergency blood requests to eligible donors'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None, help='Requests per run')
+
+    def handle(self, *args, **options):
+        handled, donors = fan_out_pending(limit=options['limit'])
+        self.stdout.write(self.style.SUCCESS(f'Fanned out {handled} request(s) to {donors} donor(s).'))
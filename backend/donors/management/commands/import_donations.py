@@ -0,0 +1,53 @@
+"""
+Import a camp's donations from a CSV or JSON file into one blood bank.
+
+The CSV needs a header row; JSON is a list of row objects (or {"rows": [...]}).
+Columns match a single donation: donor / user_id / email, blood_group,
+donation_date, units_donated, hemoglobin_level, blood_pressure, notes,
+verified_by and optionally tx_id.
+
+    python manage.py import_donations --bloodbank 3 camp.csv
+"""
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bloodbank.models import BloodBank
+from donors.importing import ImportTooLarge, import_donations, parse_csv
+
+
+class Command(BaseCommand):
+    help = 'Bulk import donations for a blood bank from CSV or JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--bloodbank', type=int, required=True, help='Blood bank id')
+
+    def handle(self, *args, **options):
+        try:
+            bloodbank = BloodBank.objects.select_related('user').get(pk=options['bloodbank'])
+        except BloodBank.DoesNotExist:
+            raise CommandError(f'Blood bank {options["bloodbank"]} does not exist')
+
+        path = options['path']
+        with open(path, 'rb') as f:
+            if path.lower().endswith('.json'):
+                rows = json.load(f)
+                if isinstance(rows, dict):
+                    rows = rows.get('rows', [])
+            else:
+                rows = parse_csv(f)
+
+        started = time.perf_counter()
+        try:
+            result = import_donations(bloodbank, rows, created_by=bloodbank.user)
+        except ImportTooLarge as e:
+            raise CommandError(str(e))
+        elapsed = time.perf_counter() - started
+
+        for error in result['errors']:
+            self.stderr.write(f'Row {error["row"]}: {json.dumps(error["errors"])}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {result["created"]} donation(s), skipped {len(result["errors"])} row(s) in {elapsed:.2f}s.'
+        ))
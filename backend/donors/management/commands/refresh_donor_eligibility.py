@@ -0,0 +1,32 @@
+"""
+Recompute the next eligible date of donors who aged out since the last run.
+
+Meant to run nightly from cron or a scheduler; --all recomputes every donor
+(e.g. after changing the deferral rules):
+
+    python manage.py refresh_donor_eligibility [--days N] [--all]
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from donors.eligibility import recompute_eligibility, refresh_eligibility
+from donors.models import Donor
+
+
+class Command(BaseCommand):
+    help = 'Refresh Donor.next_eligible_date from the deferral rules'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=1, help='Days since the previous run')
+        parser.add_argument('--all', action='store_true', help='Recompute every donor')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options['all']:
+            changed = recompute_eligibility(Donor.objects.all(), batch_size=options['batch_size'])
+        else:
+            changed = refresh_eligibility(days=options['days'], batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Updated {changed} donor(s) in {elapsed:.2f}s.'))
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.7 on 2026-10-17 12:04
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donors', '0005_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='donor',
+            index=models.Index(django.db.models.functions.text.Lower('city'), models.F('blood_group'), models.F('id'), condition=models.Q(('is_eligible', True)), name='donor_city_group_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='donor',
+            index=models.Index(django.db.models.functions.text.Lower('state'), models.F('blood_group'), models.F('id'), condition=models.Q(('is_eligible', True)), name='donor_state_group_idx'),
+        ),
+    ]
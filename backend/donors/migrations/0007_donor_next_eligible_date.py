@@ -0,0 +1,63 @@
+# Generated by Django 4.2.7 on 2026-10-17 12:09
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+def backfill_next_eligible_date(apps, schema_editor):
+    from donors.eligibility import next_eligible_date
+
+    Donor = apps.get_model('donors', 'Donor')
+    Donation = apps.get_model('donors', 'Donation')
+
+    def latest(field):
+        return models.Subquery(
+            Donation.objects.filter(donor=models.OuterRef('pk')).order_by('-donation_date', '-id').values(field)[:1]
+        )
+
+    donors = Donor.objects.annotate(latest_date=latest('donation_date'), latest_hemoglobin=latest('hemoglobin_level'))
+    updates = []
+    for donor in donors.iterator(chunk_size=2000):
+        last, hemoglobin = donor.last_donation_date, None
+        if donor.latest_date and (last is None or donor.latest_date >= last):
+            last, hemoglobin = donor.latest_date, donor.latest_hemoglobin
+        donor.next_eligible_date = next_eligible_date(
+            donor.date_of_birth, donor.gender, donor.weight, last, hemoglobin, donor.is_eligible,
+        )
+        updates.append(donor)
+        if len(updates) == 2000:
+            Donor.objects.bulk_update(updates, ['next_eligible_date'])
+            updates = []
+    Donor.objects.bulk_update(updates, ['next_eligible_date'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donors', '0006_donor_fanout_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='donor',
+            name='donor_city_group_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='donor',
+            name='donor_state_group_idx',
+        ),
+        migrations.AddField(
+            model_name='donor',
+            name='next_eligible_date',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_next_eligible_date, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='donor',
+            index=models.Index(django.db.models.functions.text.Lower('city'), models.F('blood_group'), models.F('next_eligible_date'), models.F('id'), condition=models.Q(('next_eligible_date__isnull', False)), name='donor_city_eligible_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='donor',
+            index=models.Index(django.db.models.functions.text.Lower('state'), models.F('blood_group'), models.F('next_eligible_date'), models.F('id'), condition=models.Q(('next_eligible_date__isnull', False)), name='donor_state_eligible_idx'),
+        ),
+    ]
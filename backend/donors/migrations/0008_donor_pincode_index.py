@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 12:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donors', '0007_donor_next_eligible_date'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='donor',
+            name='pincode',
+            field=models.CharField(db_index=True, max_length=10),
+        ),
+    ]
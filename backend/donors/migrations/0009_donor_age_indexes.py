@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-17 12:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donors', '0008_donor_pincode_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='donor',
+            index=models.Index(fields=['date_of_birth'], name='donor_dob_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='donor',
+            index=models.Index(fields=['blood_group', 'date_of_birth'], name='donor_group_dob_idx'),
+        ),
+    ]
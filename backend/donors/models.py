@@ -2,6 +2,7 @@ from django.db import models
 
 # Create your models here.
 from django.db import models
+from django.db.models.functions import Lower
 from accounts.models import User
 from bloodbank.models import BloodBank
 
@@ -33,10 +34,12 @@ class Donor(models.Model):
     address = models.TextField()
     city = models.CharField(max_length=100)
     state = models.CharField(max_length=100)
-    pincode = models.CharField(max_length=10)
+    pincode = models.CharField(max_length=10, db_index=True)  # located via geo.PincodeCentroid
     weight = models.DecimalField(max_digits=5, decimal_places=2)  # in kg
     last_donation_date = models.DateField(null=True, blank=True)
     is_eligible = models.BooleanField(default=True)
+    # Computed from the deferral rules (see donors.eligibility); NULL when not eligible at all
+    next_eligible_date = models.DateField(null=True, blank=True, editable=False)
     medical_conditions = models.TextField(blank=True)
     emergency_contact = models.CharField(max_length=15)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -45,6 +48,25 @@ class Donor(models.Model):
     def __str__(self):
         return f"{self.full_name} - {self.blood_group}"
 
+    def save(self, *args, **kwargs):
+        from .eligibility import eligibility_for
+        self.next_eligible_date = eligibility_for(self)
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'next_eligible_date'}
+        super().save(*args, **kwargs)
+
+    class Meta:
+        indexes = [
+            # Eligible donors of a group in an area on a date (donors.eligibility, emergency fan-out)
+            models.Index(Lower('city'), 'blood_group', 'next_eligible_date', 'id', name='donor_city_eligible_idx',
+                         condition=models.Q(next_eligible_date__isnull=False)),
+            models.Index(Lower('state'), 'blood_group', 'next_eligible_date', 'id', name='donor_state_eligible_idx',
+                         condition=models.Q(next_eligible_date__isnull=False)),
+            # Age filters become date_of_birth ranges (donors.demographics)
+            models.Index(fields=['date_of_birth'], name='donor_dob_idx'),
+            models.Index(fields=['blood_group', 'date_of_birth'], name='donor_group_dob_idx'),
+        ]
+
     @property
     def age(self):
         from datetime import date
@@ -69,6 +91,10 @@ class Donation(models.Model):
 
     class Meta:
         ordering = ['-donation_date']
+        indexes = [
+            # Keyset pagination on the default ordering
+            models.Index(fields=['donation_date', 'id'], name='donation_date_idx'),
+        ]
 
 
 class Appointment(models.Model):
@@ -0,0 +1,48 @@
+"""
+Donor profiles created on the fly for users who never filled one in.
+
+When a bank records a donation by user id or email (``DonationViewSet.create``
+and the bulk import in ``donors.importing``) and the user has no ``Donor``,
+one is made from their account and ``UserProfile`` with placeholder values
+for the rest. Both paths use ``default_donor`` so the profiles match.
+"""
+from datetime import date
+
+from .models import Donor
+
+
+DEFAULT_BLOOD_GROUP = 'O+'
+DEFAULT_DATE_OF_BIRTH = date(2000, 1, 1)
+DEFAULT_WEIGHT = 70.0
+NOT_PROVIDED = 'Not provided'
+
+
+def normalize_phone(phone):
+    """Ten digits: the number's digits padded or cut to length, or all zeros."""
+    digits = ''.join(filter(str.isdigit, str(phone or '')))
+    if len(digits) == 10:
+        return digits
+    return digits.ljust(10, '0')[:10] if digits else '0000000000'
+
+
+def default_donor(user, blood_group=None):
+    """Unsaved minimal donor profile for ``user``."""
+    profile = getattr(user, 'profile', None)
+    phone = normalize_phone(user.phone)
+    email = user.email if user.email and '@' in user.email else f'user{user.id}@example.com'
+    return Donor(
+        user=user,
+        full_name=user.get_full_name() or user.username or f'User {user.id}',
+        blood_group=blood_group or DEFAULT_BLOOD_GROUP,
+        date_of_birth=profile.date_of_birth if profile and profile.date_of_birth else DEFAULT_DATE_OF_BIRTH,
+        gender='M',
+        phone=phone,
+        email=email,
+        address=profile.address if profile and profile.address else NOT_PROVIDED,
+        city=profile.city if profile and profile.city else NOT_PROVIDED,
+        state=profile.state if profile and profile.state else NOT_PROVIDED,
+        pincode=profile.pincode if profile and profile.pincode else '000000',
+        weight=DEFAULT_WEIGHT,
+        emergency_contact=phone,
+        medical_conditions='',
+    )
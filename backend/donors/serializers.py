@@ -97,6 +97,30 @@ class DonationSerializer(serializers.ModelSerializer):
         return data
 
 
+class DonationImportRowSerializer(serializers.Serializer):
+    """One row of a bulk donation import; validates without touching the database."""
+    donor = serializers.IntegerField(required=False, allow_null=True)
+    user_id = serializers.IntegerField(required=False, allow_null=True)
+    email = serializers.EmailField(required=False, allow_blank=True, allow_null=True)
+    blood_group = serializers.ChoiceField(choices=Donor.BLOOD_GROUPS, required=False, allow_blank=True,
+                                          allow_null=True, help_text="Blood group for auto-created donor profile")
+    donation_date = serializers.DateField()
+    units_donated = serializers.IntegerField(min_value=1, default=1)
+    hemoglobin_level = serializers.DecimalField(max_digits=4, decimal_places=2, required=False, allow_null=True)
+    blood_pressure = serializers.CharField(max_length=20, required=False, allow_blank=True, allow_null=True)
+    notes = serializers.CharField(required=False, allow_blank=True, default='')
+    verified_by = serializers.CharField(max_length=200)
+    tx_id = serializers.CharField(max_length=6, required=False, allow_blank=True, allow_null=True)
+
+    def validate_email(self, value):
+        return value.strip().lower() if value else None
+
+    def validate(self, data):
+        if not data.get('donor') and not data.get('user_id') and not data.get('email'):
+            raise serializers.ValidationError({'email': ['Either donor, user_id, or email must be provided']})
+        return data
+
+
 class AppointmentSerializer(serializers.ModelSerializer):
     bloodbank_name = serializers.CharField(source='bloodbank.name', read_only=True)
     bloodbank_city = serializers.CharField(source='bloodbank.city', read_only=True)
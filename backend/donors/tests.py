@@ -1,3 +1,468 @@
-from django.test import TestCase
+from datetime import date, timedelta
+from itertools import count
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts.models import User, UserProfile
+from audit.log import timeline
+from audit.models import StatusChange
+from bloodbank.models import BloodBank
+from inventory.models import BloodUnit, Inventory, InventoryMovement
+from requests.models import BloodRequest
+from .demographics import age_range
+from .eligibility import MAX_AGE, add_years, refresh_eligibility
+from .fanout import BaseSender, fan_out, fan_out_pending, fan_out_request, iter_donor_chunks
+from .importing import ImportTooLarge, import_donations
+from .models import Appointment, Donation, Donor
+from .profiles import default_donor
+
+
+_phones = count(7000000000)
+
+
+class RecordingSender(BaseSender):
+    batches = []
+
+    def send_batch(self, blood_request, donors):
+        RecordingSender.batches.append((blood_request.id, [donor['full_name'] for donor in donors]))
+
+
+class FailingSender(BaseSender):
+    def send_batch(self, blood_request, donors):
+        raise ConnectionError('SMS gateway unavailable')
+
+
+def make_user(username, user_type='donor'):
+    return User.objects.create(username=username, email=f'{username}@example.com', phone=str(next(_phones)),
+                               user_type=user_type)
+
+
+def make_bank(n):
+    user = User.objects.create(username=f'bank{n}', email=f'bank{n}@example.com', phone=f'90000000{n:02d}',
+                               user_type='bloodbank')
+    BloodBank.objects.create(user=user, name=f'Bank {n}', registration_number=f'REG{n}')
+    return User.objects.select_related('bloodbank').get(pk=user.pk)
+
+
+def auth(user):
+    return {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(user).access_token}'}
+
+
+def make_donor(name, blood_group='O-', city='Pune', state='Maharashtra', user=None, **kwargs):
+    user = user or make_user(name.replace(' ', '-'))
+    fields = dict(
+        user=user, full_name=name, blood_group=blood_group, date_of_birth=date(1990, 1, 1), gender='M',
+        phone='0', email=user.email, address='-', city=city, state=state, pincode='411001', weight=70,
+        emergency_contact='0',
+    )
+    fields.update(kwargs)
+    return Donor.objects.create(**fields)
+
+
+def make_request(requester, **kwargs):
+    fields = dict(
+        requester=requester, patient_name='Patient', blood_group='A+', units_required=2, urgency='emergency',
+        required_date=timezone.localdate(), hospital_name='City Hospital', doctor_name='Dr. Rao',
+        contact_number='9999999999', reason='Surgery', city='Pune', state='Maharashtra',
+    )
+    fields.update(kwargs)
+    return BloodRequest.objects.create(**fields)
+
+
+def notified(blood_request):
+    return sorted(donor['full_name'] for chunk in iter_donor_chunks(blood_request) for donor in chunk)
+
+
+class FanOutSelectionTests(TestCase):
+    def setUp(self):
+        self.requester = make_user('requester')
+
+    def test_compatible_groups_only(self):
+        for group in ('O-', 'O+', 'A-', 'A+', 'B+', 'AB+'):
+            make_donor(f'donor {group}', blood_group=group)
+        self.assertEqual(notified(make_request(self.requester, blood_group='A+')),
+                         ['donor A+', 'donor A-', 'donor O+', 'donor O-'])
+        self.assertEqual(notified(make_request(self.requester, blood_group='O-')), ['donor O-'])
+        self.assertEqual(len(notified(make_request(self.requester, blood_group='AB+'))), 6)
+
+    def test_same_city_in_the_same_state(self):
+        make_donor('pune', city='Pune')
+        make_donor('pune shouting', city='PUNE')
+        make_donor('pune in another state', city='Pune', state='Karnataka')
+        make_donor('mumbai', city='Mumbai')
+        self.assertEqual(notified(make_request(self.requester, city=' pune ')), ['pune', 'pune shouting'])
+        # Without a state the city alone decides
+        self.assertEqual(notified(make_request(self.requester, city='Pune', state='')),
+                         ['pune', 'pune in another state', 'pune shouting'])
+
+    def test_whole_state_without_a_city(self):
+        make_donor('pune', city='Pune')
+        make_donor('mumbai', city='Mumbai')
+        make_donor('bengaluru', city='Bengaluru', state='Karnataka')
+        self.assertEqual(notified(make_request(self.requester, city='', state='maharashtra')), ['mumbai', 'pune'])
+        self.assertEqual(notified(make_request(self.requester, city='', state='')), [])
+
+    def test_only_eligible_donors_other_than_the_requester(self):
+        make_donor('eligible')
+        make_donor('recent donation', last_donation_date=timezone.localdate() - timedelta(days=10))
+        make_donor('ineligible', is_eligible=False)
+        make_donor('requester', user=self.requester)
+        self.assertEqual(notified(make_request(self.requester)), ['eligible'])
+
+    def test_chunks(self):
+        for i in range(5):
+            make_donor(f'donor {i}')
+        blood_request = make_request(self.requester, blood_group='O-')
+        self.assertEqual([len(chunk) for chunk in iter_donor_chunks(blood_request, chunk_size=2)], [2, 2, 1])
+        self.assertEqual(fan_out(blood_request, RecordingSender(), chunk_size=2), 5)
+
+
+@override_settings(DONOR_FANOUT_SENDER='donors.tests.RecordingSender', DONOR_FANOUT_BACKGROUND=False)
+class FanOutQueueTests(TestCase):
+    def setUp(self):
+        RecordingSender.batches = []
+        self.requester = make_user('requester')
+        make_donor('donor')
+
+    def create(self, urgency='emergency'):
+        response = self.client.post('/api/requests/requests/', {
+            'patient_name': 'Patient', 'blood_group': 'O+', 'units_required': 2, 'urgency': urgency,
+            'required_date': timezone.localdate().isoformat(), 'hospital_name': 'City Hospital',
+            'doctor_name': 'Dr. Rao', 'contact_number': '9999999999', 'reason': 'Surgery',
+            'city': 'Pune', 'state': 'Maharashtra',
+        }, **auth(self.requester))
+        self.assertEqual(response.status_code, 201, response.content)
+        return BloodRequest.objects.get(pk=response.data['id'])
+
+    def test_create_defers_the_fan_out_until_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            blood_request = self.create()
+        self.assertEqual(RecordingSender.batches, [])
+        self.assertIsNone(blood_request.donors_notified_at)
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(RecordingSender.batches, [(blood_request.id, ['donor'])])
+        blood_request.refresh_from_db()
+        self.assertIsNotNone(blood_request.donors_notified_at)
+        # Claimed: the sweep leaves it alone
+        self.assertEqual(fan_out_pending(), (0, 0))
+
+    def test_sweep_sends_unclaimed_open_emergencies_once(self):
+        missed = make_request(self.requester, blood_group='O+')
+        make_request(self.requester, blood_group='O+', status='cancelled')
+        make_request(self.requester, blood_group='O+', urgency='urgent')
+
+        self.assertEqual(fan_out_pending(), (1, 1))
+        self.assertEqual(RecordingSender.batches, [(missed.id, ['donor'])])
+        self.assertEqual(fan_out_pending(), (0, 0))
+
+    def test_a_failed_send_releases_the_claim(self):
+        blood_request = make_request(self.requester, blood_group='O+')
+        with self.assertRaises(ConnectionError):
+            fan_out_request(blood_request.id, FailingSender())
+        blood_request.refresh_from_db()
+        self.assertIsNone(blood_request.donors_notified_at)
+        self.assertIsNone(blood_request.fanout_completed_at)
+
+        # The sweep logs the failure and keeps the request for the next run
+        with self.assertLogs('donors.fanout', 'ERROR'):
+            self.assertEqual(fan_out_pending(sender=FailingSender()), (0, 0))
+        self.assertEqual(fan_out_pending(), (1, 1))
+        self.assertEqual(RecordingSender.batches, [(blood_request.id, ['donor'])])
+        blood_request.refresh_from_db()
+        self.assertIsNotNone(blood_request.fanout_completed_at)
+        self.assertEqual(fan_out_pending(), (0, 0))
+
+    @override_settings(DONOR_FANOUT_CLAIM_TIMEOUT=600)
+    def test_unfinished_claims_are_retried_after_the_timeout(self):
+        # Claimed by workers that died mid-send
+        recent = make_request(self.requester, blood_group='O+', donors_notified_at=timezone.now())
+        expired = make_request(self.requester, blood_group='O+',
+                               donors_notified_at=timezone.now() - timedelta(seconds=601))
+        self.assertIsNone(fan_out_request(recent.id))
+        self.assertEqual(fan_out_pending(), (1, 1))
+        self.assertEqual(RecordingSender.batches, [(expired.id, ['donor'])])
+
+    def test_other_urgencies_are_not_fanned_out(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create(urgency='urgent')
+        self.assertEqual(RecordingSender.batches, [])
+
+
+class DonationImportTests(TestCase):
+    def setUp(self):
+        self.bank_user = make_bank(1)
+        self.bank = self.bank_user.bloodbank
+        self.day = timezone.localdate() - timedelta(days=3)
+
+    def row(self, **kwargs):
+        return {'donation_date': self.day.isoformat(), 'units_donated': 1, 'verified_by': 'Dr. Rao', **kwargs}
+
+    def test_invalid_rows_are_reported_and_the_rest_imported(self):
+        donor = make_donor('donor', blood_group='A+')
+        Donation.objects.create(donor=donor, bloodbank=self.bank, donation_date=self.day, verified_by='x',
+                                tx_id='111111')
+        rows = [
+            self.row(donor=donor.id, tx_id='222222'),
+            self.row(),
+            self.row(donor=donor.id, donation_date='not a date'),
+            self.row(donor=999999),
+            self.row(user_id=999999),
+            self.row(email='nobody@example.com'),
+            self.row(donor=donor.id, tx_id='222222'),
+            self.row(donor=donor.id, tx_id='111111'),
+            self.row(email=' DONOR@example.com ', units_donated=2),
+        ]
+        result = import_donations(self.bank, rows, created_by=self.bank_user)
+
+        self.assertEqual(result['created'], 2)
+        self.assertEqual([error['row'] for error in result['errors']], [2, 3, 4, 5, 6, 7, 8])
+        errors = {error['row']: error['errors'] for error in result['errors']}
+        self.assertIn('email', errors[2])
+        self.assertIn('donation_date', errors[3])
+        self.assertIn('donor', errors[4])
+        self.assertIn('user_id', errors[5])
+        self.assertIn('email', errors[6])
+        self.assertEqual(errors[7], {'tx_id': ['Duplicate of row 1.']})
+        self.assertEqual(errors[8], {'tx_id': ['Donation 111111 was already recorded.']})
+        self.assertEqual(Inventory.objects.get(bloodbank=self.bank, blood_group='A+').units_available, 3)
+        donor.refresh_from_db()
+        self.assertEqual(donor.last_donation_date, self.day)
+
+    def test_too_many_rows(self):
+        with self.assertRaises(ImportTooLarge):
+            import_donations(self.bank, [self.row()] * 5001)
+
+    def test_query_count_does_not_grow_with_the_sheet(self):
+        def sheet(prefix, size):
+            rows = []
+            for i in range(size):
+                user = make_user(f'{prefix}{i}')
+                if i % 2:
+                    rows.append(self.row(donor=make_donor(f'{prefix} donor {i}', user=user).id))
+                else:
+                    rows.append(self.row(user_id=user.id, blood_group='B+'))
+            return rows
+
+        small, large = sheet('small', 4), sheet('large', 40)
+        with CaptureQueriesContext(connection) as small_queries:
+            import_donations(self.bank, small, batch_size=1000)
+        with CaptureQueriesContext(connection) as large_queries:
+            result = import_donations(self.bank, large, batch_size=1000)
+
+        self.assertEqual(result['created'], 40)
+        self.assertEqual(len(large_queries), len(small_queries))
+        self.assertEqual(Donor.objects.filter(user__username__startswith='large').count(), 40)
+        self.assertEqual(InventoryMovement.objects.filter(bloodbank=self.bank).count(), 44)
+        self.assertEqual(BloodUnit.objects.filter(bloodbank=self.bank).count(), 44)
+        self.assertEqual(sum(Inventory.objects.filter(bloodbank=self.bank).values_list('units_available', flat=True)),
+                         44)
+
+    def test_small_batches(self):
+        rows = [self.row(user_id=make_user(f'user{i}').id) for i in range(5)]
+        result = import_donations(self.bank, rows, batch_size=2)
+        self.assertEqual(result['created'], 5)
+        self.assertEqual(len(set(Donation.objects.values_list('tx_id', flat=True))), 5)
+
+    def test_csv_upload(self):
+        user = make_user('camp')
+        upload = SimpleUploadedFile('camp.csv', (
+            'user_id,donation_date,units_donated,verified_by,blood_group\n'
+            f'{user.id},{self.day.isoformat()},1,Dr. Rao,AB-\n'
+            f',{self.day.isoformat()},1,Dr. Rao,\n'
+        ).encode())
+        response = self.client.post('/api/donors/donations/import/', {'file': upload}, **auth(self.bank_user))
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual([error['row'] for error in response.data['errors']], [2])
+        self.assertEqual(Donor.objects.get(user=user).blood_group, 'AB-')
+
+        donor_user = make_user('not-a-bank')
+        response = self.client.post('/api/donors/donations/import/', {'rows': [self.row(user_id=user.id)]},
+                                    content_type='application/json', **auth(donor_user))
+        self.assertEqual(response.status_code, 403)
+
+
+class DefaultDonorTests(TestCase):
+    def setUp(self):
+        self.bank_user = make_bank(1)
+        self.user = User.objects.create(username='walkin', email='walkin@example.com', phone='98765-43210',
+                                        user_type='donor', first_name='Walk', last_name='In')
+        UserProfile.objects.update_or_create(user=self.user, defaults={'city': 'Pune', 'pincode': '411001'})
+
+    def test_single_and_bulk_donations_create_the_same_profile(self):
+        expected = default_donor(User.objects.get(pk=self.user.pk), 'B-')
+        self.assertEqual((expected.full_name, expected.phone, expected.city, expected.state, expected.pincode),
+                         ('Walk In', '9876543210', 'Pune', 'Not provided', '411001'))
+
+        response = self.client.post('/api/donors/donations/', {
+            'user_id': self.user.id, 'blood_group': 'B-', 'donation_date': timezone.localdate().isoformat(),
+            'units_donated': 1, 'verified_by': 'Dr. Rao',
+        }, **auth(self.bank_user))
+        self.assertEqual(response.status_code, 201, response.content)
+        single = Donor.objects.get(user=self.user)
+        single.delete()
+
+        import_donations(self.bank_user.bloodbank, [{
+            'user_id': self.user.id, 'blood_group': 'B-', 'donation_date': timezone.localdate().isoformat(),
+            'verified_by': 'Dr. Rao',
+        }])
+        bulk = Donor.objects.get(user=self.user)
+
+        fields = ('full_name', 'blood_group', 'date_of_birth', 'gender', 'phone', 'email', 'address', 'city',
+                  'state', 'pincode', 'weight', 'emergency_contact', 'medical_conditions')
+        self.assertEqual([getattr(single, field) for field in fields], [getattr(bulk, field) for field in fields])
+        self.assertEqual(bulk.blood_group, 'B-')
+
+
+class RefreshEligibilityTests(TestCase):
+    def test_only_donors_who_aged_out_are_rescanned(self):
+        today = timezone.localdate()
+        aged_out = make_donor('aged out', date_of_birth=add_years(today, -(MAX_AGE + 1)))
+        reached = make_donor('reached', last_donation_date=today - timedelta(days=89))
+        # A date reached today already reads as eligible. This one is stale on purpose (a rescan would
+        # move it to tomorrow), so an unchanged value shows it was not rescanned.
+        Donor.objects.filter(pk=reached.pk).update(next_eligible_date=today)
+        Donor.objects.filter(pk=aged_out.pk).update(next_eligible_date=today - timedelta(days=1))
+
+        self.assertEqual(refresh_eligibility(today), 1)
+        self.assertIsNone(Donor.objects.get(pk=aged_out.pk).next_eligible_date)
+        self.assertEqual(Donor.objects.get(pk=reached.pk).next_eligible_date, today)
+        # Outside the window: left alone until it is rerun with more days
+        old = make_donor('old', date_of_birth=add_years(today, -(MAX_AGE + 1)) - timedelta(days=3))
+        Donor.objects.filter(pk=old.pk).update(next_eligible_date=today - timedelta(days=10))
+        self.assertEqual(refresh_eligibility(today), 0)
+        self.assertEqual(refresh_eligibility(today, days=7), 1)
+
+    def test_leap_day_births_age_out_on_28_february(self):
+        births = [date(1960, 2, 27), date(1960, 2, 28), date(1960, 2, 29), date(1960, 3, 1)]
+        donors = [make_donor(f'born {born}', date_of_birth=born) for born in births]
+        Donor.objects.filter(pk__in=[donor.pk for donor in donors]).update(next_eligible_date=date(2020, 1, 1))
+
+        aged_out_on = {}
+        day = date(2026, 2, 20)
+        while day <= date(2026, 3, 10):
+            before = set(Donor.objects.filter(next_eligible_date__isnull=False).values_list('date_of_birth', flat=True))
+            refresh_eligibility(day)
+            after = set(Donor.objects.filter(next_eligible_date__isnull=False).values_list('date_of_birth', flat=True))
+            for born in before - after:
+                aged_out_on[born] = day
+            day += timedelta(days=1)
+
+        self.assertEqual(aged_out_on, {
+            date(1960, 2, 27): date(2026, 2, 27),
+            date(1960, 2, 28): date(2026, 2, 28),
+            date(1960, 2, 29): date(2026, 2, 28),
+            date(1960, 3, 1): date(2026, 3, 1),
+        })
+
+
+class AppointmentHistoryTests(TestCase):
+    def setUp(self):
+        self.bank_user = make_bank(1)
+        self.donor_user = make_user('donor')
+        self.appointment = Appointment.objects.create(user=self.donor_user, bloodbank=self.bank_user.bloodbank,
+                                                      appointment_date=timezone.localdate() + timedelta(days=3))
+
+    def patch(self, user, data):
+        return self.client.patch(f'/api/donors/appointments/{self.appointment.id}/', data,
+                                 content_type='application/json', **auth(user))
+
+    def history(self):
+        return [(row['from_state'], row['to_state']) for row in timeline(StatusChange.APPOINTMENT, self.appointment.id)]
+
+    def test_every_status_change_is_recorded(self):
+        self.assertEqual(self.patch(self.bank_user, {'status': 'approved'}).status_code, 200)
+        # Not the bank fast path: a donor's edit goes through the serializer
+        self.assertEqual(self.patch(self.donor_user, {'status': 'completed'}).status_code, 200)
+        self.assertEqual(self.patch(self.donor_user, {'notes': 'Running late'}).status_code, 200)
+        self.assertEqual(self.history(), [('pending', 'approved'), ('approved', 'completed')])
+
+    def test_unknown_status_is_rejected(self):
+        response = self.patch(self.bank_user, {'status': 'cancelled'})
+        self.assertEqual(response.status_code, 400)
+        self.appointment.refresh_from_db()
+        self.assertEqual(self.appointment.status, 'pending')
+        self.assertEqual(self.history(), [])
+
+
+class DonorAgeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_bank(1)
+        token = RefreshToken.for_user(self.user).access_token
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+        self.today = timezone.localdate()
+
+    def make_donor(self, n, date_of_birth, **kwargs):
+        user = User.objects.create(username=f'donor{n}', email=f'donor{n}@example.com', phone=f'80000000{n:02d}',
+                                   user_type='donor')
+        fields = dict(user=user, full_name=f'Donor {n}', blood_group='O+', date_of_birth=date_of_birth, gender='M',
+                      phone='8000000000', email=user.email, address='-', city='Pune', state='Maharashtra',
+                      pincode='411001', weight=70, emergency_contact='8000000000')
+        fields.update(kwargs)
+        return Donor.objects.create(**fields)
+
+    def test_age_filters_at_birthday_boundaries(self):
+        turns_18_today = self.make_donor(1, add_years(self.today, -18))
+        turns_18_tomorrow = self.make_donor(2, add_years(self.today, -18) + timedelta(days=1))
+        turns_66_today = self.make_donor(3, add_years(self.today, -66))
+        response = self.client.get('/api/donors/donors/', {'min_age': 18, 'max_age': 65}, **self.auth)
+        self.assertEqual([row['id'] for row in response.json()['results']], [turns_18_today.id])
+        response = self.client.get('/api/donors/donors/', {'max_age': 17}, **self.auth)
+        self.assertEqual([row['id'] for row in response.json()['results']], [turns_18_tomorrow.id])
+        self.assertEqual(turns_66_today.age, 66)
+
+    def test_demographics_cached_until_a_donor_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_donor(1, add_years(self.today, -30), gender='F')
+            self.make_donor(2, add_years(self.today, -31), gender='F')
+            donor = self.make_donor(3, add_years(self.today, -70))
+        url = '/api/donors/donors/demographics/'
+        rows = self.client.get(url, {'age_band': '25-34'}, **self.auth).json()['results']
+        self.assertEqual([(r['blood_group'], r['gender'], r['state'], r['donors']) for r in rows],
+                         [('O+', 'F', 'Maharashtra', 2)])
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url, **self.auth)
+        self.assertFalse(any('donors_donor' in q['sql'] for q in queries))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            donor.blood_group = 'B-'
+            donor.save()
+        rows = self.client.get(url, {'age_band': 'over 65'}, **self.auth).json()['results']
+        self.assertEqual([(r['blood_group'], r['donors']) for r in rows], [('B-', 1)])
+
+    def test_out_of_range_ages_are_clamped(self):
+        donor = self.make_donor(1, add_years(self.today, -40))
+        for params in ({'max_age': 5000}, {'min_age': -3}, {'min_age': 0, 'max_age': 150}):
+            response = self.client.get('/api/donors/donors/', params, **self.auth)
+            self.assertEqual(response.status_code, 200, params)
+            self.assertEqual([row['id'] for row in response.json()['results']], [donor.id], params)
+        response = self.client.get('/api/donors/donors/', {'min_age': 5000}, **self.auth)
+        self.assertEqual(response.json()['results'], [])
+
+    def test_non_numeric_ages_are_rejected(self):
+        for params in ({'min_age': 'abc'}, {'max_age': '18.5'}):
+            response = self.client.get('/api/donors/donors/', params, **self.auth)
+            self.assertEqual(response.status_code, 400, params)
+        self.assertEqual(age_range(-10, 10 ** 6, self.today), age_range(0, 150, self.today))
+
+    def test_demographics_filters_are_validated(self):
+        self.make_donor(1, add_years(self.today, -30), blood_group='A+')
+        self.make_donor(2, add_years(self.today, -30), blood_group='A-')
+        url = '/api/donors/donors/demographics/'
+        # An unencoded "+" arrives as a space
+        for value in ('A+', 'a '):
+            response = self.client.get(url, {'blood_group': value, 'age_band': '25-34'}, **self.auth)
+            self.assertEqual(response.status_code, 200, value)
+            self.assertEqual([(row['blood_group'], row['donors']) for row in response.json()['results']],
+                             [('A+', 1)], value)
+        for params in ({'blood_group': 'A'}, {'age_band': '25 to 34'}):
+            self.assertEqual(self.client.get(url, params, **self.auth).status_code, 400, params)
@@ -1,17 +1,33 @@
+import csv
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from .models import Donor, Donation, Appointment
+from .demographics import AGE_BANDS, InvalidAge, age_param, age_range, demographics
+from .eligibility import eligible_on
+from .importing import ImportTooLarge, import_donations, parse_csv
+from .profiles import DEFAULT_BLOOD_GROUP, default_donor
 from .serializers import DonorSerializer, DonationSerializer, AppointmentSerializer
+from audit.log import record_change
+from audit.models import StatusChange
+from geo import grid
+from geo.views import NearbyMixin
+from inventory.compatibility import normalize_blood_group
 
 
-class DonorViewSet(viewsets.ModelViewSet):
+class DonorViewSet(NearbyMixin, viewsets.ModelViewSet):
     queryset = Donor.objects.all().order_by('-created_at')
     serializer_class = DonorSerializer
     # Remove 'user' from filterset_fields since we handle it manually
     filterset_fields = ['blood_group', 'city', 'state', 'is_eligible']
     # Support search by exact numeric id and fuzzy text fields
     search_fields = ['=id', 'full_name', 'city', 'state', 'blood_group', 'email', 'phone']
+    search_index = 'donor'
     ordering_fields = ['created_at', 'full_name']
 
     def get_queryset(self):
@@ -25,8 +41,77 @@ class DonorViewSet(viewsets.ModelViewSet):
             except (ValueError, TypeError):
                 # Return empty queryset for invalid user id instead of 400
                 return qs.none()
+        # ?min_age= / ?max_age= (inclusive) filter on date_of_birth
+        params = self.request.query_params
+        try:
+            min_age = age_param(params, 'min_age')
+            max_age = age_param(params, 'max_age')
+        except InvalidAge as e:
+            raise ValidationError({'error': str(e)})
+        if min_age is not None or max_age is not None:
+            qs = qs.filter(age_range(min_age, max_age))
+        return qs
+
+    def nearby_queryset(self):
+        qs = super().nearby_queryset()
+        if self.request.query_params.get('eligible') == 'true':
+            qs = qs.filter(next_eligible_date__lte=timezone.localdate())
         return qs
 
+    def locate_within(self, queryset, latitude, longitude, radius_km):
+        # Donors have no coordinates; they are placed at their pincode's centroid
+        return grid.within_by_pincode(queryset, latitude, longitude, radius_km)
+
+    @action(detail=False, methods=['get'])
+    def demographics(self, request):
+        """Donor counts by blood group, age band, gender and state (cached rollup).
+        Query params: ?blood_group=, ?gender=, ?state=, ?age_band=
+        """
+        params = request.query_params
+        blood_group = None
+        if params.get('blood_group'):
+            blood_group = normalize_blood_group(params['blood_group'])
+            if not blood_group:
+                return Response({'error': 'Invalid blood_group'}, status=status.HTTP_400_BAD_REQUEST)
+        age_band = params.get('age_band')
+        bands = [label for label, _, _ in AGE_BANDS]
+        if age_band and age_band not in bands:
+            return Response({'error': f'age_band must be one of: {", ".join(bands)}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(demographics(
+            blood_group=blood_group,
+            gender=params.get('gender'),
+            state=params.get('state'),
+            age_band=age_band,
+        ))
+
+    @action(detail=False, methods=['get'])
+    def eligible(self, request):
+        """Donors of a blood group who may donate on a date, optionally in a city/state.
+        Query params: ?blood_group= (required), ?city=, ?state=, ?date=YYYY-MM-DD (default today)
+        """
+        blood_group = request.query_params.get('blood_group', '').strip()
+        if blood_group not in dict(Donor.BLOOD_GROUPS):
+            return Response({'error': 'blood_group is required'}, status=status.HTTP_400_BAD_REQUEST)
+        on_date = None
+        if request.query_params.get('date'):
+            try:
+                on_date = parse_date(request.query_params['date'])
+            except ValueError:
+                on_date = None
+            if on_date is None:
+                return Response({'error': 'date must be YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+        qs = eligible_on(
+            blood_group,
+            city=request.query_params.get('city'),
+            state=request.query_params.get('state'),
+            on_date=on_date,
+        ).order_by('next_eligible_date', 'id')
+        page = self.paginate_queryset(qs)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return Response(self.get_serializer(qs, many=True).data)
+
 
 class DonationViewSet(viewsets.ModelViewSet):
     queryset = Donation.objects.all().order_by('-donation_date')
@@ -83,7 +168,7 @@ class DonationViewSet(viewsets.ModelViewSet):
         donor = validated_data.pop('donor', None)
         user_id = validated_data.pop('user_id', None)
         email = validated_data.pop('email', None)
-        blood_group = validated_data.pop('blood_group', None) or 'O+'  # Default to O+ if not provided
+        blood_group = validated_data.pop('blood_group', None) or DEFAULT_BLOOD_GROUP
         
         print(f"After popping: donor={donor}, user_id={user_id}, email={email}, blood_group={blood_group}")
         print(f"Remaining validated_data: {validated_data}")
@@ -146,54 +231,9 @@ class DonationViewSet(viewsets.ModelViewSet):
             except Donor.DoesNotExist:
                 print(f"Donor profile does not exist for User ID {user_id}, creating new one...")
                 # Auto-create donor profile with minimal data
-                from accounts.models import UserProfile
-                try:
-                    profile = donor_user.profile
-                    print(f"Found user profile")
-                except Exception as e:
-                    print(f"No user profile found: {e}")
-                    profile = None
-                
-                # Use profile data or defaults - ensure all required fields have values
                 try:
-                    # Get phone from user - ensure it's 10 digits or use default
-                    user_phone = donor_user.phone or ''
-                    # Normalize phone to 10 digits
-                    phone_digits = ''.join(filter(str.isdigit, str(user_phone)))
-                    if len(phone_digits) != 10:
-                        # If phone is not exactly 10 digits, pad with zeros or use default
-                        if len(phone_digits) > 0:
-                            # Pad existing digits to 10
-                            phone_digits = phone_digits.ljust(10, '0')[:10]
-                        else:
-                            # Use default if no phone
-                            phone_digits = '0000000000'
-                    
-                    # Ensure email is valid
-                    user_email = donor_user.email or f'user{user_id}@example.com'
-                    if not user_email or '@' not in user_email:
-                        user_email = f'user{user_id}@example.com'
-                    
-                    # Create donor profile with all required fields
-                    donor_data = {
-                        'user': donor_user,
-                        'full_name': donor_user.get_full_name() or donor_user.username or f'User {user_id}',
-                        'blood_group': blood_group,
-                        'date_of_birth': profile.date_of_birth if profile and profile.date_of_birth else date(2000, 1, 1),
-                        'gender': 'M',  # Default
-                        'phone': phone_digits,
-                        'email': user_email,
-                        'address': profile.address if profile and profile.address else 'Not provided',
-                        'city': profile.city if profile and profile.city else 'Not provided',
-                        'state': profile.state if profile and profile.state else 'Not provided',
-                        'pincode': profile.pincode if profile and profile.pincode else '000000',
-                        'weight': 70.0,  # Default weight
-                        'emergency_contact': phone_digits,
-                        'medical_conditions': '',
-                    }
-                    
-                    print(f"Creating donor profile with data: {donor_data}")
-                    donor = Donor.objects.create(**donor_data)
+                    donor = default_donor(donor_user, blood_group)
+                    donor.save()
                     print(f"Successfully created donor profile: {donor.id} for User ID {user_id}")
                 except Exception as e:
                     print(f"Error creating donor profile: {e}")
@@ -225,7 +265,8 @@ class DonationViewSet(viewsets.ModelViewSet):
         print(f"Creating donation with: donor={donor.id}, bloodbank={user.bloodbank.id}, validated_data={validated_data}")
         
         # Create donation and update inventory in a single transaction
-        from inventory.models import Inventory
+        from inventory.models import InventoryMovement
+        from inventory.services import adjust_stock, register_donation_units
         from django.db import transaction
         from rest_framework import status
         from rest_framework.response import Response
@@ -247,23 +288,20 @@ class DonationViewSet(viewsets.ModelViewSet):
                     traceback.print_exc()
                     raise ValidationError({'donation': [f'Error creating donation: {str(e)}']})
                 
-                # Automatically update inventory when donation is created
+                # Automatically update inventory when donation is created.
+                # Single atomic upsert so concurrent donations never lose increments.
                 try:
-                    # Get or create inventory for this blood group
-                    inventory, created = Inventory.objects.get_or_create(
-                        bloodbank=user.bloodbank,
-                        blood_group=donation.donor.blood_group,
-                        defaults={
-                            'units_available': 0,
-                            'min_stock_level': 5
-                        }
+                    adjust_stock(
+                        user.bloodbank,
+                        donation.donor.blood_group,
+                        donation.units_donated,
+                        movement_type=InventoryMovement.DONATION,
+                        reference=f'donation:{donation.id}',
+                        created_by=user,
                     )
-                    print(f"Inventory {'created' if created else 'found'}: {inventory.id}, current units: {inventory.units_available}")
-                    
-                    # Add donated units to inventory
-                    inventory.units_available += donation.units_donated
-                    inventory.save()
-                    print(f"Inventory updated: new units: {inventory.units_available}")
+                    print(f"Inventory updated: +{donation.units_donated} units of {donation.donor.blood_group}")
+                    # Track each donated unit as a bag for FEFO issue and expiry
+                    register_donation_units(donation)
                 except Exception as e:
                     print(f"Error updating inventory: {e}")
                     import traceback
@@ -300,6 +338,34 @@ class DonationViewSet(viewsets.ModelViewSet):
             traceback.print_exc()
             raise ValidationError({'error': [f'Unexpected error: {str(e)}']})
 
+    @action(detail=False, methods=['post'], url_path='import')
+    def bulk_import(self, request):
+        """Import many donations at once, e.g. after a camp (blood bank only).
+        Body: a CSV file in `file` (multipart), or JSON `{"rows": [...]}` / `[...]` with the same
+        fields as a single donation. Valid rows are imported; invalid ones are reported by row number.
+        """
+        user = request.user
+        if not hasattr(user, 'bloodbank'):
+            from rest_framework.exceptions import PermissionDenied
+            raise PermissionDenied('Only blood bank users can add donations.')
+
+        upload = request.FILES.get('file')
+        if upload is not None:
+            try:
+                rows = parse_csv(upload.file)
+            except (UnicodeDecodeError, csv.Error) as e:
+                return Response({'error': f'Could not read CSV: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            rows = request.data.get('rows') if isinstance(request.data, dict) else request.data
+        if not isinstance(rows, list) or not rows or not all(isinstance(row, dict) for row in rows):
+            return Response({'error': 'Provide a CSV file or a non-empty list of rows'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            result = import_donations(user.bloodbank, rows, created_by=user)
+        except ImportTooLarge as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result, status=status.HTTP_201_CREATED if result['created'] else status.HTTP_200_OK)
+
 
 class AppointmentViewSet(viewsets.ModelViewSet):
     queryset = Appointment.objects.all().order_by('-appointment_date')
@@ -326,7 +392,9 @@ class AppointmentViewSet(viewsets.ModelViewSet):
             raise ValidationError({'bloodbank': ['Blood bank is required.']})
         
         # Save with user and bloodbank
-        appointment = serializer.save(user=user, bloodbank=bloodbank)
+        with transaction.atomic():
+            appointment = serializer.save(user=user, bloodbank=bloodbank)
+            record_change(StatusChange.APPOINTMENT, appointment.id, None, appointment.status, bloodbank.id, user)
         
         # Log the appointment creation
         import logging
@@ -343,12 +411,30 @@ class AppointmentViewSet(viewsets.ModelViewSet):
             if 'status' in request.data:
                 new_status = request.data['status']
                 if new_status in ['pending', 'approved', 'rejected', 'completed']:
-                    instance.status = new_status
-                    instance.save()
+                    self._set_status(instance, new_status)
                     serializer = self.get_serializer(instance)
                     return Response(serializer.data)
         
         return super().update(request, *args, **kwargs)
+
+    def perform_update(self, serializer):
+        # Status edits through the generic serializer path are recorded too
+        previous = serializer.instance.status
+        with transaction.atomic():
+            appointment = serializer.save()
+            if appointment.status != previous:
+                record_change(StatusChange.APPOINTMENT, appointment.id, previous, appointment.status,
+                              appointment.bloodbank_id, self.request.user)
+
+    def _set_status(self, appointment, new_status):
+        """Save a status change and append it to the status history."""
+        previous = appointment.status
+        with transaction.atomic():
+            appointment.status = new_status
+            appointment.save()
+            if new_status != previous:
+                record_change(StatusChange.APPOINTMENT, appointment.id, previous, new_status,
+                              appointment.bloodbank_id, self.request.user)
     
     @action(detail=True, methods=['post'])
     def approve(self, request, pk=None):
@@ -374,8 +460,7 @@ class AppointmentViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        appointment.status = 'approved'
-        appointment.save()
+        self._set_status(appointment, 'approved')
         
         serializer = self.get_serializer(appointment)
         return Response(serializer.data)
@@ -404,8 +489,7 @@ class AppointmentViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        appointment.status = 'rejected'
-        appointment.save()
+        self._set_status(appointment, 'rejected')
         
         serializer = self.get_serializer(appointment)
         return Response(serializer.data)
@@ -434,8 +518,7 @@ class AppointmentViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        appointment.status = 'completed'
-        appointment.save()
+        self._set_status(appointment, 'completed')
         
         serializer = self.get_serializer(appointment)
         return Response(serializer.data)
@@ -2,15 +2,66 @@
 ASGI config for ebloodbank project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+This is what production runs (``uvicorn ebloodbank.asgi:application``, see
+``start.sh``), so the inventory event stream (``/api/inventory/stream/``) can
+hold long-lived connections without tying up worker threads.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
 
+import asyncio
 import os
 
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ebloodbank.settings')
 
-application = get_asgi_application()
+# Responses that stream until the client goes away
+STREAMING_PATHS = ('/api/inventory/stream/',)
+
+
+def cancel_on_disconnect(app, paths=STREAMING_PATHS):
+    """Cancel requests to ``paths`` as soon as the client disconnects.
+
+    Django 4.2 stops reading ``receive`` once the request body is in, so an
+    endless streaming response would never notice the client leaving. Here
+    the rest of ``receive`` is watched instead and the request task is
+    cancelled on ``http.disconnect``, which runs the stream's cleanup.
+    """
+    async def wrapped(scope, receive, send):
+        if scope['type'] != 'http' or not scope['path'].startswith(paths):
+            return await app(scope, receive, send)
+
+        request = asyncio.current_task()
+        watcher = None
+        disconnected = False
+
+        async def watch():
+            nonlocal disconnected
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            disconnected = True
+            request.cancel()
+
+        async def read_body():
+            nonlocal watcher
+            message = await receive()
+            if message['type'] == 'http.request' and not message.get('more_body'):
+                # Django has the whole body; the watcher takes over
+                watcher = asyncio.create_task(watch())
+            return message
+
+        try:
+            await app(scope, read_body, send)
+        except asyncio.CancelledError:
+            if not disconnected:
+                raise
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+
+    return wrapped
+
+
+application = cancel_on_disconnect(get_asgi_application())
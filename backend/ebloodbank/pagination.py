@@ -0,0 +1,175 @@
+"""
+Page-number pagination with an opt-in keyset (cursor) mode.
+
+Plain requests keep the ``?page=`` behaviour and response shape. A request
+carrying ``?cursor=`` (empty for the first page) is paginated by keyset
+instead: the queryset's full ordering plus the primary key as a tiebreaker.
+Each page is one range read of ``page_size + 1`` rows past the last row's
+key (``(a, b, id) > (last_a, last_b, last_id)``, spelled out term by term so
+mixed directions work), so there is no ``COUNT(*)`` and no ``OFFSET`` and a
+late page costs the same as the first one when the ordering is indexed.
+
+The response is ``{"next", "previous", "results"}``. Any ``?ordering=``
+accepted by the view works as long as every ordering field is a non-null
+column or annotation on the model.
+"""
+import base64
+import datetime
+import decimal
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def _encode_value(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    return value
+
+
+class KeysetPagination(PageNumberPagination):
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.use_cursor = self.cursor_query_param in request.query_params
+        if not self.use_cursor:
+            return super().paginate_queryset(queryset, request, view)
+        return self.paginate_keyset(queryset, request)
+
+    def get_paginated_response(self, data):
+        if not self.use_cursor:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_next_link(self):
+        if not self.use_cursor:
+            return super().get_next_link()
+        return self.next_link
+
+    def get_previous_link(self):
+        if not self.use_cursor:
+            return super().get_previous_link()
+        return self.previous_link
+
+    def get_html_context(self):
+        if not self.use_cursor:
+            return super().get_html_context()
+        return {'previous_url': self.previous_link, 'next_url': self.next_link}
+
+    # Keyset mode
+
+    def _field(self, queryset, term):
+        """``(field, descending)`` for one ordering term."""
+        if not isinstance(term, str) or term == '?':
+            raise ValidationError({'cursor': 'Cursor pagination is not supported for this ordering.'})
+        descending = term.startswith('-')
+        field = term.lstrip('-+')
+        if field in queryset.query.annotations:
+            return field, descending
+        try:
+            model_field = queryset.model._meta.get_field(field) if field != 'pk' else queryset.model._meta.pk
+        except FieldDoesNotExist:
+            model_field = None
+        if model_field is None or not model_field.concrete or model_field.null:
+            raise ValidationError({'cursor': f'Cursor pagination is not supported when ordering by {field}.'})
+        return model_field.attname if not model_field.primary_key else 'pk', descending
+
+    def _keys(self, queryset):
+        """``[(field, descending), ...]`` for every ordering term of ``queryset``, ending with ``pk``."""
+        ordering = queryset.query.order_by or queryset.model._meta.ordering or ['-pk']
+        keys = []
+        for term in ordering:
+            field, descending = self._field(queryset, term)
+            keys.append((field, descending))
+            if field == 'pk':
+                return keys
+        return keys + [('pk', keys[-1][1])]
+
+    def _decode_cursor(self, token, queryset, keys):
+        fields = [field for field, _ in keys]
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+            if cursor['f'] != fields or len(cursor['v']) != len(fields):
+                raise ValueError
+            values = []
+            for field, value in zip(fields, cursor['v']):
+                if field == 'pk':
+                    value = queryset.model._meta.pk.to_python(value)
+                elif field not in queryset.query.annotations:
+                    value = queryset.model._meta.get_field(field).to_python(value)
+                values.append(value)
+            reverse = bool(cursor['r'])
+        except (TypeError, ValueError, KeyError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    def _encode_cursor(self, keys, obj, reverse):
+        payload = {
+            'f': [field for field, _ in keys],
+            'v': [_encode_value(getattr(obj, field)) for field, _ in keys],
+            'r': int(reverse),
+        }
+        token = base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode('ascii'))
+        return replace_query_param(self.base_url, self.cursor_query_param, token.decode('ascii'))
+
+    @staticmethod
+    def _after(keys, values, reverse):
+        """Rows strictly past ``values`` in the ordering (or before it when ``reverse``)."""
+        condition = Q()
+        equal = {}
+        for (field, descending), value in zip(keys, values):
+            op = 'lt' if descending != reverse else 'gt'
+            condition |= Q(**equal, **{f'{field}__{op}': value})
+            equal[field] = value
+        first_field, first_descending = keys[0]
+        # Redundant with the OR, but bounds the index range on the leading term
+        bound = 'lte' if first_descending != reverse else 'gte'
+        return Q(**{f'{first_field}__{bound}': values[0]}) & condition
+
+    def paginate_keyset(self, queryset, request):
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        keys = self._keys(queryset)
+
+        token = request.query_params.get(self.cursor_query_param)
+        reverse = False
+        if token:
+            values, reverse = self._decode_cursor(token, queryset, keys)
+            queryset = queryset.filter(self._after(keys, values, reverse))
+        # Walking back towards the first page reads the range the other way round
+        order = [('-' if descending != reverse else '') + field for field, descending in keys]
+        rows = list(queryset.order_by(*order)[:page_size + 1])
+
+        has_more = len(rows) > page_size
+        page = rows[:page_size]
+        if reverse:
+            page.reverse()
+
+        self.next_link = self.previous_link = None
+        if page:
+            more_after = has_more if not reverse else True
+            more_before = bool(token) if not reverse else has_more
+            if more_after:
+                self.next_link = self._encode_cursor(keys, page[-1], reverse=False)
+            if more_before:
+                self.previous_link = self._encode_cursor(keys, page[0], reverse=True)
+        elif reverse and token:
+            # Everything before the cursor vanished; offer the way forward again
+            self.next_link = replace_query_param(self.base_url, self.cursor_query_param, '')
+        return page
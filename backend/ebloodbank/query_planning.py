@@ -0,0 +1,68 @@
+"""
+Derive ``select_related``/``only()`` from a serializer's declared fields.
+
+Serializers that expose related values with dotted sources (e.g.
+``CharField(source='bloodbank.name')``) or nested model serializers would
+otherwise trigger one query per row and relation. ``plan_queryset`` reads the
+serializer fields once and returns a queryset that joins every forward
+relation the serializer reads and loads only the columns it renders.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from rest_framework import serializers
+
+
+def _model_field(model, name):
+    try:
+        return model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+
+
+def _collect(serializer, model, prefix, related, columns):
+    for field in serializer.fields.values():
+        if field.write_only or field.source == '*':
+            continue
+        if isinstance(field, serializers.ListSerializer):
+            # Reverse/many relations need prefetching; not planned here
+            continue
+        path = field.source.split('.')
+        current_model = model
+        current_prefix = prefix
+        for depth, attr in enumerate(path):
+            model_field = _model_field(current_model, attr)
+            if model_field is None or not model_field.concrete:
+                # Properties, methods and reverse relations are left to the caller
+                break
+            name = current_prefix + attr
+            columns.add(name)
+            last = depth == len(path) - 1
+            if isinstance(model_field, models.ForeignKey):
+                if not last:
+                    related.add(name)
+                elif isinstance(field, serializers.ModelSerializer):
+                    related.add(name)
+                    _collect(field, model_field.related_model, name + '__', related, columns)
+                current_model = model_field.related_model
+                current_prefix = name + '__'
+            elif not last:
+                break
+
+
+def plan_queryset(queryset, serializer_class, context=None):
+    """Return ``queryset`` with the joins and column projection ``serializer_class`` needs."""
+    serializer = serializer_class(context=context or {})
+    model = queryset.model
+    related, columns = set(), {model._meta.pk.name}
+    _collect(serializer, model, '', related, columns)
+    if related:
+        queryset = queryset.select_related(*sorted(related))
+    return queryset.only(*sorted(columns))
+
+
+class QueryPlanMixin:
+    """Viewset mixin applying ``plan_queryset`` with the viewset's serializer class."""
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        return plan_queryset(queryset, self.get_serializer_class(), self.get_serializer_context())
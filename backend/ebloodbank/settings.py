@@ -83,6 +83,10 @@ INSTALLED_APPS = [
     'inventory',
     'donors',
     'requests',
+    'audit',
+    'storage',
+    'search',
+    'geo',
 ]
 
 MIDDLEWARE = [
@@ -219,10 +223,10 @@ REST_FRAMEWORK = {
     ),
     'DEFAULT_FILTER_BACKENDS': (
         'django_filters.rest_framework.DjangoFilterBackend',
-        'rest_framework.filters.SearchFilter',
+        'search.filters.IndexedSearchFilter',
         'rest_framework.filters.OrderingFilter',
     ),
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'ebloodbank.pagination.KeysetPagination',
     'PAGE_SIZE': 20,
 }
 
@@ -282,6 +286,43 @@ CACHES = {
     }
 }
 
+# Inventory rollups (e.g. region availability) are marked stale on write; the
+# timeout bounds staleness when each worker has its own LocMemCache.
+INVENTORY_ROLLUP_CACHE_TIMEOUT = config('INVENTORY_ROLLUP_CACHE_TIMEOUT', default=300, cast=int)
+# Same for the donor demographics rollup (/api/donors/donors/demographics/)
+DONOR_DEMOGRAPHICS_CACHE_TIMEOUT = config('DONOR_DEMOGRAPHICS_CACHE_TIMEOUT', default=300, cast=int)
+# A stale inventory rollup is recomputed on a background thread while readers
+# get the old copy; when off, the reader that notices recomputes it inline.
+INVENTORY_ROLLUP_BACKGROUND = config('INVENTORY_ROLLUP_BACKGROUND', cast=bool, default=True)
+
+# Live inventory events (/api/inventory/stream/). LocalBroker only reaches
+# clients connected to the same process; point this at a shared broker when
+# running several ASGI workers.
+INVENTORY_EVENTS_BACKEND = config('INVENTORY_EVENTS_BACKEND', default='inventory.events.LocalBroker')
+INVENTORY_STREAM_HEARTBEAT = config('INVENTORY_STREAM_HEARTBEAT', default=15, cast=int)
+
+# Emergency requests notify nearby compatible donors in batches through this
+# sender (see donors.fanout); FileSender writes to DONOR_FANOUT_FILE.
+DONOR_FANOUT_SENDER = config('DONOR_FANOUT_SENDER', default='donors.fanout.ConsoleSender')
+DONOR_FANOUT_FILE = config('DONOR_FANOUT_FILE', default=str(BASE_DIR / 'donor_fanout.jsonl'))
+# Run the fan-out on a background thread after the request commits; when off
+# it runs in the commit hook. `manage.py fan_out_emergencies` sends any missed.
+DONOR_FANOUT_BACKGROUND = config('DONOR_FANOUT_BACKGROUND', cast=bool, default=True)
+# Seconds before an unfinished fan-out claim may be taken again (the worker
+# holding it is presumed dead). Keep it above the longest fan-out.
+DONOR_FANOUT_CLAIM_TIMEOUT = config('DONOR_FANOUT_CLAIM_TIMEOUT', default=600, cast=int)
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Uploads are streamed to disk, hashed and stored once per distinct content
+STORAGES = {
+    'default': {'BACKEND': 'storage.backends.ContentAddressedStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+# Media offload: '' serves files from Django, 'x-accel-redirect' (nginx) or
+# 'x-sendfile' (Apache/lighttpd) hand them to the front server. With nginx,
+# map MEDIA_SENDFILE_PREFIX to MEDIA_ROOT in an `internal` location.
+MEDIA_SENDFILE = config('MEDIA_SENDFILE', default='')
+MEDIA_SENDFILE_PREFIX = config('MEDIA_SENDFILE_PREFIX', default='/protected-media/')
+
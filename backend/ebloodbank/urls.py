@@ -16,12 +16,12 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.conf import settings
-from django.conf.urls.static import static
 from django.http import JsonResponse
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.template.response import TemplateResponse
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from accounts.auth import EmailOrUsernameTokenObtainPairView
+from storage.views import serve_media
 
 # Customize admin site
 admin.site.site_header = "E-BloodBank Administration"
@@ -50,12 +50,14 @@ urlpatterns = [
     path('api/donors/', include('donors.urls')),
     path('api/inventory/', include('inventory.urls')),
     path('api/requests/', include('requests.urls')),
+    path('api/audit/', include('audit.urls')),
     # JWT auth
     path('api/auth/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/auth/token/by-username-or-email/', EmailOrUsernameTokenObtainPairView.as_view(), name='token_by_username_or_email'),
     path('api/auth/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
 ]
 
-# Serve media files during development
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# Uploaded media for the users who may see it, with range requests; offloaded to the front server when MEDIA_SENDFILE is set
+urlpatterns += [
+    re_path(rf'^{settings.MEDIA_URL.lstrip("/")}(?P<path>.+)$', serve_media, name='media'),
+]
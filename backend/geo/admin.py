@@ -0,0 +1,10 @@
+from django.contrib import admin
+from .models import PincodeCentroid
+
+
+@admin.register(PincodeCentroid)
+class PincodeCentroidAdmin(admin.ModelAdmin):
+    list_display = ('pincode', 'district', 'state', 'latitude', 'longitude')
+    list_filter = ('state',)
+    search_fields = ('=pincode', 'district')
+    readonly_fields = ('grid_cell',)
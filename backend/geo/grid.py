@@ -0,0 +1,132 @@
+"""
+Grid-cell spatial index for "nearest" and "within radius" lookups.
+
+Points are bucketed into fixed ``CELL_DEGREES`` latitude/longitude cells,
+numbered row-major into one integer (``cell_of``). Models store the number
+in an indexed ``grid_cell`` column, next to their coordinates:
+``BloodBank``, ``DonationCamp`` and ``geo.PincodeCentroid`` (where donors
+are placed by their pincode).
+
+A lookup reads only the cells in a square "ring" around the origin, one
+index range per grid row, then computes haversine distances for those
+candidates in one NumPy pass:
+
+* ``within`` sizes the ring to cover the radius;
+* ``nearest`` starts small and widens the ring until it holds ``k``
+  candidates and covers the distance to the k-th one, so the result is
+  exact.
+
+Cells do not wrap at the antimeridian, which no Indian location is near.
+"""
+import math
+
+import numpy as np
+from django.db.models import FloatField, Q
+from django.db.models.functions import Cast
+
+
+CELL_DEGREES = 0.1
+COLUMNS = round(360 / CELL_DEGREES)
+ROWS = round(180 / CELL_DEGREES)
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+# Beyond this many cells out, reading every located row is cheaper
+MAX_RING = 100
+
+
+def haversine_km(lat, lon, lats, lons):
+    """Great-circle distance from one point to arrays of points (NaN where unknown)."""
+    lat, lon, lats, lons = map(np.radians, (lat, lon, lats, lons))
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def cell_of(latitude, longitude):
+    """Grid cell number of a point, or ``None`` without both coordinates."""
+    if latitude is None or longitude is None:
+        return None
+    row = min(max(int((float(latitude) + 90) // CELL_DEGREES), 0), ROWS - 1)
+    col = min(max(int((float(longitude) + 180) // CELL_DEGREES), 0), COLUMNS - 1)
+    return row * COLUMNS + col
+
+
+def ring_filter(latitude, longitude, ring):
+    """``Q`` for the cells at most ``ring`` cells away from the point's cell (one range per row)."""
+    row, col = divmod(cell_of(latitude, longitude), COLUMNS)
+    first, last = max(col - ring, 0), min(col + ring, COLUMNS - 1)
+    condition = Q()
+    for r in range(max(row - ring, 0), min(row + ring, ROWS - 1) + 1):
+        condition |= Q(grid_cell__range=(r * COLUMNS + first, r * COLUMNS + last))
+    return condition
+
+
+def covered_km(latitude, ring):
+    """Distance from the point that the ring is sure to cover in every direction."""
+    # The point may sit anywhere in its own cell, so count whole cells beyond it
+    north_south = ring * CELL_DEGREES * KM_PER_DEGREE
+    edge_latitude = min(abs(float(latitude)) + (ring + 1) * CELL_DEGREES, 90)
+    east_west = north_south * math.cos(math.radians(edge_latitude))
+    return min(north_south, east_west)
+
+
+def ring_for_km(latitude, km):
+    """Smallest ring covering ``km`` around the point, or ``None`` past ``MAX_RING``."""
+    ring = max(math.ceil(km / (CELL_DEGREES * KM_PER_DEGREE)), 1)
+    while ring <= MAX_RING:
+        if covered_km(latitude, ring) >= km:
+            return ring
+        ring += 1
+    return None
+
+
+def _distances(queryset, latitude, longitude, ring):
+    located = queryset.order_by().filter(grid_cell__isnull=False)
+    if ring is not None:
+        located = located.filter(ring_filter(latitude, longitude, ring))
+    # Floats straight from the database; Decimal conversion would dominate the cost
+    rows = list(located.values_list('pk', Cast('latitude', FloatField()), Cast('longitude', FloatField())))
+    lats = np.fromiter((row[1] for row in rows), dtype=float, count=len(rows))
+    lons = np.fromiter((row[2] for row in rows), dtype=float, count=len(rows))
+    return [row[0] for row in rows], haversine_km(float(latitude), float(longitude), lats, lons)
+
+
+def within(queryset, latitude, longitude, radius_km):
+    """``[(pk, km)]`` for rows of ``queryset`` within ``radius_km`` of the point, nearest first."""
+    ids, distances = _distances(queryset, latitude, longitude, ring_for_km(latitude, radius_km))
+    order = np.argsort(distances, kind='stable')
+    order = order[distances[order] <= radius_km]
+    return [(ids[i], float(distances[i])) for i in order]
+
+
+def nearest(queryset, latitude, longitude, k):
+    """``[(pk, km)]`` for the ``k`` rows of ``queryset`` nearest the point, nearest first."""
+    ring = 1
+    while True:
+        ids, distances = _distances(queryset, latitude, longitude, ring)
+        if ring is None or len(ids) >= k:
+            order = np.argsort(distances, kind='stable')[:k]
+            kth = distances[order[-1]] if len(order) else 0.0
+            if ring is None or kth <= covered_km(latitude, ring):
+                return [(ids[i], float(distances[i])) for i in order]
+            # Something outside the ring could still beat the k-th candidate
+            ring = ring_for_km(latitude, kth)
+        else:
+            ring = ring * 2 if ring * 2 <= MAX_RING else None
+
+
+def within_by_pincode(queryset, latitude, longitude, radius_km):
+    """``[(pk, km)]`` for rows placed at their ``pincode``'s centroid, within ``radius_km``, nearest first."""
+    from .models import PincodeCentroid
+
+    centroids = dict(within(PincodeCentroid.objects.all(), latitude, longitude, radius_km))
+    if not centroids:
+        return []
+    # Join on the ring's cells in the database instead of sending every pincode as a parameter;
+    # pincodes in the ring but past the radius are dropped below
+    ring = ring_for_km(latitude, radius_km)
+    in_ring = PincodeCentroid.objects.filter(grid_cell__isnull=False)
+    if ring is not None:
+        in_ring = in_ring.filter(ring_filter(latitude, longitude, ring))
+    rows = queryset.order_by().filter(pincode__in=in_ring.values('pincode')).values_list('pk', 'pincode')
+    return sorted(((pk, centroids[pincode]) for pk, pincode in rows if pincode in centroids),
+                  key=lambda row: row[1])
@@ -0,0 +1,79 @@
+"""
+Load pincode centroids from a CSV, e.g. India Post's all-India pincode directory.
+
+The CSV needs a header row with pincode, latitude and longitude columns
+(district/districtname and state/statename are kept when present). A
+pincode listed for several post offices is placed at their mean; rows
+without usable coordinates are skipped. Existing pincodes are updated.
+
+    python manage.py load_pincode_centroids pincodes.csv
+"""
+import csv
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from geo.grid import cell_of
+from geo.models import PincodeCentroid
+
+
+def _column(row, *names):
+    for name in names:
+        value = (row.get(name) or '').strip()
+        if value:
+            return value
+    return ''
+
+
+class Command(BaseCommand):
+    help = 'Load or update pincode centroids from a CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        points = {}
+        skipped = 0
+        with open(options['path'], encoding='utf-8-sig', newline='') as f:
+            for row in csv.DictReader(f):
+                row = {(key or '').strip().lower(): value for key, value in row.items()}
+                pincode = _column(row, 'pincode')
+                try:
+                    latitude = float(_column(row, 'latitude'))
+                    longitude = float(_column(row, 'longitude'))
+                except ValueError:
+                    skipped += 1
+                    continue
+                if not (len(pincode) == 6 and pincode.isdigit() and -90 <= latitude <= 90
+                        and -180 <= longitude <= 180):
+                    skipped += 1
+                    continue
+                entry = points.setdefault(pincode, [0.0, 0.0, 0, _column(row, 'district', 'districtname'),
+                                                    _column(row, 'state', 'statename')])
+                entry[0] += latitude
+                entry[1] += longitude
+                entry[2] += 1
+        if not points and skipped:
+            raise CommandError('No rows with a pincode, latitude and longitude were found')
+
+        centroids = []
+        for pincode, (lat_sum, lon_sum, count, district, state) in points.items():
+            latitude = Decimal(lat_sum / count).quantize(Decimal('0.000001'))
+            longitude = Decimal(lon_sum / count).quantize(Decimal('0.000001'))
+            centroids.append(PincodeCentroid(
+                pincode=pincode, district=district[:100], state=state[:100], latitude=latitude,
+                longitude=longitude, grid_cell=cell_of(latitude, longitude),
+            ))
+        with transaction.atomic():
+            PincodeCentroid.objects.bulk_create(
+                centroids, batch_size=options['batch_size'], update_conflicts=True, unique_fields=['pincode'],
+                update_fields=['district', 'state', 'latitude', 'longitude', 'grid_cell'],
+            )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Loaded {len(centroids)} pincode(s), skipped {skipped} row(s) in {elapsed:.2f}s.'
+        ))
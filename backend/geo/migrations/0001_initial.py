@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-17 12:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PincodeCentroid',
+            fields=[
+                ('pincode', models.CharField(max_length=6, primary_key=True, serialize=False)),
+                ('district', models.CharField(blank=True, max_length=100)),
+                ('state', models.CharField(blank=True, max_length=100)),
+                ('latitude', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('longitude', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('grid_cell', models.BigIntegerField(editable=False, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['grid_cell', 'latitude', 'longitude', 'pincode'], name='pincode_grid_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+from django.db import models
+
+from .grid import cell_of
+
+
+class PincodeCentroid(models.Model):
+    """Approximate location of a postal code; donors are placed at their pincode's centroid."""
+    pincode = models.CharField(max_length=6, primary_key=True)
+    district = models.CharField(max_length=100, blank=True)
+    state = models.CharField(max_length=100, blank=True)
+    latitude = models.DecimalField(max_digits=9, decimal_places=6)
+    longitude = models.DecimalField(max_digits=9, decimal_places=6)
+    # See geo.grid
+    grid_cell = models.BigIntegerField(null=True, editable=False)
+
+    def __str__(self):
+        return self.pincode
+
+    def save(self, *args, **kwargs):
+        self.grid_cell = cell_of(self.latitude, self.longitude)
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'grid_cell'}
+        super().save(*args, **kwargs)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['grid_cell', 'latitude', 'longitude', 'pincode'], name='pincode_grid_idx'),
+        ]
@@ -0,0 +1,54 @@
+"""Query parameters shared by the nearest/nearby endpoints."""
+from .models import PincodeCentroid
+
+
+DEFAULT_K = 10
+MAX_K = 100
+DEFAULT_RADIUS_KM = 25.0
+MAX_RADIUS_KM = 500.0
+MAX_RESULTS = 500
+
+
+class InvalidLocation(ValueError):
+    pass
+
+
+def _number(params, name, default, maximum, cast=float):
+    raw = params.get(name)
+    if raw in (None, ''):
+        return default
+    try:
+        value = cast(raw)
+    except (TypeError, ValueError):
+        raise InvalidLocation(f'{name} must be a number')
+    if not 0 < value <= maximum:
+        raise InvalidLocation(f'{name} must be greater than 0 and at most {maximum}')
+    return value
+
+
+def origin(params):
+    """``(latitude, longitude)`` from ``?lat=&lon=``, or from ``?pincode=`` via its centroid."""
+    lat, lon = params.get('lat'), params.get('lon')
+    if lat not in (None, '') and lon not in (None, ''):
+        try:
+            lat, lon = float(lat), float(lon)
+        except ValueError:
+            raise InvalidLocation('lat and lon must be numbers')
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise InvalidLocation('lat must be within ±90 and lon within ±180')
+        return lat, lon
+    pincode = (params.get('pincode') or '').strip()
+    if pincode:
+        centroid = PincodeCentroid.objects.filter(pincode=pincode).values_list('latitude', 'longitude').first()
+        if centroid is None:
+            raise InvalidLocation(f'Unknown pincode {pincode}')
+        return float(centroid[0]), float(centroid[1])
+    raise InvalidLocation('lat and lon (or pincode) are required')
+
+
+def k(params):
+    return _number(params, 'k', DEFAULT_K, MAX_K, int)
+
+
+def radius_km(params):
+    return _number(params, 'radius_km', DEFAULT_RADIUS_KM, MAX_RADIUS_KM)
@@ -0,0 +1,77 @@
+from datetime import date
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts.models import User
+from bloodbank.models import BloodBank
+from donors.models import Donor
+from . import grid
+from .models import PincodeCentroid
+
+
+def make_bank(n):
+    user = User.objects.create(username=f'bank{n}', email=f'bank{n}@example.com', phone=f'90000000{n:02d}',
+                               user_type='bloodbank')
+    BloodBank.objects.create(user=user, name=f'Bank {n}', registration_number=f'REG{n}')
+    return User.objects.select_related('bloodbank').get(pk=user.pk)
+
+
+class NearestBankTests(TestCase):
+    def setUp(self):
+        self.user = make_bank(0)
+        token = RefreshToken.for_user(self.user).access_token
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+        # Along a meridian, 0.05 degrees (~5.6 km) apart, crossing several grid cells
+        self.banks = []
+        for n in range(1, 41):
+            user = make_bank(n)
+            user.bloodbank.latitude, user.bloodbank.longitude = 18.0 + n * 0.05, 73.85
+            user.bloodbank.save()
+            self.banks.append(user.bloodbank)
+
+    def test_k_nearest_matches_distance_order(self):
+        response = self.client.get('/api/bloodbank/bloodbanks/nearest/', {'lat': 19.01, 'lon': 73.85, 'k': 5},
+                                   **self.auth)
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([row['id'] for row in results], [self.banks[i].id for i in (19, 20, 18, 21, 17)])
+        self.assertEqual([row['distance_km'] for row in results], sorted(row['distance_km'] for row in results))
+
+    def test_radius_and_unlocated_banks(self):
+        response = self.client.get('/api/bloodbank/bloodbanks/nearby/', {'lat': 18.0, 'lon': 73.85, 'radius_km': 12},
+                                   **self.auth)
+        self.assertEqual([row['id'] for row in response.json()['results']], [self.banks[0].id, self.banks[1].id])
+        response = self.client.get('/api/bloodbank/bloodbanks/nearest/', {'lat': 18.0}, **self.auth)
+        self.assertEqual(response.status_code, 400)
+
+
+class PincodeWithinTests(TestCase):
+    def setUp(self):
+        # Along a meridian from the origin: ~0, ~10, ~14.5 and ~100 km
+        for pincode, latitude in (('411001', 18.5), ('411002', 18.59), ('411003', 18.63), ('411004', 19.4)):
+            PincodeCentroid.objects.create(pincode=pincode, latitude=latitude, longitude=73.85)
+        self.donors = {}
+        for n, pincode in enumerate(('411001', '411002', '411003', '411004', '999999')):
+            user = User.objects.create(username=f'donor{n}', email=f'donor{n}@example.com',
+                                       phone=f'80000000{n:02d}', user_type='donor')
+            self.donors[pincode] = Donor.objects.create(
+                user=user, full_name=f'Donor {n}', blood_group='O+', date_of_birth=date(1990, 1, 1), gender='M',
+                phone='0', email=user.email, address='-', city='Pune', state='Maharashtra', pincode=pincode,
+                weight=70, emergency_contact='0',
+            ).pk
+
+    def test_rows_at_centroids_within_the_radius(self):
+        located = grid.within_by_pincode(Donor.objects.all(), 18.5, 73.85, 12)
+        self.assertEqual([pk for pk, _ in located], [self.donors['411001'], self.donors['411002']])
+        self.assertEqual([round(km) for _, km in located], [0, 10])
+        self.assertEqual(grid.within_by_pincode(Donor.objects.all(), 10.0, 77.0, 5), [])
+
+    def test_pincodes_are_joined_in_the_database(self):
+        with CaptureQueriesContext(connection) as captured:
+            grid.within_by_pincode(Donor.objects.all(), 18.5, 73.85, 12)
+        donor_query = captured.captured_queries[-1]['sql']
+        self.assertIn('geo_pincodecentroid', donor_query)
+        self.assertNotIn("'411002'", donor_query)
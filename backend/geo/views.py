@@ -0,0 +1,53 @@
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from . import grid, params
+
+
+class NearbyMixin:
+    """``GET nearby/``: rows within ``?radius_km=`` of ``?lat=&lon=`` (or ``?pincode=``), nearest first.
+
+    The viewset's filters apply. Results carry ``distance_km`` and are
+    capped at ``params.MAX_RESULTS``.
+    """
+
+    def nearby_queryset(self):
+        return self.filter_queryset(self.get_queryset())
+
+    def locate_within(self, queryset, latitude, longitude, radius_km):
+        return grid.within(queryset, latitude, longitude, radius_km)
+
+    def located_response(self, queryset, located):
+        located = located[:params.MAX_RESULTS]
+        rows = queryset.in_bulk([pk for pk, _ in located])
+        results = []
+        for pk, distance in located:
+            data = self.get_serializer(rows[pk]).data
+            data['distance_km'] = round(distance, 2)
+            results.append(data)
+        return Response({'count': len(results), 'results': results})
+
+    @action(detail=False, methods=['get'])
+    def nearby(self, request):
+        try:
+            latitude, longitude = params.origin(request.query_params)
+            radius_km = params.radius_km(request.query_params)
+        except params.InvalidLocation as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        queryset = self.nearby_queryset()
+        return self.located_response(queryset, self.locate_within(queryset, latitude, longitude, radius_km))
+
+
+class NearestMixin(NearbyMixin):
+    """Adds ``GET nearest/``: the ``?k=`` rows nearest ``?lat=&lon=`` (or ``?pincode=``)."""
+
+    @action(detail=False, methods=['get'])
+    def nearest(self, request):
+        try:
+            latitude, longitude = params.origin(request.query_params)
+            k = params.k(request.query_params)
+        except params.InvalidLocation as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        queryset = self.nearby_queryset()
+        return self.located_response(queryset, grid.nearest(queryset, latitude, longitude, k))
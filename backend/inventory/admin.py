@@ -1,18 +1,86 @@
 from django.contrib import admin
+from django.db.models import Count
 from django.utils.html import format_html
-from .models import Inventory
+from .models import BloodUnit, Inventory, InventoryMovement, StockForecast
+
+
+class StockStatusFilter(admin.SimpleListFilter):
+    title = 'stock status'
+    parameter_name = 'stock'
+
+    def lookups(self, request, model_admin):
+        return (('low', 'Low stock'), ('ok', 'In stock'))
+
+    def queryset(self, request, queryset):
+        if self.value() == 'low':
+            return queryset.low_stock()
+        if self.value() == 'ok':
+            return queryset.exclude(pk__in=queryset.low_stock().values('pk'))
+        return queryset
 
 
 @admin.register(Inventory)
 class InventoryAdmin(admin.ModelAdmin):
     list_display = ('bloodbank', 'blood_group', 'units_available', 'min_stock_level', 'stock_status', 'last_updated')
-    list_filter = ('blood_group', 'last_updated')
+    list_filter = (StockStatusFilter, 'blood_group', 'last_updated')
     search_fields = ('bloodbank__name',)
-    readonly_fields = ('last_updated', 'created_at', 'is_low_stock')
+    # Balances only change through the ledger (inventory.services); record
+    # corrections as adjustment movements instead
+    readonly_fields = ('units_available', 'last_updated', 'created_at', 'is_low_stock')
     ordering = ('bloodbank', 'blood_group')
+
+    def get_readonly_fields(self, request, obj=None):
+        if obj is None:
+            return self.readonly_fields
+        # Moving a row to another bank or group would move its stock off the ledger too
+        return ('bloodbank', 'blood_group', *self.readonly_fields)
     
     def stock_status(self, obj):
         if obj.units_available <= obj.min_stock_level:
             return format_html('<span style="color: #ef4444; font-weight: bold;">⚠️ Low Stock</span>')
         return format_html('<span style="color: #10b981; font-weight: bold;">✓ In Stock</span>')
     stock_status.short_description = 'Stock Status'
+
+    def changelist_view(self, request, extra_context=None):
+        # Low-stock counts per blood group, shown above the change list
+        extra_context = extra_context or {}
+        extra_context['low_stock_summary'] = list(
+            Inventory.objects.low_stock().values('blood_group').annotate(count=Count('id')).order_by('blood_group')
+        )
+        return super().changelist_view(request, extra_context=extra_context)
+
+
+
+@admin.register(InventoryMovement)
+class InventoryMovementAdmin(admin.ModelAdmin):
+    list_display = ('bloodbank', 'blood_group', 'movement_type', 'quantity', 'reference', 'created_by', 'created_at')
+    list_filter = ('movement_type', 'blood_group', 'created_at')
+    search_fields = ('bloodbank__name', 'reference')
+    ordering = ('-created_at',)
+
+    # The ledger is append-only: record corrections as new adjustment movements
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+
+@admin.register(BloodUnit)
+class BloodUnitAdmin(admin.ModelAdmin):
+    list_display = ('bag_id', 'bloodbank', 'blood_group', 'component', 'status', 'collected_at', 'expires_at')
+    list_filter = ('status', 'component', 'blood_group', 'expires_at')
+    search_fields = ('bag_id', 'bloodbank__name')
+    readonly_fields = ('created_at',)
+    ordering = ('expires_at',)
+
+
+
+@admin.register(StockForecast)
+class StockForecastAdmin(admin.ModelAdmin):
+    list_display = ('bloodbank', 'blood_group', 'units_available', 'projected_daily_supply',
+                    'projected_daily_demand', 'days_of_cover', 'computed_at')
+    list_filter = ('blood_group',)
+    search_fields = ('bloodbank__name',)
+    ordering = ('days_of_cover',)
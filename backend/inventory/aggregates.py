@@ -0,0 +1,185 @@
+"""
+Precomputed inventory rollups served from the cache.
+
+Rollups are computed with one grouped query and cached. Inventory and blood
+bank writes do not delete them: after commit they bump a version key (see
+``inventory.signals`` and ``inventory.services``), which marks the cached
+rollup stale. Readers keep getting the stale copy while the first reader to
+notice takes a cache lock and recomputes it, on a background thread unless
+``INVENTORY_ROLLUP_BACKGROUND`` is off. A burst of writes therefore costs
+one recompute, not one slow request per reader; only a cold cache is
+computed inside a request.
+
+A rollup also goes stale after ``INVENTORY_ROLLUP_CACHE_TIMEOUT`` seconds.
+That bounds staleness for per-process caches such as LocMemCache, where a
+write in one worker does not reach the others; use a shared cache backend
+in production.
+
+Rows are stored grouped by lowercased state and city, so filtered reads are
+dictionary lookups rather than a scan of the whole network. Each process
+keeps the last rollup it loaded and checks a small stamp key on every read,
+so the full rollup is only fetched and unpickled again after a refresh.
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from .models import Inventory
+
+
+logger = logging.getLogger(__name__)
+
+REGION_AVAILABILITY_KEY = 'inventory:region-availability'
+REGION_AVAILABILITY_VERSION_KEY = 'inventory:region-availability:version'
+REGION_AVAILABILITY_LOCK_KEY = 'inventory:region-availability:refreshing'
+# (version, generated_at) of the stored rollup
+REGION_AVAILABILITY_STAMP_KEY = 'inventory:region-availability:stamp'
+# Longest a recompute may hold the lock before another reader retries it
+REFRESH_LOCK_TIMEOUT = 60
+
+
+def _timeout():
+    return getattr(settings, 'INVENTORY_ROLLUP_CACHE_TIMEOUT', 300)
+
+
+def _region_key(value):
+    return (value or '').strip().lower()
+
+
+def _bump_version():
+    try:
+        cache.incr(REGION_AVAILABILITY_VERSION_KEY)
+    except ValueError:
+        # Not set yet, or evicted: any new value differs from the stored rollup's
+        cache.add(REGION_AVAILABILITY_VERSION_KEY, time.time_ns(), None)
+
+
+def _current_version():
+    version = cache.get(REGION_AVAILABILITY_VERSION_KEY)
+    if version is None:
+        _bump_version()
+        version = cache.get(REGION_AVAILABILITY_VERSION_KEY)
+    return version
+
+
+def compute_region_availability(version=None):
+    """Total units per (state, city, blood_group) across approved, operational banks.
+
+    Returns ``{'version', 'generated_at', 'regions'}`` where ``regions`` maps
+    lowercased state to lowercased city to that city's rows.
+    """
+    generated_at = timezone.now()
+    rows = (
+        Inventory.objects
+        .filter(bloodbank__status='approved', bloodbank__is_operational=True)
+        .values('bloodbank__state', 'bloodbank__city', 'blood_group')
+        .annotate(
+            total_units=Sum('units_available'),
+            stocked_banks=Count('bloodbank', filter=Q(units_available__gt=0)),
+        )
+        .order_by('bloodbank__state', 'bloodbank__city', 'blood_group')
+    )
+    regions = {}
+    for row in rows:
+        cities = regions.setdefault(_region_key(row['bloodbank__state']), {})
+        cities.setdefault(_region_key(row['bloodbank__city']), []).append({
+            'state': row['bloodbank__state'],
+            'city': row['bloodbank__city'],
+            'blood_group': row['blood_group'],
+            'units_available': row['total_units'],
+            'banks_with_stock': row['stocked_banks'],
+        })
+    return {'version': version, 'generated_at': generated_at, 'regions': regions}
+
+
+# (stamp, rollup) this process last loaded; shared read-only by its threads
+_loaded = (None, None)
+
+
+def _stamp(rollup):
+    return rollup['version'], rollup['generated_at']
+
+
+def _compute_and_store():
+    global _loaded
+    # The version is read first, so a write during the query leaves the result stale
+    rollup = compute_region_availability(_current_version())
+    cache.set(REGION_AVAILABILITY_KEY, rollup, None)
+    cache.set(REGION_AVAILABILITY_STAMP_KEY, _stamp(rollup), None)
+    _loaded = (_stamp(rollup), rollup)
+    return rollup
+
+
+def _load(stamp):
+    """The stored rollup for ``stamp``, from this process's copy when it is current."""
+    global _loaded
+    loaded_stamp, rollup = _loaded
+    if stamp is None or loaded_stamp != stamp:
+        rollup = cache.get(REGION_AVAILABILITY_KEY)
+        if rollup is None:
+            return None
+        _loaded = (_stamp(rollup), rollup)
+    return rollup
+
+
+def _refresh_locked():
+    try:
+        return _compute_and_store()
+    finally:
+        cache.delete(REGION_AVAILABILITY_LOCK_KEY)
+
+
+def _refresh_in_background():
+    try:
+        _refresh_locked()
+    except Exception:
+        logger.exception('Region availability refresh failed')
+    finally:
+        connection.close()
+
+
+def get_region_availability():
+    """The cached rollup (shared, do not modify); a stale one is served while a single caller recomputes it."""
+    cached = cache.get_many([REGION_AVAILABILITY_STAMP_KEY, REGION_AVAILABILITY_VERSION_KEY])
+    rollup = _load(cached.get(REGION_AVAILABILITY_STAMP_KEY))
+    if rollup is None:
+        return _compute_and_store()
+    version, generated_at = _stamp(rollup)
+    stale = (
+        version != cached.get(REGION_AVAILABILITY_VERSION_KEY)
+        or timezone.now() - generated_at > timedelta(seconds=_timeout())
+    )
+    if stale and cache.add(REGION_AVAILABILITY_LOCK_KEY, True, REFRESH_LOCK_TIMEOUT):
+        if getattr(settings, 'INVENTORY_ROLLUP_BACKGROUND', True):
+            threading.Thread(target=_refresh_in_background, daemon=True).start()
+        else:
+            rollup = _refresh_locked()
+    return rollup
+
+
+def region_availability(state=None, city=None, blood_group=None):
+    """Return the cached rollup, optionally filtered (case-insensitive for state/city)."""
+    rollup = get_region_availability()
+    states = rollup['regions']
+    if state:
+        state = _region_key(state)
+        states = {state: states[state]} if state in states else {}
+    if city:
+        city = _region_key(city)
+        cells = [cities[city] for cities in states.values() if city in cities]
+    else:
+        cells = [rows for cities in states.values() for rows in cities.values()]
+    results = [row for rows in cells for row in rows if not blood_group or row['blood_group'] == blood_group]
+    return {'generated_at': rollup['generated_at'], 'results': results}
+
+
+def invalidate_region_availability():
+    """Mark the rollup stale once the current transaction commits."""
+    transaction.on_commit(_bump_version)
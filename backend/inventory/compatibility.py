@@ -0,0 +1,124 @@
+"""
+ABO/Rh red-cell compatibility as precomputed bitmasks.
+
+Bits follow the order of ``Inventory.BLOOD_GROUPS``. ``donors.Donor`` and
+``requests.BloodRequest`` declare their own copies of the same eight codes,
+so the masks apply to their ``blood_group`` values too.
+"""
+from django.db.models import Q, Sum
+from django.db.models.functions import Coalesce
+
+from .models import Inventory
+
+
+GROUP_CODES = tuple(code for code, _ in Inventory.BLOOD_GROUPS)
+GROUP_BITS = {code: 1 << index for index, code in enumerate(GROUP_CODES)}
+
+
+def _can_donate(donor, recipient):
+    donor_abo, donor_rh = donor[:-1], donor[-1]
+    recipient_abo, recipient_rh = recipient[:-1], recipient[-1]
+    abo_ok = donor_abo == 'O' or donor_abo == recipient_abo or recipient_abo == 'AB'
+    rh_ok = donor_rh == '-' or recipient_rh == '+'
+    return abo_ok and rh_ok
+
+
+# recipient group -> mask of donor groups it can receive from
+DONOR_MASKS = {
+    recipient: sum(GROUP_BITS[donor] for donor in GROUP_CODES if _can_donate(donor, recipient))
+    for recipient in GROUP_CODES
+}
+# donor group -> mask of recipient groups it can give to
+RECIPIENT_MASKS = {
+    donor: sum(GROUP_BITS[recipient] for recipient in GROUP_CODES if _can_donate(donor, recipient))
+    for donor in GROUP_CODES
+}
+
+
+def groups_in_mask(mask):
+    return [code for code in GROUP_CODES if mask & GROUP_BITS[code]]
+
+
+def normalize_blood_group(value):
+    """Accept ``AB+`` as well as ``AB `` (an unencoded ``+`` in a query string).
+
+    A group without a sign (``A``) is ambiguous and returns ``None``.
+    """
+    if value is None:
+        return None
+    value = value.lstrip().upper()
+    if value.endswith(' '):
+        value = value.rstrip() + '+'
+    return value if value in GROUP_BITS else None
+
+
+def compatible_donor_groups(recipient_group):
+    """Groups whose units a recipient of ``recipient_group`` can receive."""
+    return groups_in_mask(DONOR_MASKS[recipient_group])
+
+
+def compatible_recipient_groups(donor_group):
+    """Groups that can receive units of ``donor_group``."""
+    return groups_in_mask(RECIPIENT_MASKS[donor_group])
+
+
+def find_compatible_stock(recipient_group, units_needed, city=None, state=None, limit=50):
+    """Banks that can cover ``units_needed`` from any compatible group, in one grouped query.
+
+    Only approved, operational banks are considered. Banks holding more of
+    the exact recipient group rank first, then by total compatible stock.
+    """
+    qs = Inventory.objects.filter(
+        blood_group__in=compatible_donor_groups(recipient_group),
+        units_available__gt=0,
+        bloodbank__status='approved',
+        bloodbank__is_operational=True,
+    )
+    if city:
+        qs = qs.filter(bloodbank__city__iexact=city)
+    if state:
+        qs = qs.filter(bloodbank__state__iexact=state)
+    rows = (
+        qs.values('bloodbank_id', 'bloodbank__name', 'bloodbank__city', 'bloodbank__state', 'bloodbank__phone')
+        .annotate(
+            compatible_units=Sum('units_available'),
+            exact_units=Coalesce(Sum('units_available', filter=Q(blood_group=recipient_group)), 0),
+        )
+        .filter(compatible_units__gte=units_needed)
+        .order_by('-exact_units', '-compatible_units', 'bloodbank_id')[:limit]
+    )
+    return [
+        {
+            'bloodbank': row['bloodbank_id'],
+            'bloodbank_name': row['bloodbank__name'],
+            'city': row['bloodbank__city'],
+            'state': row['bloodbank__state'],
+            'phone': row['bloodbank__phone'],
+            'exact_units': row['exact_units'],
+            'compatible_units': row['compatible_units'],
+            'exact_match_covers': row['exact_units'] >= units_needed,
+        }
+        for row in rows
+    ]
+
+
+def plan_allocation(stock, recipient_group, units_needed):
+    """Split ``units_needed`` across compatible groups from ``stock`` (``{group: units}``).
+
+    The exact group is used first, then the other compatible groups, scarcest
+    donors (those fewest recipients can use) first so universal O- is kept
+    for last. Returns ``{group: units}``, or ``None`` if compatible stock
+    cannot cover the request. ``stock`` is not modified.
+    """
+    def preference(group):
+        return (group != recipient_group, bin(RECIPIENT_MASKS[group]).count('1'), -stock.get(group, 0))
+
+    allocation, remaining = {}, units_needed
+    for group in sorted(compatible_donor_groups(recipient_group), key=preference):
+        take = min(stock.get(group, 0), remaining)
+        if take > 0:
+            allocation[group] = take
+            remaining -= take
+        if not remaining:
+            return allocation
+    return None
@@ -0,0 +1,212 @@
+"""
+In-process pub/sub for live inventory changes.
+
+``inventory.services`` calls ``publish_stock_changes`` for every balance
+write; once the transaction commits, the current balances of the touched rows
+are read in one query and one event per (bloodbank, blood_group) is handed to
+the configured broker. The SSE view in ``inventory.streams`` subscribes to the
+broker and forwards matching events to connected dashboards.
+
+The broker is pluggable through the ``INVENTORY_EVENTS_BACKEND`` setting (a
+dotted path to a ``BaseBroker`` subclass). ``LocalBroker`` keeps subscribers
+in memory and only reaches connections served by the same process, which is
+enough for the single ASGI process ``start.sh`` runs and for tests; run
+several workers behind a shared backend (e.g. Redis pub/sub) implementing the
+same interface.
+"""
+import asyncio
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Inventory
+
+
+DEFAULT_BACKEND = 'inventory.events.LocalBroker'
+DEFAULT_QUEUE_SIZE = 256
+
+
+class Subscription:
+    """Events for one bank, or for a city (optionally limited to some blood groups).
+
+    City subscriptions only receive events from approved, operational banks,
+    matching what ``/api/inventory/inventory/availability/`` reports.
+    """
+
+    def __init__(self, bloodbank_id=None, city=None, blood_groups=None, queue_size=DEFAULT_QUEUE_SIZE):
+        self.bloodbank_id = bloodbank_id
+        self.city = city.strip().lower() if city else None
+        self.blood_groups = set(blood_groups or ())
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.loop = asyncio.get_running_loop()
+        # Set when events were dropped because the client fell behind
+        self.overflowed = False
+
+    def matches(self, event):
+        if self.blood_groups and event['blood_group'] not in self.blood_groups:
+            return False
+        if self.bloodbank_id is not None:
+            return event['bloodbank'] == self.bloodbank_id
+        return event['listed'] and (event['city'] or '').lower() == self.city
+
+    def deliver(self, event):
+        """Queue ``event`` on the subscriber's loop; safe to call from any thread.
+
+        Does nothing once that loop is closed, so a publish after commit never
+        fails because a connection went away.
+        """
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            pass
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout=None):
+        """Next event, or ``None`` if nothing arrived within ``timeout`` seconds."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class BaseBroker:
+    """Interface for event brokers."""
+
+    @property
+    def active(self):
+        """Whether publishing is worth the balance lookup (e.g. anyone is listening)."""
+        return True
+
+    def publish(self, event):
+        raise NotImplementedError
+
+    def subscribe(self, subscription):
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription):
+        raise NotImplementedError
+
+
+class LocalBroker(BaseBroker):
+    """Delivers events to subscribers in the current process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_bank = defaultdict(set)
+        self._by_city = defaultdict(set)
+
+    @property
+    def active(self):
+        return bool(self._by_bank or self._by_city)
+
+    def _index(self, subscription):
+        if subscription.bloodbank_id is not None:
+            return self._by_bank, subscription.bloodbank_id
+        return self._by_city, subscription.city
+
+    def subscribe(self, subscription):
+        index, key = self._index(subscription)
+        with self._lock:
+            index[key].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        index, key = self._index(subscription)
+        with self._lock:
+            index[key].discard(subscription)
+            if not index[key]:
+                del index[key]
+
+    def publish(self, event):
+        with self._lock:
+            candidates = list(self._by_bank.get(event['bloodbank'], ()))
+            candidates += self._by_city.get((event['city'] or '').lower(), ())
+        for subscription in candidates:
+            if subscription.matches(event):
+                subscription.deliver(event)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                backend = getattr(settings, 'INVENTORY_EVENTS_BACKEND', DEFAULT_BACKEND)
+                _broker = import_string(backend)()
+    return _broker
+
+
+def reset_broker():
+    """Forget the current broker (e.g. after overriding the backend setting)."""
+    global _broker
+    _broker = None
+
+
+def inventory_events(changes, movement_type=None):
+    """Build one event per (bloodbank_id, blood_group) from ``(bloodbank_id, blood_group, delta)`` changes.
+
+    Deltas for the same row are summed; balances are read in one query.
+    """
+    deltas = defaultdict(int)
+    for bloodbank_id, blood_group, delta in changes:
+        deltas[(bloodbank_id, blood_group)] += delta
+    rows = (
+        Inventory.objects
+        .filter(bloodbank_id__in={key[0] for key in deltas}, blood_group__in={key[1] for key in deltas})
+        .values_list(
+            'bloodbank_id', 'blood_group', 'units_available', 'min_stock_level',
+            'bloodbank__name', 'bloodbank__city', 'bloodbank__state',
+            'bloodbank__status', 'bloodbank__is_operational',
+        )
+    )
+    at = timezone.now()
+    events = []
+    for bloodbank_id, blood_group, units, min_level, name, city, state, bank_status, operational in rows:
+        if (bloodbank_id, blood_group) not in deltas:
+            continue
+        events.append({
+            'bloodbank': bloodbank_id,
+            'bloodbank_name': name,
+            'city': city,
+            'state': state,
+            'blood_group': blood_group,
+            'movement_type': movement_type,
+            'delta': deltas[(bloodbank_id, blood_group)],
+            'units_available': units,
+            'min_stock_level': min_level,
+            'low_stock': units <= min_level,
+            'listed': bank_status == 'approved' and operational,
+            'at': at,
+        })
+    return events
+
+
+def publish_stock_changes(changes, movement_type=None):
+    """Publish balance changes once the current transaction commits.
+
+    Costs nothing while the broker reports no listeners.
+    """
+    if not changes:
+        return
+
+    def send():
+        broker = get_broker()
+        if not broker.active:
+            return
+        for event in inventory_events(changes, movement_type):
+            broker.publish(event)
+
+    transaction.on_commit(send)
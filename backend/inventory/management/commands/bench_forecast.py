@@ -0,0 +1,138 @@
+"""
+Benchmark the vectorized forecast on synthetic history.
+
+By default generates donation and request rows for N banks over the full
+history window in memory and times ``compute_forecast`` alone. With
+``--end-to-end`` the rows are written to the database inside a transaction
+instead, ``run_forecast`` is timed from the history queries to the upsert,
+and everything is rolled back.
+
+    python manage.py bench_forecast --banks 5000 --rows-per-bank-day 1
+    python manage.py bench_forecast --end-to-end --banks 100 --rows-per-bank-day 1
+"""
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from accounts.models import User
+from bloodbank.models import BloodBank
+from donors.models import Donation, Donor
+from inventory.compatibility import GROUP_CODES
+from inventory.forecasting import HISTORY_DAYS, N_GROUPS, compute_forecast, run_forecast
+from inventory.models import Inventory
+from requests.models import BloodRequest
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Time the stock forecast over synthetic multi-year history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--banks', type=int, default=5000)
+        parser.add_argument('--rows-per-bank-day', type=float, default=1.0,
+                            help='Average donation and request rows per bank per day')
+        parser.add_argument('--end-to-end', action='store_true',
+                            help='Seed the database and time run_forecast (data is rolled back)')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if not options['end_to_end']:
+            return self.compute_only(options)
+        try:
+            with transaction.atomic():
+                self.end_to_end(options)
+                raise Rollback
+        except Rollback:
+            self.stdout.write('Benchmark data rolled back.')
+
+    def compute_only(self, options):
+        rng = np.random.default_rng(options['seed'])
+        n_banks = options['banks']
+        n_rows = int(n_banks * HISTORY_DAYS * options['rows_per_bank_day'])
+        today = np.datetime64(timezone.localdate(), 'D').astype(np.int64)
+        bank_ids = np.arange(1, n_banks + 1, dtype=np.int64)
+
+        def history():
+            return (
+                rng.integers(1, n_banks + 1, n_rows),
+                rng.integers(0, N_GROUPS, n_rows),
+                today - rng.integers(0, HISTORY_DAYS, n_rows),
+                rng.integers(1, 4, n_rows).astype(np.float64),
+            )
+
+        supply, demand = history(), history()
+        stock = rng.integers(0, 200, (n_banks, N_GROUPS)).astype(np.float64)
+        self.stdout.write(f'{n_banks} banks, {n_rows} supply rows, {n_rows} demand rows')
+
+        started = time.perf_counter()
+        results = compute_forecast(bank_ids, stock, supply, demand, today)
+        elapsed = time.perf_counter() - started
+
+        covered = np.isfinite(results['days_of_cover']).sum()
+        self.stdout.write(self.style.SUCCESS(
+            f'Forecast {n_banks * N_GROUPS} series in {elapsed:.2f}s ({covered} with finite days of cover).'
+        ))
+
+    def end_to_end(self, options):
+        rng = np.random.default_rng(options['seed'])
+        n_banks = options['banks']
+        n_rows = int(n_banks * HISTORY_DAYS * options['rows_per_bank_day'])
+        today = timezone.localdate()
+        tag = f'bench{time.time_ns() % 10 ** 8}'
+
+        started = time.perf_counter()
+        users = User.objects.bulk_create([
+            User(username=f'{tag}-{i}', email=f'{tag}-{i}@bench.invalid', phone=f'{tag}{i}', user_type='bloodbank')
+            for i in range(n_banks + N_GROUPS)
+        ], batch_size=5000)
+        banks = BloodBank.objects.bulk_create([
+            BloodBank(user=user, name=f'Bench Bank {i}', registration_number=f'{tag}-{i}')
+            for i, user in enumerate(users[:n_banks])
+        ], batch_size=5000)
+        # One donor per group; supply only depends on the donor's group
+        donors = Donor.objects.bulk_create([
+            Donor(user=user, full_name=f'Bench Donor {group}', blood_group=group, date_of_birth=today.replace(year=1990),
+                  gender='M', phone='0', email=user.email, address='-', city='-', state='-', pincode='0',
+                  weight=70, emergency_contact='0')
+            for user, group in zip(users[n_banks:], GROUP_CODES)
+        ])
+        bank_ids = np.array([bank.pk for bank in banks])
+        days = [today - timedelta(days=int(n)) for n in range(HISTORY_DAYS)]
+
+        def picks():
+            return (bank_ids[rng.integers(0, n_banks, n_rows)].tolist(), rng.integers(0, N_GROUPS, n_rows).tolist(),
+                    rng.integers(0, HISTORY_DAYS, n_rows).tolist(), rng.integers(1, 4, n_rows).tolist())
+
+        Donation.objects.bulk_create((
+            Donation(donor=donors[group], bloodbank_id=bank_id, donation_date=days[day], units_donated=units,
+                     verified_by='bench')
+            for bank_id, group, day, units in zip(*picks())
+        ), batch_size=5000)
+        BloodRequest.objects.bulk_create((
+            BloodRequest(requester=users[0], bloodbank_id=bank_id, patient_name='Bench', blood_group=GROUP_CODES[group],
+                         units_required=units, urgency='normal', required_date=days[day], hospital_name='Bench',
+                         doctor_name='Bench', contact_number='0', reason='bench', status='fulfilled')
+            for bank_id, group, day, units in zip(*picks())
+        ), batch_size=5000)
+        Inventory.objects.bulk_create([
+            Inventory(bloodbank=bank, blood_group=group, units_available=int(rng.integers(0, 200)))
+            for bank in banks for group in GROUP_CODES
+        ], batch_size=5000)
+        self.stdout.write(f'Seeded {n_banks} banks, {n_rows} donations and {n_rows} requests '
+                          f'in {time.perf_counter() - started:.1f}s')
+
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            stored = run_forecast(today)
+            elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'run_forecast stored {stored} series in {elapsed:.2f}s with {len(captured)} queries.'
+        ))
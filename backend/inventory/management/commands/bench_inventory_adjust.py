@@ -0,0 +1,84 @@
+"""
+Stress benchmark for the inventory adjustment service.
+
+Spawns N concurrent writers that all increment the same (bloodbank, blood_group)
+row and verifies that no increment was lost.
+
+    python manage.py bench_inventory_adjust --writers 50 --increments 20
+"""
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+
+from accounts.models import User
+from bloodbank.models import BloodBank
+from inventory.models import Inventory
+from inventory.services import adjust_stock
+
+
+class Command(BaseCommand):
+    help = 'Run concurrent inventory increments and verify no updates are lost'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=50)
+        parser.add_argument('--increments', type=int, default=20, help='Increments per writer')
+        parser.add_argument('--blood-group', default='O-')
+
+    def handle(self, *args, **options):
+        writers = options['writers']
+        increments = options['increments']
+        blood_group = options['blood_group']
+
+        suffix = str(int(time.time() * 1000))
+        user = User.objects.create(
+            username=f'bench-{suffix}', email=f'bench-{suffix}@example.com',
+            phone=f'b{suffix}'[-15:], user_type='bloodbank',
+        )
+        bank = BloodBank.objects.create(user=user, name=f'Bench {suffix}', registration_number=f'BENCH-{suffix}')
+
+        errors = []
+        barrier = threading.Barrier(writers)
+
+        def writer():
+            try:
+                barrier.wait()
+                for _ in range(increments):
+                    for attempt in range(50):
+                        try:
+                            adjust_stock(bank.pk, blood_group, 1)
+                            break
+                        except OperationalError:
+                            # SQLite reports "database is locked" under heavy write contention
+                            if attempt == 49:
+                                raise
+                            time.sleep(0.01)
+            except Exception as e:  # pragma: no cover - reported below
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=writer) for _ in range(writers)]
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+
+        try:
+            expected = writers * increments
+            actual = Inventory.objects.get(bloodbank=bank, blood_group=blood_group).units_available
+            self.stdout.write(
+                f'{writers} writers x {increments} increments in {elapsed:.2f}s '
+                f'({expected / elapsed:.0f} adjustments/s)'
+            )
+            self.stdout.write(f'expected={expected} actual={actual}')
+            if errors:
+                raise CommandError(f'{len(errors)} writer(s) failed: {errors[0]}')
+            if actual != expected:
+                raise CommandError(f'Lost {expected - actual} increment(s)')
+            self.stdout.write(self.style.SUCCESS('No lost increments'))
+        finally:
+            user.delete()
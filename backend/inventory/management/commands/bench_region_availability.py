@@ -0,0 +1,113 @@
+"""
+Benchmark the region availability rollup under write traffic.
+
+Creates N approved blood banks (spread over states and cities, every blood
+group stocked), then interleaves availability reads with committed stock
+writes. Each write marks the rollup stale, so readers are served the stale
+copy while it is recomputed in the background. Reports the cold recompute
+time and read latency percentiles, then deletes the data.
+
+    python manage.py bench_region_availability --banks 10000 --reads 5000 --write-every 10
+"""
+import random
+import time
+
+import numpy as np
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from accounts.models import User
+from bloodbank.models import BloodBank
+from inventory.aggregates import (
+    REGION_AVAILABILITY_KEY, REGION_AVAILABILITY_LOCK_KEY, REGION_AVAILABILITY_STAMP_KEY, compute_region_availability,
+    region_availability,
+)
+from inventory.compatibility import GROUP_CODES
+from inventory.models import Inventory
+from inventory.services import adjust_stock
+
+
+class Command(BaseCommand):
+    help = 'Time region availability reads while stock writes keep invalidating the rollup'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--banks', type=int, default=10000)
+        parser.add_argument('--states', type=int, default=30)
+        parser.add_argument('--cities', type=int, default=40, help='Cities per state')
+        parser.add_argument('--reads', type=int, default=5000)
+        parser.add_argument('--write-every', type=int, default=10, help='Reads between committed writes')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        tag = f'bench{time.time_ns() % 10 ** 8}'
+        try:
+            self.run(tag, options)
+        finally:
+            started = time.perf_counter()
+            User.objects.filter(username__startswith=f'{tag}-').delete()
+            cache.delete_many([REGION_AVAILABILITY_KEY, REGION_AVAILABILITY_STAMP_KEY, REGION_AVAILABILITY_LOCK_KEY])
+            self.stdout.write(f'Benchmark data deleted in {time.perf_counter() - started:.1f}s.')
+
+    def report(self, label, timings):
+        timings = np.array(timings) * 1000
+        self.stdout.write(
+            f'{label}: p50 {np.percentile(timings, 50):.2f} ms, p95 {np.percentile(timings, 95):.2f} ms, '
+            f'p99 {np.percentile(timings, 99):.2f} ms, max {timings.max():.2f} ms'
+        )
+
+    def run(self, tag, options):
+        rng = random.Random(options['seed'])
+        n_banks = options['banks']
+        regions = [(f'State {s}', f'City {s}-{c}') for s in range(options['states']) for c in range(options['cities'])]
+
+        started = time.perf_counter()
+        users = User.objects.bulk_create([
+            User(username=f'{tag}-{i}', email=f'{tag}-{i}@bench.invalid', phone=f'{tag}{i}', user_type='bloodbank')
+            for i in range(n_banks)
+        ], batch_size=5000)
+        banks = BloodBank.objects.bulk_create([
+            BloodBank(user=user, name=f'Bench Bank {i}', registration_number=f'{tag}-{i}',
+                      state=regions[i % len(regions)][0], city=regions[i % len(regions)][1])
+            for i, user in enumerate(users)
+        ], batch_size=5000)
+        Inventory.objects.bulk_create([
+            Inventory(bloodbank=bank, blood_group=group, units_available=rng.randint(0, 40))
+            for bank in banks for group in GROUP_CODES
+        ], batch_size=5000)
+        self.stdout.write(f'Seeded {n_banks} banks ({n_banks * len(GROUP_CODES)} stock rows) '
+                          f'in {time.perf_counter() - started:.1f}s')
+
+        started = time.perf_counter()
+        rollup = compute_region_availability()
+        cells = sum(len(rows) for cities in rollup['regions'].values() for rows in cities.values())
+        self.stdout.write(f'Cold recompute: {(time.perf_counter() - started) * 1000:.1f} ms for {cells} cells')
+
+        cache.delete_many([REGION_AVAILABILITY_KEY, REGION_AVAILABILITY_STAMP_KEY])
+        region_availability()
+        city_reads, state_reads, all_reads = [], [], []
+        served = set()
+        writes = 0
+        for n in range(options['reads']):
+            if n % options['write_every'] == 0:
+                adjust_stock(rng.choice(banks).pk, rng.choice(GROUP_CODES), 1)
+                writes += 1
+            state, city = rng.choice(regions)
+            kind = rng.random()
+            started = time.perf_counter()
+            if kind < 0.8:
+                result = region_availability(state=state, city=city, blood_group=rng.choice(GROUP_CODES))
+                city_reads.append(time.perf_counter() - started)
+            elif kind < 0.95:
+                result = region_availability(state=state)
+                state_reads.append(time.perf_counter() - started)
+            else:
+                result = region_availability()
+                all_reads.append(time.perf_counter() - started)
+            served.add(result['generated_at'])
+
+        self.stdout.write(f'{options["reads"]} reads, {writes} committed writes, '
+                          f'{len(served)} distinct rollups served')
+        self.report('state + city + group', city_reads)
+        self.report('state', state_reads)
+        self.report('whole network', all_reads)
+        self.stdout.write(self.style.SUCCESS('Region availability benchmark complete'))
@@ -0,0 +1,21 @@
+"""
+Expire tracked blood bags past their ``expires_at`` and keep balances in sync.
+
+Meant to run periodically (e.g. every 15 minutes from cron or a scheduler):
+
+    python manage.py expire_blood_units [--batch-size N]
+"""
+from django.core.management.base import BaseCommand
+
+from inventory.services import expire_units
+
+
+class Command(BaseCommand):
+    help = 'Mark expired BloodUnits and record expiry movements in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        expired = expire_units(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Expired {expired} blood unit(s).'))
@@ -0,0 +1,25 @@
+"""
+Recompute projected days of cover for every bank and blood group.
+
+Meant to run nightly from cron or a scheduler:
+
+    python manage.py forecast_inventory [--batch-size N]
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from inventory.forecasting import run_forecast
+
+
+class Command(BaseCommand):
+    help = 'Refresh StockForecast from donation and request history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        rows = run_forecast(batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Stored {rows} forecast row(s) in {elapsed:.2f}s.'))
@@ -0,0 +1,93 @@
+"""
+Rebuild materialized ``Inventory`` balances by replaying the ``InventoryMovement`` ledger.
+
+The ledger is summed per (bloodbank, blood_group) in the database and the
+result is streamed back in chunks, so memory stays bounded however many
+movements exist. Each chunk costs one read of the current balances plus one
+bulk upsert of the rows that changed.
+
+    python manage.py rebuild_inventory [--bloodbank ID] [--chunk-size N] [--dry-run]
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Sum
+
+from inventory.aggregates import invalidate_region_availability
+from inventory.models import Inventory, InventoryMovement
+
+
+class Command(BaseCommand):
+    help = 'Recompute Inventory balances from the InventoryMovement ledger'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bloodbank', type=int, help='Only rebuild this blood bank')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without writing')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        dry_run = options['dry_run']
+
+        movements = InventoryMovement.objects.all()
+        balances = Inventory.objects.all()
+        if options['bloodbank']:
+            movements = movements.filter(bloodbank_id=options['bloodbank'])
+            balances = balances.filter(bloodbank_id=options['bloodbank'])
+
+        totals = (
+            movements.values('bloodbank_id', 'blood_group')
+            .annotate(total=Sum('quantity'))
+            .order_by('bloodbank_id', 'blood_group')
+            .iterator(chunk_size=chunk_size)
+        )
+
+        scanned = changed = 0
+        with transaction.atomic():
+            chunk = []
+            for row in totals:
+                chunk.append(row)
+                if len(chunk) >= chunk_size:
+                    changed += self._apply(chunk, dry_run)
+                    scanned += len(chunk)
+                    chunk = []
+            if chunk:
+                changed += self._apply(chunk, dry_run)
+                scanned += len(chunk)
+
+            # Balances with no movements at all must be zero
+            orphans = balances.exclude(units_available=0).filter(
+                ~Exists(InventoryMovement.objects.filter(
+                    bloodbank_id=OuterRef('bloodbank_id'), blood_group=OuterRef('blood_group'),
+                ))
+            )
+            zeroed = orphans.count() if dry_run else orphans.update(units_available=0)
+            if not dry_run and (changed or zeroed):
+                invalidate_region_availability()
+
+        verb = 'Would update' if dry_run else 'Updated'
+        self.stdout.write(self.style.SUCCESS(
+            f'Replayed {scanned} balance(s). {verb} {changed} drifted and {zeroed} orphaned row(s).'
+        ))
+
+    def _apply(self, chunk, dry_run):
+        # Totals arrive ordered by bank, so one range read covers the whole chunk
+        current = {
+            (bank_id, group): units
+            for bank_id, group, units in Inventory.objects.filter(
+                bloodbank_id__gte=chunk[0]['bloodbank_id'], bloodbank_id__lte=chunk[-1]['bloodbank_id'],
+            ).values_list('bloodbank_id', 'blood_group', 'units_available')
+        }
+        drifted = [
+            Inventory(bloodbank_id=row['bloodbank_id'], blood_group=row['blood_group'], units_available=row['total'])
+            for row in chunk
+            # A missing row whose ledger sums to zero was closed (``close_stock``), not lost
+            if current.get((row['bloodbank_id'], row['blood_group']), 0) != row['total']
+        ]
+        if drifted and not dry_run:
+            Inventory.objects.bulk_create(
+                drifted,
+                update_conflicts=True,
+                unique_fields=['bloodbank', 'blood_group'],
+                update_fields=['units_available', 'last_updated'],
+            )
+        return len(drifted)
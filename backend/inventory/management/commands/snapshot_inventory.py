@@ -0,0 +1,26 @@
+"""
+Sample every inventory balance into the packed stock history and prune it.
+
+Meant to run hourly from cron or a scheduler:
+
+    python manage.py snapshot_inventory [--no-compact]
+"""
+from django.core.management.base import BaseCommand
+
+from inventory.timeseries import compact_series, record_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Record hourly/daily StockSeries samples and drop rows past retention'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Banks per transaction')
+        parser.add_argument('--no-compact', action='store_true', help='Skip retention pruning')
+
+    def handle(self, *args, **options):
+        sampled = record_snapshot(batch_size=options['batch_size'])
+        self.stdout.write(f'Sampled {sampled} series.')
+        if not options['no_compact']:
+            hourly, daily = compact_series()
+            self.stdout.write(f'Pruned {hourly} hourly and {daily} daily row(s).')
+        self.stdout.write(self.style.SUCCESS('Snapshot complete.'))
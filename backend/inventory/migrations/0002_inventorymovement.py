@@ -0,0 +1,57 @@
+# Generated by Django 4.2.7 on 2026-10-17 11:39
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def seed_opening_balances(apps, schema_editor):
+    """Record existing balances as opening movements so the ledger sums match."""
+    Inventory = apps.get_model('inventory', 'Inventory')
+    InventoryMovement = apps.get_model('inventory', 'InventoryMovement')
+    batch = []
+    for inv in Inventory.objects.exclude(units_available=0).iterator(chunk_size=2000):
+        batch.append(InventoryMovement(
+            bloodbank_id=inv.bloodbank_id,
+            blood_group=inv.blood_group,
+            movement_type='adjustment',
+            quantity=inv.units_available,
+            note='Opening balance',
+            created_at=inv.last_updated,
+        ))
+        if len(batch) >= 2000:
+            InventoryMovement.objects.bulk_create(batch)
+            batch = []
+    InventoryMovement.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('bloodbank', '0006_alter_bloodbank_status_alter_campregistration_status'),
+        ('inventory', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('blood_group', models.CharField(choices=[('A+', 'A+'), ('A-', 'A-'), ('B+', 'B+'), ('B-', 'B-'), ('O+', 'O+'), ('O-', 'O-'), ('AB+', 'AB+'), ('AB-', 'AB-')], max_length=3)),
+                ('movement_type', models.CharField(choices=[('donation', 'Donation'), ('issue', 'Issue'), ('adjustment', 'Adjustment'), ('expiry', 'Expiry'), ('transfer', 'Transfer')], max_length=20)),
+                ('quantity', models.IntegerField()),
+                ('reference', models.CharField(blank=True, max_length=64)),
+                ('note', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('bloodbank', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inventory_movements', to='bloodbank.bloodbank')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at', '-id'],
+                'indexes': [models.Index(fields=['bloodbank', 'blood_group', 'created_at'], name='inventory_i_bloodba_efdc75_idx')],
+            },
+        ),
+        migrations.RunPython(seed_opening_balances, migrations.RunPython.noop),
+    ]
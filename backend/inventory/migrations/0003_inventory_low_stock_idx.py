@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 11:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0002_inventorymovement'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='inventory',
+            index=models.Index(condition=models.Q(('units_available__lte', models.F('min_stock_level'))), fields=['blood_group', 'bloodbank'], name='inventory_low_stock_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-17 11:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donors', '0004_alter_appointment_options_appointment_updated_at_and_more'),
+        ('bloodbank', '0006_alter_bloodbank_status_alter_campregistration_status'),
+        ('inventory', '0003_inventory_low_stock_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BloodUnit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bag_id', models.CharField(max_length=40, unique=True)),
+                ('blood_group', models.CharField(choices=[('A+', 'A+'), ('A-', 'A-'), ('B+', 'B+'), ('B-', 'B-'), ('O+', 'O+'), ('O-', 'O-'), ('AB+', 'AB+'), ('AB-', 'AB-')], max_length=3)),
+                ('component', models.CharField(choices=[('whole_blood', 'Whole Blood'), ('packed_red_cells', 'Packed Red Cells'), ('platelets', 'Platelets'), ('plasma', 'Fresh Frozen Plasma')], default='whole_blood', max_length=20)),
+                ('collected_at', models.DateTimeField()),
+                ('expires_at', models.DateTimeField()),
+                ('status', models.CharField(choices=[('available', 'Available'), ('issued', 'Issued'), ('expired', 'Expired'), ('discarded', 'Discarded')], default='available', max_length=20)),
+                ('issued_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('bloodbank', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='blood_units', to='bloodbank.bloodbank')),
+                ('donation', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='blood_units', to='donors.donation')),
+            ],
+            options={
+                'ordering': ['expires_at'],
+                'indexes': [models.Index(fields=['bloodbank', 'blood_group', 'status', 'expires_at'], name='bloodunit_fefo_idx'), models.Index(fields=['status', 'expires_at'], name='bloodunit_expiry_idx')],
+            },
+        ),
+    ]
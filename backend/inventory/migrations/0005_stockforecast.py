@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-17 11:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bloodbank', '0006_alter_bloodbank_status_alter_campregistration_status'),
+        ('inventory', '0004_bloodunit'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockForecast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('blood_group', models.CharField(choices=[('A+', 'A+'), ('A-', 'A-'), ('B+', 'B+'), ('B-', 'B-'), ('O+', 'O+'), ('O-', 'O-'), ('AB+', 'AB+'), ('AB-', 'AB-')], max_length=3)),
+                ('units_available', models.IntegerField(default=0)),
+                ('avg_daily_supply', models.FloatField(default=0)),
+                ('avg_daily_demand', models.FloatField(default=0)),
+                ('projected_daily_supply', models.FloatField(default=0)),
+                ('projected_daily_demand', models.FloatField(default=0)),
+                ('days_of_cover', models.FloatField(blank=True, null=True)),
+                ('computed_at', models.DateTimeField()),
+                ('bloodbank', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_forecasts', to='bloodbank.bloodbank')),
+            ],
+            options={
+                'ordering': ['days_of_cover'],
+                'indexes': [models.Index(fields=['days_of_cover'], name='forecast_cover_idx')],
+                'unique_together': {('bloodbank', 'blood_group')},
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-17 11:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bloodbank', '0006_alter_bloodbank_status_alter_campregistration_status'),
+        ('inventory', '0005_stockforecast'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockSeries',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('blood_group', models.CharField(choices=[('A+', 'A+'), ('A-', 'A-'), ('B+', 'B+'), ('B-', 'B-'), ('O+', 'O+'), ('O-', 'O-'), ('AB+', 'AB+'), ('AB-', 'AB-')], max_length=3)),
+                ('resolution', models.CharField(choices=[('hour', 'Hourly'), ('day', 'Daily')], max_length=4)),
+                ('start', models.DateField()),
+                ('data', models.BinaryField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('bloodbank', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_series', to='bloodbank.bloodbank')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['resolution', 'start'], name='stockseries_retention_idx')],
+                'unique_together': {('bloodbank', 'blood_group', 'resolution', 'start')},
+            },
+        ),
+    ]
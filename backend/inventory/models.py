@@ -2,8 +2,17 @@ from django.db import models
 
 # Create your models here.
 from django.db import models
+from django.db.models import F, Q
+from django.utils import timezone
+from accounts.models import User
 from bloodbank.models import BloodBank
 
+class InventoryQuerySet(models.QuerySet):
+    def low_stock(self):
+        # Database-side equivalent of Inventory.is_low_stock; served by the partial index below
+        return self.filter(units_available__lte=F('min_stock_level'))
+
+
 class Inventory(models.Model):
     BLOOD_GROUPS = (
         ('A+', 'A+'),
@@ -23,13 +32,172 @@ class Inventory(models.Model):
     last_updated = models.DateTimeField(auto_now=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = InventoryQuerySet.as_manager()
+
     class Meta:
         unique_together = ('bloodbank', 'blood_group')
         ordering = ['blood_group']
+        indexes = [
+            models.Index(
+                fields=['blood_group', 'bloodbank'],
+                condition=Q(units_available__lte=F('min_stock_level')),
+                name='inventory_low_stock_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.bloodbank.name} - {self.blood_group}: {self.units_available} units"
 
     @property
     def is_low_stock(self):
-        return self.units_available <= self.min_stock_level
\ No newline at end of file
+        return self.units_available <= self.min_stock_level
+
+
+class InventoryMovement(models.Model):
+    """Append-only ledger of stock changes; ``Inventory`` holds the running balance."""
+    DONATION = 'donation'
+    ISSUE = 'issue'
+    ADJUSTMENT = 'adjustment'
+    EXPIRY = 'expiry'
+    TRANSFER = 'transfer'
+
+    MOVEMENT_TYPES = (
+        (DONATION, 'Donation'),
+        (ISSUE, 'Issue'),
+        (ADJUSTMENT, 'Adjustment'),
+        (EXPIRY, 'Expiry'),
+        (TRANSFER, 'Transfer'),
+    )
+
+    bloodbank = models.ForeignKey(BloodBank, on_delete=models.CASCADE, related_name='inventory_movements')
+    blood_group = models.CharField(max_length=3, choices=Inventory.BLOOD_GROUPS)
+    movement_type = models.CharField(max_length=20, choices=MOVEMENT_TYPES)
+    quantity = models.IntegerField()  # signed: positive adds stock, negative removes it
+    reference = models.CharField(max_length=64, blank=True)
+    note = models.TextField(blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-created_at', '-id']
+        indexes = [
+            models.Index(fields=['bloodbank', 'blood_group', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.bloodbank_id} {self.blood_group} {self.movement_type} {self.quantity:+d}"
+
+
+class BloodUnit(models.Model):
+    """A single collected bag, tracked from collection to issue or expiry."""
+    WHOLE_BLOOD = 'whole_blood'
+    PACKED_RED_CELLS = 'packed_red_cells'
+    PLATELETS = 'platelets'
+    PLASMA = 'plasma'
+
+    COMPONENTS = (
+        (WHOLE_BLOOD, 'Whole Blood'),
+        (PACKED_RED_CELLS, 'Packed Red Cells'),
+        (PLATELETS, 'Platelets'),
+        (PLASMA, 'Fresh Frozen Plasma'),
+    )
+
+    # Storage shelf life per component, in days
+    SHELF_LIFE_DAYS = {
+        WHOLE_BLOOD: 35,
+        PACKED_RED_CELLS: 42,
+        PLATELETS: 5,
+        PLASMA: 365,
+    }
+
+    AVAILABLE = 'available'
+    ISSUED = 'issued'
+    EXPIRED = 'expired'
+    DISCARDED = 'discarded'
+
+    STATUS_CHOICES = (
+        (AVAILABLE, 'Available'),
+        (ISSUED, 'Issued'),
+        (EXPIRED, 'Expired'),
+        (DISCARDED, 'Discarded'),
+    )
+
+    bag_id = models.CharField(max_length=40, unique=True)
+    bloodbank = models.ForeignKey(BloodBank, on_delete=models.CASCADE, related_name='blood_units')
+    blood_group = models.CharField(max_length=3, choices=Inventory.BLOOD_GROUPS)
+    component = models.CharField(max_length=20, choices=COMPONENTS, default=WHOLE_BLOOD)
+    donation = models.ForeignKey('donors.Donation', on_delete=models.SET_NULL, null=True, blank=True, related_name='blood_units')
+    collected_at = models.DateTimeField()
+    expires_at = models.DateTimeField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=AVAILABLE)
+    issued_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['expires_at']
+        indexes = [
+            # First-expired-first-out picking within a bank and group
+            models.Index(fields=['bloodbank', 'blood_group', 'status', 'expires_at'], name='bloodunit_fefo_idx'),
+            # Network-wide expiry sweep
+            models.Index(fields=['status', 'expires_at'], name='bloodunit_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.bag_id} ({self.blood_group} {self.get_component_display()}) - {self.status}"
+
+
+class StockForecast(models.Model):
+    """Nightly projection of days of cover per bank and blood group (see inventory.forecasting)."""
+    bloodbank = models.ForeignKey(BloodBank, on_delete=models.CASCADE, related_name='stock_forecasts')
+    blood_group = models.CharField(max_length=3, choices=Inventory.BLOOD_GROUPS)
+    units_available = models.IntegerField(default=0)
+    avg_daily_supply = models.FloatField(default=0)  # moving average of donated units per day
+    avg_daily_demand = models.FloatField(default=0)  # moving average of requested units per day
+    projected_daily_supply = models.FloatField(default=0)  # seasonally adjusted, next horizon
+    projected_daily_demand = models.FloatField(default=0)
+    days_of_cover = models.FloatField(null=True, blank=True)  # null when stock is not being depleted
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('bloodbank', 'blood_group')
+        ordering = ['days_of_cover']
+        indexes = [
+            models.Index(fields=['days_of_cover'], name='forecast_cover_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.bloodbank_id} {self.blood_group}: {self.days_of_cover} days"
+
+
+class StockSeries(models.Model):
+    """Packed stock history for one bank and blood group (see inventory.timeseries).
+
+    ``data`` holds little-endian int32 values, -1 meaning no sample:
+    hourly rows cover one day (24 balances, kept for a week); daily rows
+    cover one calendar year as 366 (min, max, close) triples.
+    """
+    HOURLY = 'hour'
+    DAILY = 'day'
+
+    RESOLUTIONS = (
+        (HOURLY, 'Hourly'),
+        (DAILY, 'Daily'),
+    )
+
+    bloodbank = models.ForeignKey(BloodBank, on_delete=models.CASCADE, related_name='stock_series')
+    blood_group = models.CharField(max_length=3, choices=Inventory.BLOOD_GROUPS)
+    resolution = models.CharField(max_length=4, choices=RESOLUTIONS)
+    start = models.DateField()  # the day for hourly rows, 1 January for daily rows
+    data = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # The unique index doubles as the range-read index for charts
+        unique_together = ('bloodbank', 'blood_group', 'resolution', 'start')
+        indexes = [
+            # Retention pruning
+            models.Index(fields=['resolution', 'start'], name='stockseries_retention_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.bloodbank_id} {self.blood_group} {self.resolution} from {self.start}"
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Inventory
+from .models import BloodUnit, Inventory, InventoryMovement, StockForecast
 
 
 class InventorySerializer(serializers.ModelSerializer):
@@ -23,3 +23,51 @@ class InventorySerializer(serializers.ModelSerializer):
         return value
 
 
+class InventoryMovementSerializer(serializers.ModelSerializer):
+    # Manual movements: banks may record adjustments, expiries and transfers;
+    # donation and issue movements are written by their own workflows.
+    MANUAL_TYPES = (InventoryMovement.ADJUSTMENT, InventoryMovement.EXPIRY, InventoryMovement.TRANSFER)
+
+    to_bloodbank = serializers.IntegerField(write_only=True, required=False, help_text="Receiving blood bank ID for transfers")
+
+    class Meta:
+        model = InventoryMovement
+        fields = '__all__'
+        read_only_fields = ('bloodbank', 'reference', 'created_by', 'created_at')
+
+    def validate_to_bloodbank(self, value):
+        from bloodbank.models import BloodBank
+        if not BloodBank.objects.filter(id=value).exists():
+            raise serializers.ValidationError(f'Blood bank with ID {value} does not exist.')
+        return value
+
+    def validate(self, data):
+        movement_type = data.get('movement_type')
+        quantity = data.get('quantity')
+        if movement_type not in self.MANUAL_TYPES:
+            raise serializers.ValidationError({'movement_type': [f'Must be one of: {", ".join(self.MANUAL_TYPES)}']})
+        if not quantity:
+            raise serializers.ValidationError({'quantity': ['quantity cannot be zero']})
+        if movement_type in (InventoryMovement.EXPIRY, InventoryMovement.TRANSFER) and quantity < 0:
+            raise serializers.ValidationError({'quantity': ['Use a positive quantity for expiries and transfers']})
+        if movement_type == InventoryMovement.TRANSFER and not data.get('to_bloodbank'):
+            raise serializers.ValidationError({'to_bloodbank': ['to_bloodbank is required for transfers']})
+        return data
+
+
+class BloodUnitSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = BloodUnit
+        fields = '__all__'
+        read_only_fields = ('bag_id', 'bloodbank', 'blood_group', 'donation', 'collected_at',
+                            'expires_at', 'status', 'issued_at', 'created_at')
+
+
+
+
+class StockForecastSerializer(serializers.ModelSerializer):
+    bloodbank_name = serializers.CharField(source='bloodbank.name', read_only=True)
+
+    class Meta:
+        model = StockForecast
+        fields = '__all__'
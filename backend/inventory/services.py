@@ -0,0 +1,523 @@
+"""
+Inventory adjustment service.
+
+Every change to ``Inventory.units_available`` (donation intake, manual stock
+entry, fulfilment) goes through this module. Each change appends one row to
+the ``InventoryMovement`` ledger and applies the same signed quantity to the
+materialized ``Inventory`` balance with a single atomic statement, so
+concurrent writers never lose updates and balances can always be rebuilt by
+replaying the ledger (see the ``rebuild_inventory`` command).
+
+Banks that track individual bags (``BloodUnit``) issue and expire them here
+too, so bag status and balances move together.
+"""
+from datetime import datetime, time, timedelta
+
+from django.db import connection, transaction
+from django.db.models import Case, Count, F, IntegerField, Q, Sum, Value, When, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .aggregates import invalidate_region_availability
+from .events import publish_stock_changes
+from .models import BloodUnit, Inventory, InventoryMovement
+
+
+DEFAULT_MIN_STOCK_LEVEL = 5
+
+
+class InsufficientStock(Exception):
+    """Raised when a decrement would take a balance below zero."""
+
+    def __init__(self, blood_group, requested):
+        self.blood_group = blood_group
+        self.requested = requested
+        super().__init__(f'Insufficient {blood_group} stock for {requested} unit(s)')
+
+
+def _bank_id(bloodbank):
+    return getattr(bloodbank, 'pk', bloodbank)
+
+
+def _upsert(rows, set_min_level=False, movement_type=None):
+    """Add signed quantities to inventory rows with one ``INSERT ... ON CONFLICT`` statement.
+
+    ``rows`` is a list of ``(bloodbank_id, blood_group, delta, min_stock_level)``.
+    Missing rows are created with ``delta`` as their balance; existing rows
+    get ``delta`` added in the database. ``min_stock_level`` only replaces the
+    existing value when ``set_min_level`` is true. Non-zero deltas are
+    published to live subscribers (see ``inventory.events``) after commit.
+    Supported by both PostgreSQL and SQLite >= 3.24.
+    """
+    if not rows:
+        return
+    qn = connection.ops.quote_name
+    table = qn(Inventory._meta.db_table)
+    units = qn('units_available')
+    min_level = qn('min_stock_level')
+    last_updated = qn('last_updated')
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+
+    assignments = f'{units} = {table}.{units} + excluded.{units}'
+    if set_min_level:
+        assignments += f', {min_level} = excluded.{min_level}'
+
+    placeholders = ', '.join(['(%s, %s, %s, %s, %s, %s)'] * len(rows))
+    params = []
+    for bloodbank_id, blood_group, delta, min_stock_level in rows:
+        params.extend([bloodbank_id, blood_group, delta, min_stock_level, now, now])
+
+    sql = (
+        f'INSERT INTO {table} ({qn("bloodbank_id")}, {qn("blood_group")}, {units}, {min_level}, '
+        f'{last_updated}, {qn("created_at")}) VALUES {placeholders} '
+        f'ON CONFLICT ({qn("bloodbank_id")}, {qn("blood_group")}) DO UPDATE SET '
+        f'{assignments}, {last_updated} = excluded.{last_updated}'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+    invalidate_region_availability()
+    publish_stock_changes([row[:3] for row in rows if row[2]], movement_type)
+
+
+def _decrement(bloodbank_id, blood_group, units, movement_type=None):
+    """Conditionally remove ``units``; raises ``InsufficientStock`` if the balance is too low."""
+    updated = Inventory.objects.filter(
+        bloodbank_id=bloodbank_id,
+        blood_group=blood_group,
+        units_available__gte=units,
+    ).update(units_available=F('units_available') - units, last_updated=timezone.now())
+    if not updated:
+        raise InsufficientStock(blood_group, units)
+    invalidate_region_availability()
+    publish_stock_changes([(bloodbank_id, blood_group, -units)], movement_type)
+
+
+def _remove_clamped(units, movement_type):
+    """Take up to ``units[(bloodbank_id, blood_group)]`` from each balance, never below zero.
+
+    For removals that must not fail, like the expiry sweep. One locking read
+    and one ``UPDATE`` for every row; missing rows are left alone. Returns
+    the units actually removed per key (only non-zero entries). Must run
+    inside the caller's transaction.
+    """
+    keys = Q()
+    for bloodbank_id, blood_group in units:
+        keys |= Q(bloodbank_id=bloodbank_id, blood_group=blood_group)
+    removed = {}
+    for bloodbank_id, blood_group, available in (
+        Inventory.objects.select_for_update().filter(keys)
+        .values_list('bloodbank_id', 'blood_group', 'units_available')
+    ):
+        taken = min(available, units[(bloodbank_id, blood_group)])
+        if taken:
+            removed[(bloodbank_id, blood_group)] = taken
+    if not removed:
+        return removed
+
+    keys, amounts = Q(), []
+    for (bloodbank_id, blood_group), taken in removed.items():
+        keys |= Q(bloodbank_id=bloodbank_id, blood_group=blood_group)
+        amounts.append(When(bloodbank_id=bloodbank_id, blood_group=blood_group, then=Value(taken)))
+    Inventory.objects.filter(keys).update(
+        units_available=F('units_available') - Case(*amounts, output_field=IntegerField()),
+        last_updated=timezone.now(),
+    )
+    invalidate_region_availability()
+    publish_stock_changes([(bloodbank_id, group, -taken) for (bloodbank_id, group), taken in removed.items()],
+                          movement_type)
+    return removed
+
+
+def _settle_bags(bloodbank_id, blood_groups, movement_type, to_bloodbank_id=None):
+    """Keep a bank's available bags within its balance after stock left without naming bags.
+
+    Manual issue and expiry, transfers and lower stock counts reduce the
+    balance but not bag statuses, and the expiry sweep would later take the
+    same units again. Per group, the first-expiring bags beyond the balance
+    are marked issued, expired or discarded to match the movement, or moved
+    to the receiving bank for a transfer. Two grouped reads, plus one
+    ``UPDATE`` when bags exceed the balance.
+    """
+    bags = dict(
+        BloodUnit.objects.filter(bloodbank_id=bloodbank_id, blood_group__in=blood_groups, status=BloodUnit.AVAILABLE)
+        .values('blood_group')
+        .annotate(count=Count('id'))
+        .values_list('blood_group', 'count')
+        .order_by()
+    )
+    if not bags:
+        return
+    balances = dict(
+        Inventory.objects.filter(bloodbank_id=bloodbank_id, blood_group__in=list(bags))
+        .values_list('blood_group', 'units_available')
+    )
+    excess = {group: count - balances.get(group, 0) for group, count in bags.items() if count > balances.get(group, 0)}
+    if not excess:
+        return
+
+    ranked = (
+        BloodUnit.objects.filter(bloodbank_id=bloodbank_id, blood_group__in=list(excess), status=BloodUnit.AVAILABLE)
+        .annotate(position=Window(RowNumber(), partition_by=[F('blood_group')], order_by=F('expires_at').asc()))
+        .filter(position__lte=max(excess.values()))
+        .values_list('id', 'blood_group', 'position')
+    )
+    bag_ids = [bag_id for bag_id, group, position in ranked if position <= excess[group]]
+    if to_bloodbank_id is not None:
+        changes = {'bloodbank_id': to_bloodbank_id}
+    elif movement_type == InventoryMovement.ISSUE:
+        changes = {'status': BloodUnit.ISSUED, 'issued_at': timezone.now()}
+    elif movement_type == InventoryMovement.EXPIRY:
+        changes = {'status': BloodUnit.EXPIRED}
+    else:
+        changes = {'status': BloodUnit.DISCARDED}
+    BloodUnit.objects.filter(id__in=bag_ids).update(**changes)
+
+
+def adjust_stock(bloodbank, blood_group, delta, movement_type=InventoryMovement.ADJUSTMENT,
+                 reference='', note='', created_by=None):
+    """Record a movement of ``delta`` units (may be negative) and apply it to the balance.
+
+    Costs one ledger insert plus one balance statement. Positive deltas upsert
+    the balance row; negative deltas are a conditional ``UPDATE`` that only
+    matches when enough stock is available, otherwise ``InsufficientStock`` is
+    raised and nothing is written, and then retire any tracked bags the
+    balance no longer covers (``_settle_bags``). Returns the ledger row
+    (``None`` for a zero delta).
+    """
+    if not delta:
+        return
+    bloodbank_id = _bank_id(bloodbank)
+    with transaction.atomic():
+        if delta > 0:
+            _upsert([(bloodbank_id, blood_group, delta, DEFAULT_MIN_STOCK_LEVEL)], movement_type=movement_type)
+        else:
+            _decrement(bloodbank_id, blood_group, -delta, movement_type)
+            _settle_bags(bloodbank_id, [blood_group], movement_type)
+        return InventoryMovement.objects.create(
+            bloodbank_id=bloodbank_id,
+            blood_group=blood_group,
+            movement_type=movement_type,
+            quantity=delta,
+            reference=reference,
+            note=note,
+            created_by=created_by,
+        )
+
+
+def reconcile_stock(bloodbank, rows, note='', created_by=None):
+    """Apply a counted stock sheet (one row per blood group) for a bank.
+
+    ``rows`` are dicts with ``blood_group``, ``units_available`` and optionally
+    ``min_stock_level``; blood groups must be unique. The difference from each
+    current balance is recorded as an ``adjustment`` movement and applied
+    incrementally, so the ledger and the balance agree even when other writers
+    change a row at the same time. Costs a fixed number of statements whatever
+    the row count: one locking read, one bulk upsert and one bulk ledger insert.
+
+    Returns one result dict per row, in input order.
+    """
+    bloodbank_id = _bank_id(bloodbank)
+    with transaction.atomic():
+        current = {
+            group: (units, min_level)
+            for group, units, min_level in Inventory.objects.select_for_update()
+            .filter(bloodbank_id=bloodbank_id, blood_group__in=[row['blood_group'] for row in rows])
+            .values_list('blood_group', 'units_available', 'min_stock_level')
+        }
+
+        upserts, movements, results = [], [], []
+        for row in rows:
+            group = row['blood_group']
+            previous, previous_min = current.get(group, (None, DEFAULT_MIN_STOCK_LEVEL))
+            min_level = row.get('min_stock_level', previous_min)
+            delta = row['units_available'] - (previous or 0)
+            upserts.append((bloodbank_id, group, delta, min_level))
+            if delta:
+                movements.append(InventoryMovement(
+                    bloodbank_id=bloodbank_id,
+                    blood_group=group,
+                    movement_type=InventoryMovement.ADJUSTMENT,
+                    quantity=delta,
+                    note=note,
+                    created_by=created_by,
+                ))
+            if previous is None:
+                outcome = 'created'
+            elif delta or min_level != previous_min:
+                outcome = 'updated'
+            else:
+                outcome = 'unchanged'
+            results.append({
+                'blood_group': group,
+                'status': outcome,
+                'previous_units': previous,
+                'units_available': row['units_available'],
+                'min_stock_level': min_level,
+                'delta': delta,
+            })
+
+        _upsert(upserts, set_min_level=True, movement_type=InventoryMovement.ADJUSTMENT)
+        InventoryMovement.objects.bulk_create(movements)
+        lowered = [movement.blood_group for movement in movements if movement.quantity < 0]
+        if lowered:
+            _settle_bags(bloodbank_id, lowered, InventoryMovement.ADJUSTMENT)
+    return results
+
+
+def set_stock(bloodbank, blood_group, units_available, min_stock_level=DEFAULT_MIN_STOCK_LEVEL,
+              note='', created_by=None):
+    """Set a bank's counted balance for one blood group (see ``reconcile_stock``)."""
+    row = {'blood_group': blood_group, 'units_available': units_available, 'min_stock_level': min_stock_level}
+    return reconcile_stock(bloodbank, [row], note=note, created_by=created_by)[0]
+
+
+def transfer_stock(from_bloodbank, to_bloodbank, blood_group, units, note='', created_by=None):
+    """Move ``units`` between two banks as a pair of ``transfer`` movements (returned out, in)."""
+    from_id = _bank_id(from_bloodbank)
+    to_id = _bank_id(to_bloodbank)
+    with transaction.atomic():
+        _decrement(from_id, blood_group, units, InventoryMovement.TRANSFER)
+        _upsert([(to_id, blood_group, units, DEFAULT_MIN_STOCK_LEVEL)], movement_type=InventoryMovement.TRANSFER)
+        _settle_bags(from_id, [blood_group], InventoryMovement.TRANSFER, to_bloodbank_id=to_id)
+        return InventoryMovement.objects.bulk_create([
+            InventoryMovement(
+                bloodbank_id=from_id, blood_group=blood_group, movement_type=InventoryMovement.TRANSFER,
+                quantity=-units, reference=f'to:{to_id}', note=note, created_by=created_by,
+            ),
+            InventoryMovement(
+                bloodbank_id=to_id, blood_group=blood_group, movement_type=InventoryMovement.TRANSFER,
+                quantity=units, reference=f'from:{from_id}', note=note, created_by=created_by,
+            ),
+        ])
+
+
+def close_stock(bloodbank, blood_group, note='', created_by=None):
+    """Delete a bank's balance row for ``blood_group``, booking what is left as a closing ``adjustment``.
+
+    The row is locked, taken to zero through ``adjust_stock`` (retiring any
+    tracked bags) and then deleted, so the ledger still sums to the balance
+    and ``rebuild_inventory`` does not bring the row back. Returns the closing
+    movement (``None`` when the row was already empty).
+    """
+    bloodbank_id = _bank_id(bloodbank)
+    with transaction.atomic():
+        row = Inventory.objects.select_for_update().filter(bloodbank_id=bloodbank_id, blood_group=blood_group)
+        units = row.values_list('units_available', flat=True).first()
+        if units is None:
+            raise Inventory.DoesNotExist(f'No {blood_group} inventory for blood bank {bloodbank_id}')
+        movement = adjust_stock(bloodbank_id, blood_group, -units, note=note or 'Closing balance',
+                                created_by=created_by)
+        row.delete()
+        return movement
+
+
+def balance_at(bloodbank, at):
+    """Return ``{blood_group: units}`` for a bank as of the datetime ``at``, from the ledger."""
+    rows = (
+        InventoryMovement.objects
+        .filter(bloodbank_id=_bank_id(bloodbank), created_at__lte=at)
+        .values('blood_group')
+        .annotate(units=Sum('quantity'))
+        .order_by()
+    )
+    return {row['blood_group']: row['units'] for row in rows}
+
+
+def _donation_bags(donation, component):
+    collected_at = timezone.make_aware(datetime.combine(donation.donation_date, time(hour=12)))
+    expires_at = collected_at + timedelta(days=BloodUnit.SHELF_LIFE_DAYS[component])
+    return [
+        BloodUnit(
+            bag_id=f'{donation.bloodbank_id}-{donation.id}-{n}',
+            bloodbank_id=donation.bloodbank_id,
+            blood_group=donation.donor.blood_group,
+            component=component,
+            donation=donation,
+            collected_at=collected_at,
+            expires_at=expires_at,
+        )
+        for n in range(1, donation.units_donated + 1)
+    ]
+
+
+def register_donation_units(donation, component=BloodUnit.WHOLE_BLOOD):
+    """Create one tracked bag per donated unit. Balances are moved by the donation itself."""
+    return BloodUnit.objects.bulk_create(_donation_bags(donation, component))
+
+
+def receive_donations(bloodbank, donations, created_by=None, batch_size=1000):
+    """Add a batch of saved donations to the bank's stock in a fixed number of statements.
+
+    ``donations`` must have their ``donor`` loaded (units count towards the
+    donor's group). One upsert adds the per-group totals, one insert writes
+    a ``donation`` movement per donation and one insert creates their bags.
+    Must run inside the caller's transaction.
+    """
+    bloodbank_id = _bank_id(bloodbank)
+    totals = {}
+    for donation in donations:
+        group = donation.donor.blood_group
+        totals[group] = totals.get(group, 0) + donation.units_donated
+    if not totals:
+        return
+    _upsert(
+        [(bloodbank_id, group, units, DEFAULT_MIN_STOCK_LEVEL) for group, units in totals.items()],
+        movement_type=InventoryMovement.DONATION,
+    )
+    InventoryMovement.objects.bulk_create([
+        InventoryMovement(
+            bloodbank_id=bloodbank_id, blood_group=donation.donor.blood_group,
+            movement_type=InventoryMovement.DONATION, quantity=donation.units_donated,
+            reference=f'donation:{donation.id}', created_by=created_by,
+        )
+        for donation in donations
+    ], batch_size=batch_size)
+    BloodUnit.objects.bulk_create([
+        bag for donation in donations for bag in _donation_bags(donation, BloodUnit.WHOLE_BLOOD)
+    ], batch_size=batch_size)
+
+
+def fefo_units(bloodbank, blood_group, count, component=None, lock=False):
+    """Ids of the ``count`` first-expiring, unexpired available bags (a FEFO index range scan).
+
+    With ``lock`` the rows are locked for the current transaction, skipping
+    bags another issuer already holds (PostgreSQL; ignored on SQLite).
+    """
+    qs = BloodUnit.objects.filter(
+        bloodbank_id=_bank_id(bloodbank),
+        blood_group=blood_group,
+        status=BloodUnit.AVAILABLE,
+        expires_at__gt=timezone.now(),
+    )
+    if component:
+        qs = qs.filter(component=component)
+    if lock:
+        qs = qs.select_for_update(skip_locked=True)
+    return list(qs.order_by('expires_at').values_list('id', flat=True)[:count])
+
+
+def issue_units(bloodbank, blood_group, count, component=None, reference='', created_by=None):
+    """Issue ``count`` bags first-expired-first-out and draw the balance down by the same amount.
+
+    Raises ``InsufficientStock`` (writing nothing) when fewer bags or units are available.
+    Returns the issued ``bag_id`` values.
+    """
+    with transaction.atomic():
+        ids = fefo_units(bloodbank, blood_group, count, component, lock=True)
+        issued = 0
+        if len(ids) == count:
+            issued = BloodUnit.objects.filter(id__in=ids, status=BloodUnit.AVAILABLE).update(
+                status=BloodUnit.ISSUED, issued_at=timezone.now(),
+            )
+        if issued != count:
+            raise InsufficientStock(blood_group, count)
+        adjust_stock(bloodbank, blood_group, -count, InventoryMovement.ISSUE, reference=reference, created_by=created_by)
+        return list(BloodUnit.objects.filter(id__in=ids).order_by('expires_at').values_list('bag_id', flat=True))
+
+
+def expire_units(batch_size=1000, now=None):
+    """Mark available bags past ``expires_at`` as expired, in batches.
+
+    Each batch is one transaction: one id scan on the expiry index, one
+    grouped count, one status ``UPDATE``, a clamped balance update
+    (``_remove_clamped``) and one bulk ledger insert. Balances never go below
+    zero: bags whose units already left the balance (or were never in it)
+    are marked without a second ``expiry`` movement. Returns the number of
+    bags expired.
+    """
+    now = now or timezone.now()
+    total = 0
+    while True:
+        with transaction.atomic():
+            ids = list(
+                BloodUnit.objects.filter(status=BloodUnit.AVAILABLE, expires_at__lte=now)
+                .order_by('expires_at')
+                .values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                return total
+            counts = list(
+                BloodUnit.objects.filter(id__in=ids)
+                .values('bloodbank_id', 'blood_group')
+                .annotate(units=Count('id'))
+                .order_by()
+            )
+            BloodUnit.objects.filter(id__in=ids).update(status=BloodUnit.EXPIRED)
+            removed = _remove_clamped(
+                {(row['bloodbank_id'], row['blood_group']): row['units'] for row in counts},
+                InventoryMovement.EXPIRY,
+            )
+            InventoryMovement.objects.bulk_create([
+                InventoryMovement(
+                    bloodbank_id=bloodbank_id,
+                    blood_group=blood_group,
+                    movement_type=InventoryMovement.EXPIRY,
+                    quantity=-units,
+                    note='Expired units sweep',
+                )
+                for (bloodbank_id, blood_group), units in removed.items()
+            ])
+            total += len(ids)
+
+
+def issue_allocations(bloodbank, allocations, created_by=None):
+    """Issue stock for several references at once, in a fixed number of statements.
+
+    ``allocations`` is a list of ``(reference, {blood_group: units})``. Per-group
+    totals are taken with one conditional ``UPDATE`` (each row must still hold
+    its total, otherwise ``InsufficientStock`` is raised and nothing is
+    written), one ``issue`` movement per reference and group is bulk-inserted,
+    and where the bank tracks bags the first-expiring ones are marked issued.
+    Must run inside the caller's transaction.
+    """
+    bloodbank_id = _bank_id(bloodbank)
+    totals = {}
+    for _, groups in allocations:
+        for group, units in groups.items():
+            totals[group] = totals.get(group, 0) + units
+    if not totals:
+        return
+
+    def per_group(value):
+        return Case(*[When(blood_group=group, then=Value(value(group))) for group in totals],
+                    output_field=IntegerField())
+
+    updated = Inventory.objects.filter(
+        bloodbank_id=bloodbank_id,
+        blood_group__in=list(totals),
+        units_available__gte=per_group(totals.get),
+    ).update(units_available=F('units_available') - per_group(totals.get), last_updated=timezone.now())
+    if updated != len(totals):
+        available = dict(
+            Inventory.objects.filter(bloodbank_id=bloodbank_id, blood_group__in=list(totals))
+            .values_list('blood_group', 'units_available')
+        )
+        group = next(g for g, units in totals.items() if available.get(g, 0) < units)
+        raise InsufficientStock(group, totals[group])
+    invalidate_region_availability()
+    publish_stock_changes(
+        [(bloodbank_id, group, -units) for group, units in totals.items()], InventoryMovement.ISSUE,
+    )
+
+    InventoryMovement.objects.bulk_create([
+        InventoryMovement(
+            bloodbank_id=bloodbank_id, blood_group=group, movement_type=InventoryMovement.ISSUE,
+            quantity=-units, reference=reference, created_by=created_by,
+        )
+        for reference, groups in allocations
+        for group, units in groups.items()
+    ])
+
+    # Tracked bags: the first-expiring ones per group, as many as were issued
+    ranked = (
+        BloodUnit.objects.filter(
+            bloodbank_id=bloodbank_id, blood_group__in=list(totals),
+            status=BloodUnit.AVAILABLE, expires_at__gt=timezone.now(),
+        )
+        .annotate(position=Window(RowNumber(), partition_by=[F('blood_group')], order_by=F('expires_at').asc()))
+        .filter(position__lte=max(totals.values()))
+        .values_list('id', 'blood_group', 'position')
+    )
+    bag_ids = [bag_id for bag_id, group, position in ranked if position <= totals[group]]
+    if bag_ids:
+        BloodUnit.objects.filter(id__in=bag_ids).update(status=BloodUnit.ISSUED, issued_at=timezone.now())
@@ -0,0 +1,16 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from bloodbank.models import BloodBank
+from .aggregates import invalidate_region_availability
+from .models import Inventory
+
+
+# Writes through inventory.services invalidate explicitly (raw upserts do not
+# send signals); these cover admin edits, deletes and blood bank changes.
+@receiver(post_save, sender=Inventory)
+@receiver(post_delete, sender=Inventory)
+@receiver(post_save, sender=BloodBank)
+@receiver(post_delete, sender=BloodBank)
+def invalidate_inventory_rollups(sender, **kwargs):
+    invalidate_region_availability()
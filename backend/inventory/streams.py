@@ -0,0 +1,157 @@
+"""
+Server-Sent Events stream of inventory changes.
+
+Replaces dashboard polling with one long-lived connection. Served as a plain
+async Django view, so it needs the ASGI server production runs
+(``ebloodbank.asgi``, which also cancels the stream when the client
+disconnects). Under WSGI Django would buffer the endless body and hold a
+worker, so there the view answers 501 instead.
+
+Authenticate with the usual ``Authorization: Bearer <access>`` header, or
+``?token=<access>`` since browser ``EventSource`` cannot set headers.
+Subscribe with ``?bloodbank=<id>`` (blood bank users default to their own
+bank and cannot watch others) or ``?city=<name>``, optionally narrowed with
+``?blood_group=A+,O-``. The stream starts with a ``snapshot`` event of the
+current balances, then sends one ``inventory`` event per change. A
+``resync`` event means events were dropped and the client should refetch.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from .compatibility import normalize_blood_group
+from .events import Subscription, get_broker
+from .models import Inventory
+
+
+def _heartbeat_seconds():
+    return getattr(settings, 'INVENTORY_STREAM_HEARTBEAT', 15)
+
+
+def _sse(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n'
+
+
+def _authenticate(request):
+    auth = JWTAuthentication()
+    header = auth.get_header(request)
+    raw_token = auth.get_raw_token(header) if header else request.GET.get('token')
+    if not raw_token:
+        return None
+    try:
+        return auth.get_user(auth.get_validated_token(raw_token))
+    except (InvalidToken, TokenError):
+        return None
+
+
+def _resolve_subscription(request, user):
+    """Return ``(bloodbank_id, city, blood_groups)`` or an error ``JsonResponse``."""
+    params = request.GET
+    blood_groups = []
+    for value in filter(None, params.get('blood_group', '').split(',')):
+        group = normalize_blood_group(value)
+        if not group:
+            return JsonResponse({'error': f'Invalid blood_group: {value}'}, status=400)
+        blood_groups.append(group)
+
+    own_bank = getattr(user, 'bloodbank', None)
+    bloodbank_id = params.get('bloodbank')
+    city = params.get('city', '').strip()
+    if bloodbank_id:
+        try:
+            bloodbank_id = int(bloodbank_id)
+        except ValueError:
+            return JsonResponse({'error': 'bloodbank must be an integer'}, status=400)
+        if own_bank and own_bank.id != bloodbank_id:
+            return JsonResponse({'detail': 'Blood bank users can only watch their own inventory.'}, status=403)
+    elif city:
+        bloodbank_id = None
+    elif own_bank:
+        bloodbank_id = own_bank.id
+    else:
+        return JsonResponse({'error': 'Provide bloodbank or city'}, status=400)
+    return bloodbank_id, city or None, blood_groups
+
+
+def _snapshot(subscription):
+    qs = Inventory.objects.all()
+    if subscription.bloodbank_id is not None:
+        qs = qs.filter(bloodbank_id=subscription.bloodbank_id)
+    else:
+        qs = qs.filter(
+            bloodbank__city__iexact=subscription.city,
+            bloodbank__status='approved',
+            bloodbank__is_operational=True,
+        )
+    if subscription.blood_groups:
+        qs = qs.filter(blood_group__in=subscription.blood_groups)
+    rows = qs.order_by('bloodbank_id', 'blood_group').values_list(
+        'bloodbank_id', 'bloodbank__name', 'blood_group', 'units_available', 'min_stock_level',
+    )
+    return [
+        {
+            'bloodbank': bloodbank_id,
+            'bloodbank_name': name,
+            'blood_group': blood_group,
+            'units_available': units,
+            'min_stock_level': min_level,
+            'low_stock': units <= min_level,
+        }
+        for bloodbank_id, name, blood_group, units, min_level in rows
+    ]
+
+
+async def _event_stream(subscription):
+    broker = get_broker()
+    broker.subscribe(subscription)
+    # Cancellation (client disconnect) lands here too, so the subscription never outlives the connection
+    try:
+        # Subscribe before reading the snapshot so no change falls in between
+        rows = await sync_to_async(_snapshot)(subscription)
+        yield _sse('snapshot', {
+            'bloodbank': subscription.bloodbank_id,
+            'city': subscription.city,
+            'blood_groups': sorted(subscription.blood_groups),
+            'results': rows,
+        })
+        heartbeat = _heartbeat_seconds()
+        while True:
+            event = await subscription.get(timeout=heartbeat)
+            if subscription.overflowed:
+                subscription.overflowed = False
+                yield _sse('resync', {'reason': 'events dropped'})
+            if event is None:
+                yield ': keepalive\n\n'
+                continue
+            payload = {key: value for key, value in event.items() if key != 'listed'}
+            yield _sse('inventory', payload)
+    finally:
+        broker.unsubscribe(subscription)
+
+
+async def inventory_stream(request):
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {'detail': 'The inventory stream needs an ASGI server; poll the inventory endpoints instead.'}, status=501,
+        )
+    user = await sync_to_async(_authenticate)(request)
+    if user is None or not user.is_active:
+        return JsonResponse({'detail': 'Authentication credentials were not provided or are invalid.'}, status=401)
+
+    resolved = await sync_to_async(_resolve_subscription)(request, user)
+    if isinstance(resolved, JsonResponse):
+        return resolved
+    bloodbank_id, city, blood_groups = resolved
+
+    subscription = Subscription(bloodbank_id=bloodbank_id, city=city, blood_groups=blood_groups)
+    response = StreamingHttpResponse(_event_stream(subscription), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -1,3 +1,625 @@
-from django.test import TestCase
+import asyncio
+from datetime import datetime, time, timedelta
+from io import StringIO
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections, connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts.models import User
+from bloodbank.models import BloodBank
+from ebloodbank.asgi import application
+from requests.models import BloodRequest
+from .aggregates import REGION_AVAILABILITY_LOCK_KEY, region_availability
+from .compatibility import compatible_donor_groups, normalize_blood_group, plan_allocation
+from .events import LocalBroker, Subscription, get_broker, reset_broker
+from .forecasting import run_forecast
+from .models import BloodUnit, Inventory, InventoryMovement, StockForecast, StockSeries
+from .services import (
+    DEFAULT_MIN_STOCK_LEVEL, InsufficientStock, adjust_stock, balance_at, close_stock, expire_units, fefo_units,
+    issue_units, set_stock, transfer_stock,
+)
+from .timeseries import record_snapshot, series_range
+
+
+def make_bank(n):
+    user = User.objects.create(username=f'bank{n}', email=f'bank{n}@example.com', phone=f'90000000{n:02d}',
+                               user_type='bloodbank')
+    BloodBank.objects.create(user=user, name=f'Bank {n}', registration_number=f'REG{n}')
+    return User.objects.select_related('bloodbank').get(pk=user.pk)
+
+
+def auth(user):
+    return {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(user).access_token}'}
+
+
+class BalanceTests(TestCase):
+    def setUp(self):
+        self.bank_user = make_bank(1)
+        self.admin = User.objects.create(username='staff', email='staff@example.com', phone='7000000000',
+                                         user_type='admin')
+        set_stock(self.bank_user.bloodbank, 'O+', 7)
+
+    def test_balance_for_another_bank(self):
+        response = self.client.get('/api/inventory/movements/balance/',
+                                   {'bloodbank': self.bank_user.bloodbank.id}, **auth(self.admin))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['balances'], {'O+': 7})
+
+    def test_invalid_bloodbank_is_rejected(self):
+        for value in ('', 'abc'):
+            response = self.client.get('/api/inventory/movements/balance/', {'bloodbank': value}, **auth(self.admin))
+            self.assertEqual(response.status_code, 400)
+
+
+class CompatibilityTests(SimpleTestCase):
+    def test_normalize_blood_group(self):
+        self.assertEqual(normalize_blood_group(' ab+'), 'AB+')
+        # An unencoded "+" arrives as a space
+        self.assertEqual(normalize_blood_group('AB '), 'AB+')
+        self.assertIsNone(normalize_blood_group('A'))
+        self.assertIsNone(normalize_blood_group('C+'))
+
+    def test_compatible_donor_groups(self):
+        self.assertEqual(compatible_donor_groups('O-'), ['O-'])
+        self.assertEqual(compatible_donor_groups('A+'), ['A+', 'A-', 'O+', 'O-'])
+        self.assertEqual(len(compatible_donor_groups('AB+')), 8)
+
+    def test_plan_allocation(self):
+        stock = {'A+': 1, 'A-': 1, 'O+': 2, 'O-': 5, 'B+': 9}
+        # Exact group first, universal O- last
+        self.assertEqual(plan_allocation(stock, 'A+', 4), {'A+': 1, 'O+': 2, 'A-': 1})
+        self.assertEqual(plan_allocation(stock, 'A+', 6), {'A+': 1, 'O+': 2, 'A-': 1, 'O-': 2})
+        self.assertEqual(stock, {'A+': 1, 'A-': 1, 'O+': 2, 'O-': 5, 'B+': 9})
+
+    def test_plan_allocation_never_overdraws(self):
+        stock = {'O-': 2, 'B+': 9}
+        self.assertIsNone(plan_allocation(stock, 'O-', 3))
+        self.assertIsNone(plan_allocation(stock, 'A+', 3))
+        self.assertEqual(plan_allocation(stock, 'B+', 9), {'B+': 9})
+
+
+class BloodUnitTests(TestCase):
+    def setUp(self):
+        self.bank = make_bank(1).bloodbank
+        self.now = timezone.now()
+
+    def make_bags(self, bank, blood_group, days):
+        """One bag per entry in ``days``, expiring that many days from now, with matching stock."""
+        bags = BloodUnit.objects.bulk_create([
+            BloodUnit(bag_id=f'{bank.id}-{blood_group}-{n}', bloodbank=bank, blood_group=blood_group,
+                      collected_at=self.now - timedelta(days=30), expires_at=self.now + timedelta(days=offset))
+            for n, offset in enumerate(days)
+        ])
+        adjust_stock(bank, blood_group, len(bags), InventoryMovement.DONATION)
+        return bags
+
+    def balance(self, bank, blood_group):
+        return Inventory.objects.get(bloodbank=bank, blood_group=blood_group).units_available
+
+    def statuses(self, bags):
+        return list(BloodUnit.objects.filter(id__in=[bag.id for bag in bags]).order_by('id')
+                    .values_list('status', flat=True))
+
+    def test_fefo_issue_skips_expired_bags(self):
+        bags = self.make_bags(self.bank, 'O+', [10, -1, 3, 7])
+        self.assertEqual(fefo_units(self.bank, 'O+', 2), [bags[2].id, bags[3].id])
+        self.assertEqual(issue_units(self.bank, 'O+', 2), [bags[2].bag_id, bags[3].bag_id])
+        self.assertEqual(self.statuses(bags), ['available', 'available', 'issued', 'issued'])
+        self.assertEqual(self.balance(self.bank, 'O+'), 2)
+
+    def test_sweep_expires_in_batches(self):
+        other = make_bank(2).bloodbank
+        bags = self.make_bags(self.bank, 'O+', [-3, -2, -1, 5]) + self.make_bags(other, 'A-', [-1])
+        self.assertEqual(expire_units(batch_size=2), 4)
+        self.assertEqual(self.statuses(bags), ['expired', 'expired', 'expired', 'available', 'expired'])
+        self.assertEqual(self.balance(self.bank, 'O+'), 1)
+        self.assertEqual(self.balance(other, 'A-'), 0)
+        swept = InventoryMovement.objects.filter(movement_type=InventoryMovement.EXPIRY, bloodbank=self.bank)
+        self.assertEqual(sum(swept.values_list('quantity', flat=True)), -3)
+        self.assertEqual(expire_units(), 0)
+
+    def test_manual_expiry_is_not_counted_twice(self):
+        bags = self.make_bags(self.bank, 'B+', [-2, -1, 4])
+        adjust_stock(self.bank, 'B+', -2, InventoryMovement.EXPIRY)
+        # The bags the manual expiry covered are already marked
+        self.assertEqual(self.statuses(bags), ['expired', 'expired', 'available'])
+        self.assertEqual(expire_units(), 0)
+        self.assertEqual(self.balance(self.bank, 'B+'), 1)
+
+    def test_lower_count_and_transfer_retire_bags(self):
+        other = make_bank(2).bloodbank
+        bags = self.make_bags(self.bank, 'AB-', [-1, 2, 6, 9])
+        set_stock(self.bank, 'AB-', 3)
+        transfer_stock(self.bank, other, 'AB-', 1)
+        self.assertEqual(self.statuses(bags), ['discarded', 'available', 'available', 'available'])
+        self.assertEqual(BloodUnit.objects.get(id=bags[1].id).bloodbank_id, other.id)
+        self.assertEqual(expire_units(), 0)
+
+    def test_sweep_never_takes_a_balance_below_zero(self):
+        # Bags left over from before stock changes kept bag status in step
+        bags = self.make_bags(self.bank, 'A+', [-2, -1])
+        Inventory.objects.filter(bloodbank=self.bank, blood_group='A+').update(units_available=1)
+        orphan = BloodUnit.objects.create(bag_id='orphan', bloodbank=self.bank, blood_group='O-',
+                                          collected_at=self.now - timedelta(days=40), expires_at=self.now)
+        self.assertEqual(expire_units(), 3)
+        self.assertEqual(self.statuses(bags + [orphan]), ['expired', 'expired', 'expired'])
+        self.assertEqual(self.balance(self.bank, 'A+'), 0)
+        self.assertFalse(Inventory.objects.filter(blood_group='O-').exists())
+        swept = InventoryMovement.objects.filter(movement_type=InventoryMovement.EXPIRY)
+        self.assertEqual(list(swept.values_list('quantity', flat=True)), [-1])
+
+
+@override_settings(INVENTORY_ROLLUP_BACKGROUND=False)
+class AvailabilityTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.bank_user = make_bank(1)
+        self.bank = self.located(self.bank_user.bloodbank, 'Pune', 'Maharashtra')
+        set_stock(self.bank, 'A+', 4)
+        set_stock(self.bank, 'A-', 2)
+
+    def located(self, bank, city, state, **fields):
+        BloodBank.objects.filter(pk=bank.pk).update(city=city, state=state, **fields)
+        return bank
+
+    def get(self, **params):
+        return self.client.get('/api/inventory/inventory/availability/', params, **auth(self.bank_user))
+
+    def cells(self, **filters):
+        return [(row['city'], row['blood_group'], row['units_available'], row['banks_with_stock'])
+                for row in region_availability(**filters)['results']]
+
+    def test_blood_group_is_normalized(self):
+        # An unencoded "+" arrives as a space
+        for value in ('A+', 'a ', ' A+'):
+            response = self.get(blood_group=value)
+            self.assertEqual(response.status_code, 200, value)
+            self.assertEqual([(row['blood_group'], row['units_available']) for row in response.json()['results']],
+                             [('A+', 4)], value)
+        for value in ('A', 'C+'):
+            self.assertEqual(self.get(blood_group=value).status_code, 400, value)
+
+    def test_only_approved_operational_banks_count(self):
+        empty = self.located(make_bank(2).bloodbank, 'Pune', 'Maharashtra')
+        set_stock(empty, 'A+', 0)
+        for n, fields in ((3, {'status': 'pending'}), (4, {'is_operational': False})):
+            hidden = self.located(make_bank(n).bloodbank, 'Pune', 'Maharashtra', **fields)
+            set_stock(hidden, 'A+', 50)
+        self.assertEqual(self.cells(), [('Pune', 'A+', 4, 1), ('Pune', 'A-', 2, 1)])
+
+    def test_state_and_city_filters_ignore_case(self):
+        for n, city, state in ((2, 'Mumbai', 'Maharashtra'), (3, 'Pune', 'Goa'), (4, 'Bengaluru', 'Karnataka')):
+            set_stock(self.located(make_bank(n).bloodbank, city, state), 'O+', n)
+        self.assertEqual(self.cells(state=' maharashtra', city='PUNE'), [('Pune', 'A+', 4, 1), ('Pune', 'A-', 2, 1)])
+        self.assertEqual(self.cells(state='MAHARASHTRA', blood_group='O+'), [('Mumbai', 'O+', 2, 1)])
+        self.assertEqual(self.cells(city='pune', blood_group='O+'), [('Pune', 'O+', 3, 1)])
+        self.assertEqual(self.cells(state='Kerala'), [])
+
+    def test_writes_mark_the_rollup_stale_on_commit(self):
+        self.assertEqual(self.cells(blood_group='A+'), [('Pune', 'A+', 4, 1)])
+        with self.captureOnCommitCallbacks() as callbacks:
+            adjust_stock(self.bank, 'A+', 3)
+            # Not committed yet
+            self.assertEqual(self.cells(blood_group='A+'), [('Pune', 'A+', 4, 1)])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.cells(blood_group='A+'), [('Pune', 'A+', 7, 1)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            BloodBank.objects.get(pk=self.bank.pk).delete()
+        self.assertEqual(self.cells(), [])
+
+    def test_stale_rollup_is_served_while_another_caller_refreshes(self):
+        self.assertEqual(self.cells(blood_group='A+'), [('Pune', 'A+', 4, 1)])
+        with self.captureOnCommitCallbacks(execute=True):
+            adjust_stock(self.bank, 'A+', 3)
+        cache.add(REGION_AVAILABILITY_LOCK_KEY, True)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.cells(blood_group='A+'), [('Pune', 'A+', 4, 1)])
+        cache.delete(REGION_AVAILABILITY_LOCK_KEY)
+        self.assertEqual(self.cells(blood_group='A+'), [('Pune', 'A+', 7, 1)])
+        # Fresh again: no recompute
+        with self.assertNumQueries(0):
+            self.assertEqual(self.cells(blood_group='A+'), [('Pune', 'A+', 7, 1)])
+
+    def test_old_rollups_go_stale_after_the_timeout(self):
+        self.cells()
+        adjust_stock(self.bank, 'A+', 3)  # never committed, so only the timeout can refresh
+        with override_settings(INVENTORY_ROLLUP_CACHE_TIMEOUT=0):
+            self.assertEqual(self.cells(blood_group='A+'), [('Pune', 'A+', 7, 1)])
+
+
+class StockSheetTests(TestCase):
+    def setUp(self):
+        self.bank_user = make_bank(1)
+        self.bank = self.bank_user.bloodbank
+
+    def post(self, rows, user=None):
+        return self.client.post('/api/inventory/inventory/bulk_upsert/', rows, content_type='application/json',
+                                **auth(user or self.bank_user))
+
+    def test_one_bad_row_rejects_the_whole_sheet(self):
+        response = self.post([
+            {'blood_group': 'A+', 'units_available': 5},
+            {'blood_group': 'B+', 'units_available': -1},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()[0], {})
+        self.assertIn('units_available', response.json()[1])
+        self.assertFalse(Inventory.objects.exists())
+        self.assertFalse(InventoryMovement.objects.exists())
+
+        response = self.post({'rows': [{'blood_group': 'A+', 'units_available': 5},
+                                       {'blood_group': 'A+', 'units_available': 6}]})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('blood_group', response.json()[1])
+        self.assertFalse(Inventory.objects.exists())
+
+    def test_results_per_row(self):
+        set_stock(self.bank, 'A+', 5)
+        set_stock(self.bank, 'B+', 3, min_stock_level=2)
+        response = self.post([
+            {'blood_group': 'A+', 'units_available': 8},
+            {'blood_group': 'B+', 'units_available': 3, 'min_stock_level': 2},
+            {'blood_group': 'O-', 'units_available': 4, 'min_stock_level': 1},
+        ])
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual(
+            [(row['blood_group'], row['status'], row['previous_units'], row['delta']) for row in results],
+            [('A+', 'updated', 5, 3), ('B+', 'unchanged', 3, 0), ('O-', 'created', None, 4)],
+        )
+        self.assertEqual(dict(Inventory.objects.values_list('blood_group', 'units_available')),
+                         {'A+': 8, 'B+': 3, 'O-': 4})
+        self.assertEqual(Inventory.objects.get(blood_group='O-').min_stock_level, 1)
+        # One adjustment per changed balance, and the ledger replays to the balances
+        self.assertEqual(balance_at(self.bank, timezone.now()), {'A+': 8, 'B+': 3, 'O-': 4})
+        self.assertEqual(InventoryMovement.objects.count(), 4)
+
+    def test_fixed_number_of_queries(self):
+        groups = [code for code, _ in Inventory.BLOOD_GROUPS]
+        counts = []
+        for n, size in ((2, 1), (3, len(groups))):
+            user = make_bank(n)
+            for units in (10, 4):  # created, then lowered
+                rows = [{'blood_group': group, 'units_available': units} for group in groups[:size]]
+                with CaptureQueriesContext(connection) as captured:
+                    self.assertEqual(self.post(rows, user).status_code, 200)
+                counts.append(len(captured))
+        self.assertEqual(counts[0], counts[2])
+        self.assertEqual(counts[1], counts[3])
+
+
+class LowStockTests(TestCase):
+    def setUp(self):
+        self.bank_user = make_bank(1)
+        self.other_user = make_bank(2)
+        self.admin = User.objects.create(username='staff', email='staff@example.com', phone='7000000000',
+                                         user_type='admin')
+        set_stock(self.bank_user.bloodbank, 'A+', 5, min_stock_level=5)   # exactly at the minimum
+        set_stock(self.bank_user.bloodbank, 'A-', 1, min_stock_level=4)
+        set_stock(self.bank_user.bloodbank, 'B+', 6, min_stock_level=5)
+        set_stock(self.other_user.bloodbank, 'A+', 0, min_stock_level=3)
+
+    def rows(self, user, **params):
+        response = self.client.get('/api/inventory/inventory/', params, **auth(user))
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        rows = data['results'] if isinstance(data, dict) else data
+        return sorted((row['bloodbank'], row['blood_group']) for row in rows)
+
+    def test_filter_includes_rows_at_the_minimum(self):
+        bank, other = self.bank_user.bloodbank.id, self.other_user.bloodbank.id
+        self.assertEqual(sorted(Inventory.objects.low_stock().values_list('bloodbank', 'blood_group')),
+                         [(bank, 'A+'), (bank, 'A-'), (other, 'A+')])
+        self.assertEqual(self.rows(self.admin, low_stock='true'), [(bank, 'A+'), (bank, 'A-'), (other, 'A+')])
+        self.assertEqual(len(self.rows(self.admin, low_stock='false')), 4)
+
+    def test_bank_users_see_only_their_own_rows(self):
+        bank = self.bank_user.bloodbank.id
+        self.assertEqual(self.rows(self.bank_user, low_stock='1'), [(bank, 'A+'), (bank, 'A-')])
+        self.assertEqual(self.rows(self.other_user, low_stock='yes'), [(self.other_user.bloodbank.id, 'A+')])
+
+    def test_summary_per_blood_group(self):
+        def summary(user):
+            response = self.client.get('/api/inventory/inventory/low_stock_summary/', **auth(user))
+            self.assertEqual(response.status_code, 200)
+            return [(row['blood_group'], row['low_stock_count'], row['units_short']) for row in response.json()]
+
+        self.assertEqual(summary(self.admin), [('A+', 2, 3), ('A-', 1, 3)])
+        self.assertEqual(summary(self.bank_user), [('A+', 1, 0), ('A-', 1, 3)])
+        self.assertEqual(summary(self.other_user), [('A+', 1, 3)])
+
+
+class CompatibleStockTests(TestCase):
+    def setUp(self):
+        self.user = make_bank(1)
+        self.banks = {}
+
+    def bank(self, n, stock, city='Pune', state='Maharashtra', **fields):
+        bank = make_bank(n).bloodbank if n != 1 else self.user.bloodbank
+        BloodBank.objects.filter(pk=bank.pk).update(city=city, state=state, **fields)
+        for group, units in stock.items():
+            set_stock(bank, group, units)
+        self.banks[bank.id] = n
+
+    def get(self, **params):
+        return self.client.get('/api/inventory/inventory/compatible/', params, **auth(self.user))
+
+    def ranked(self, **params):
+        response = self.get(**params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return [(self.banks[row['bloodbank']], row['exact_units'], row['compatible_units'])
+                for row in response.json()['results']]
+
+    def test_only_compatible_groups_count(self):
+        self.bank(1, {'O-': 2, 'A+': 7})
+        self.bank(2, {'B-': 4, 'AB+': 1})
+        self.bank(3, {'O+': 9})
+        self.assertEqual(self.ranked(blood_group='O-'), [(1, 2, 2)])
+        self.assertEqual(self.ranked(blood_group='AB+'), [(2, 1, 5), (1, 0, 9), (3, 0, 9)])
+        # An unencoded "+" arrives as a space
+        self.assertEqual(self.ranked(blood_group='AB '), self.ranked(blood_group='AB+'))
+
+    def test_units_and_closed_banks(self):
+        self.bank(1, {'A+': 1, 'O-': 1})
+        self.bank(2, {'A+': 5}, is_operational=False)
+        self.bank(3, {'A+': 5}, status='suspended')
+        self.bank(4, {'A-': 3})
+        # Exact-group stock ranks first
+        self.assertEqual(self.ranked(blood_group='A+', units=2), [(1, 1, 2), (4, 0, 3)])
+        self.assertEqual(self.ranked(blood_group='A+', units=3), [(4, 0, 3)])
+
+    def test_city_state_and_limit(self):
+        self.bank(1, {'O+': 1})
+        self.bank(2, {'O+': 2}, city='Mumbai')
+        self.bank(3, {'O+': 3}, city='Pune', state='Goa')
+        self.assertEqual(self.ranked(blood_group='O+', city='pune'), [(3, 3, 3), (1, 1, 1)])
+        self.assertEqual(self.ranked(blood_group='O+', state='MAHARASHTRA'), [(2, 2, 2), (1, 1, 1)])
+        self.assertEqual(self.ranked(blood_group='O+', city='Pune', state='Maharashtra'), [(1, 1, 1)])
+        self.assertEqual(self.ranked(blood_group='O+', limit=2), [(3, 3, 3), (2, 2, 2)])
+
+    def test_invalid_parameters(self):
+        for params in ({}, {'blood_group': 'A'}, {'blood_group': 'A+', 'units': 'x'},
+                       {'blood_group': 'A+', 'limit': 0}, {'blood_group': 'A+', 'units': -1}):
+            self.assertEqual(self.get(**params).status_code, 400, params)
+
+
+class AdjustStockTests(TestCase):
+    def setUp(self):
+        self.bank = make_bank(1).bloodbank
+
+    def row(self, blood_group):
+        return Inventory.objects.get(bloodbank=self.bank, blood_group=blood_group)
+
+    def ledger(self):
+        return list(InventoryMovement.objects.filter(bloodbank=self.bank).order_by('id')
+                    .values_list('blood_group', 'movement_type', 'quantity'))
+
+    def test_upsert_creates_then_increments(self):
+        adjust_stock(self.bank, 'A+', 3, InventoryMovement.DONATION)
+        created = self.row('A+')
+        self.assertEqual((created.units_available, created.min_stock_level), (3, DEFAULT_MIN_STOCK_LEVEL))
+        Inventory.objects.filter(bloodbank=self.bank, blood_group='A+').update(min_stock_level=2)
+        with CaptureQueriesContext(connection) as captured:
+            adjust_stock(self.bank, 'A+', 4, InventoryMovement.DONATION)
+        # The increment happens in the database and leaves the minimum alone
+        self.assertEqual((self.row('A+').units_available, self.row('A+').min_stock_level), (7, 2))
+        self.assertEqual(len([q for q in captured.captured_queries if 'ON CONFLICT' in q['sql']]), 1)
+        self.assertEqual(Inventory.objects.filter(bloodbank=self.bank).count(), 1)
+
+    def test_decrement_never_goes_negative(self):
+        adjust_stock(self.bank, 'O-', 2)
+        movement = adjust_stock(self.bank, 'O-', -2, InventoryMovement.ISSUE)
+        self.assertEqual(movement.quantity, -2)
+        self.assertEqual(self.row('O-').units_available, 0)
+        for group in ('O-', 'B+'):  # too little stock, and no row at all
+            with self.assertRaises(InsufficientStock):
+                adjust_stock(self.bank, group, -1, InventoryMovement.ISSUE)
+        self.assertEqual(self.row('O-').units_available, 0)
+        self.assertFalse(Inventory.objects.filter(blood_group='B+').exists())
+        self.assertEqual(len(self.ledger()), 2)
+
+    def test_each_change_writes_one_ledger_row(self):
+        adjust_stock(self.bank, 'B+', 5, InventoryMovement.DONATION, reference='donation:1')
+        adjust_stock(self.bank, 'B+', -1, InventoryMovement.ISSUE)
+        adjust_stock(self.bank, 'B+', 0)
+        adjust_stock(self.bank, 'AB-', 2)
+        self.assertEqual(self.ledger(), [('B+', 'donation', 5), ('B+', 'issue', -1), ('AB-', 'adjustment', 2)])
+        balances = Inventory.objects.filter(bloodbank=self.bank).values_list('blood_group', 'units_available')
+        self.assertEqual(balance_at(self.bank, timezone.now()), dict(balances))
+
+
+class InventoryDeleteTests(TestCase):
+    def setUp(self):
+        self.bank_user = make_bank(1)
+        self.bank = self.bank_user.bloodbank
+        set_stock(self.bank, 'A+', 6)
+        set_stock(self.bank, 'B-', 0)
+
+    def url(self, blood_group):
+        return f'/api/inventory/inventory/{Inventory.objects.get(bloodbank=self.bank, blood_group=blood_group).pk}/'
+
+    def test_delete_books_a_closing_movement(self):
+        response = self.client.delete(self.url('A+'), **auth(self.bank_user))
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Inventory.objects.filter(bloodbank=self.bank, blood_group='A+').exists())
+        closing = InventoryMovement.objects.filter(bloodbank=self.bank, blood_group='A+').latest('id')
+        self.assertEqual((closing.movement_type, closing.quantity), (InventoryMovement.ADJUSTMENT, -6))
+        self.assertEqual(balance_at(self.bank, timezone.now())['A+'], 0)
+        # Replaying the ledger leaves the deleted row deleted
+        call_command('rebuild_inventory', stdout=StringIO())
+        self.assertEqual(list(Inventory.objects.filter(bloodbank=self.bank).values_list('blood_group', flat=True)),
+                         ['B-'])
+
+    def test_empty_row_is_deleted_without_a_movement(self):
+        movements = InventoryMovement.objects.count()
+        self.assertIsNone(close_stock(self.bank, 'B-'))
+        self.assertEqual(InventoryMovement.objects.count(), movements)
+        self.assertFalse(Inventory.objects.filter(bloodbank=self.bank, blood_group='B-').exists())
+        with self.assertRaises(Inventory.DoesNotExist):
+            close_stock(self.bank, 'B-')
+
+    def test_only_the_owning_bank_can_delete(self):
+        admin = User.objects.create(username='staff', email='staff@example.com', phone='7000000000', user_type='admin')
+        self.assertEqual(self.client.delete(self.url('A+'), **auth(admin)).status_code, 403)
+        self.assertEqual(self.client.delete(self.url('A+'), **auth(make_bank(2))).status_code, 404)
+        self.assertEqual(Inventory.objects.get(bloodbank=self.bank, blood_group='A+').units_available, 6)
+
+
+class ForecastTests(TestCase):
+    def test_same_day_requests_are_summed(self):
+        bank_user = make_bank(1)
+        bank = bank_user.bloodbank
+        set_stock(bank, 'A+', 14)
+        today = timezone.localdate()
+        for status in ('pending', 'fulfilled', 'rejected'):
+            BloodRequest.objects.create(
+                requester=bank_user, bloodbank=bank, patient_name='Patient', blood_group='A+', units_required=14,
+                urgency='normal', required_date=today, hospital_name='City Hospital', doctor_name='Dr. Rao',
+                contact_number='9999999999', reason='Surgery', status=status,
+            )
+        self.assertEqual(run_forecast(today), 1)
+        forecast = StockForecast.objects.get(bloodbank=bank, blood_group='A+')
+        self.assertEqual(forecast.units_available, 14)
+        self.assertEqual(forecast.avg_daily_demand, 1.0)
+        self.assertEqual(forecast.avg_daily_supply, 0)
+        # All the demand fell on one weekday, which the next week includes once
+        self.assertAlmostEqual(forecast.days_of_cover, 14, delta=0.5)
+
+
+class InventoryStreamTests(TestCase):
+    """The SSE view served through the ASGI application, with the in-process broker."""
+
+    def setUp(self):
+        reset_broker()
+        self.addCleanup(reset_broker)
+        # As Django's own test clients do, keep the test transaction's connection open across requests
+        request_started.disconnect(close_old_connections)
+        request_finished.disconnect(close_old_connections)
+        self.addCleanup(request_started.connect, close_old_connections)
+        self.addCleanup(request_finished.connect, close_old_connections)
+        self.bank_user = make_bank(1)
+        set_stock(self.bank_user.bloodbank, 'O-', 4)
+
+    def open_stream(self, query):
+        """Start a request to the stream; returns ``(task, body chunks, disconnect)``."""
+        incoming = asyncio.Queue()
+        incoming.put_nowait({'type': 'http.request', 'body': b'', 'more_body': False})
+        chunks = asyncio.Queue()
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                chunks.put_nowait(message['status'])
+            elif message.get('body'):
+                chunks.put_nowait(message['body'].decode())
+
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': '/api/inventory/stream/', 'raw_path': b'/api/inventory/stream/', 'query_string': query.encode(),
+            'root_path': '', 'headers': [(b'host', b'testserver')], 'client': ('127.0.0.1', 1),
+            'server': ('testserver', 80),
+        }
+        task = asyncio.create_task(application(scope, incoming.get, send))
+        return task, chunks, lambda: incoming.put_nowait({'type': 'http.disconnect'})
+
+    async def test_stream_delivers_changes_and_unsubscribes_on_disconnect(self):
+        token = await sync_to_async(lambda: RefreshToken.for_user(self.bank_user).access_token)()
+        task, chunks, disconnect = self.open_stream(f'token={token}')
+        self.assertEqual(await asyncio.wait_for(chunks.get(), 5), 200)
+        snapshot = await asyncio.wait_for(chunks.get(), 5)
+        self.assertTrue(snapshot.startswith('event: snapshot'))
+        self.assertIn('"units_available": 4', snapshot)
+        self.assertTrue(get_broker().active)
+
+        def issue():
+            with self.captureOnCommitCallbacks(execute=True):
+                adjust_stock(self.bank_user.bloodbank, 'O-', -1, InventoryMovement.ISSUE)
+
+        await sync_to_async(issue)()
+        event = await asyncio.wait_for(chunks.get(), 5)
+        self.assertTrue(event.startswith('event: inventory'))
+        self.assertIn('"delta": -1', event)
+        self.assertIn('"units_available": 3', event)
+
+        disconnect()
+        await asyncio.wait_for(task, 5)
+        self.assertFalse(get_broker().active)
+
+    async def test_invalid_token(self):
+        task, chunks, _ = self.open_stream('token=bogus')
+        await asyncio.wait_for(task, 5)
+        self.assertEqual(await chunks.get(), 401)
+
+    def test_wsgi_requests_are_refused(self):
+        response = self.client.get('/api/inventory/stream/', **auth(self.bank_user))
+        self.assertEqual(response.status_code, 501)
+
+
+class BrokerTests(SimpleTestCase):
+    def test_matching_and_closed_loops(self):
+        async def subscribe(**kwargs):
+            return Subscription(**kwargs)
+
+        broker = LocalBroker()
+        loop = asyncio.new_event_loop()
+        by_bank = broker.subscribe(loop.run_until_complete(subscribe(bloodbank_id=1, blood_groups=['O-'])))
+        by_city = broker.subscribe(loop.run_until_complete(subscribe(city='Pune')))
+        event = {'bloodbank': 1, 'blood_group': 'O-', 'city': 'PUNE', 'listed': True}
+        broker.publish(event)
+        broker.publish({**event, 'blood_group': 'A+'})
+        loop.run_until_complete(asyncio.sleep(0))
+        self.assertEqual(by_bank.queue.qsize(), 1)
+        self.assertEqual(by_city.queue.qsize(), 2)
+
+        # Publishing to a connection whose loop has gone away is a no-op
+        loop.close()
+        broker.publish(event)
+        broker.unsubscribe(by_bank)
+        broker.unsubscribe(by_city)
+        self.assertFalse(broker.active)
+
+
+class SnapshotTests(TestCase):
+    def setUp(self):
+        self.banks = [make_bank(n).bloodbank for n in range(1, 4)]
+        for bank in self.banks:
+            set_stock(bank, 'O+', 10)
+        set_stock(self.banks[0], 'A-', 2)
+        day = timezone.localdate()
+        self.at = timezone.make_aware(datetime.combine(day, time(hour=9)))
+
+    def test_samples_fold_into_hourly_and_daily_rows(self):
+        bank = self.banks[0]
+        self.assertEqual(record_snapshot(self.at, batch_size=2), 4)
+        set_stock(bank, 'O+', 4)
+        record_snapshot(self.at + timedelta(hours=2), batch_size=2)
+        set_stock(bank, 'O+', 7)
+        record_snapshot(self.at + timedelta(hours=3), batch_size=2)
+
+        day = self.at.date()
+        hourly = series_range(bank.id, 'O+', day, day, StockSeries.HOURLY)
+        self.assertEqual([(point['at'].hour, point['units']) for point in hourly], [(9, 10), (11, 4), (12, 7)])
+        daily = series_range(bank.id, 'O+', day, day, StockSeries.DAILY)
+        self.assertEqual([(point['min'], point['max'], point['close']) for point in daily], [(4, 10, 7)])
+        self.assertEqual(StockSeries.objects.count(), 8)
+
+    def test_existing_rows_are_patched_in_place(self):
+        record_snapshot(self.at - timedelta(days=1))
+        record_snapshot(self.at)
+        with CaptureQueriesContext(connection) as queries:
+            record_snapshot(self.at + timedelta(hours=1), batch_size=2)
+        # Two chunks of: bank ids, balances, two series reads, two patches (the last chunk also ends the walk)
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('UPDATE')]), 4)
+        self.assertFalse(any(q['sql'].startswith('INSERT') for q in queries))
+        # Yesterday's sample survives today's patches
+        day = self.at.date()
+        daily = series_range(self.banks[0].id, 'A-', day - timedelta(days=1), day, StockSeries.DAILY)
+        self.assertEqual([(point['date'], point['close']) for point in daily], [(day - timedelta(days=1), 2), (day, 2)])
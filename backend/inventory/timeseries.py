@@ -0,0 +1,234 @@
+"""
+Compact stock history for trend charts.
+
+Each ``snapshot_inventory`` run (hourly) samples every ``Inventory`` balance
+and writes it into two packed ``StockSeries`` rows per (bank, blood group):
+
+* the hourly row for today, one int32 slot per hour;
+* the daily row for the current year, whose (min, max, close) triple for
+  today is folded from the new sample, so the daily series is always the
+  compacted form of the hourly one.
+
+Existing rows are patched in place: only the current hour's 4 bytes and
+today's 12 bytes are read and written (``_Splice``), never the whole blob.
+
+Hourly rows are pruned after ``HOURLY_RETENTION_DAYS`` and daily rows after
+``DAILY_RETENTION_YEARS``, so storage per series is bounded at 7 hourly rows
+of 96 bytes plus a handful of yearly rows of 4.4 KB. A one-year chart reads at
+most two daily rows with one range scan on the unique index.
+"""
+from datetime import date, datetime, time, timedelta
+
+import numpy as np
+from django.db import transaction
+from django.db.models import BinaryField, Case, F, Func, Value, When
+from django.utils import timezone
+
+from .models import Inventory, StockSeries
+
+
+HOURLY_RETENTION_DAYS = 7
+DAILY_RETENTION_YEARS = 5
+HOURS = 24
+YEAR_DAYS = 366
+MISSING = -1
+_DTYPE = '<i4'
+
+
+def _pack(values):
+    return np.asarray(values, dtype=_DTYPE).tobytes()
+
+
+def _unpack(data, shape):
+    return np.frombuffer(bytes(data), dtype=_DTYPE).reshape(shape).copy()
+
+
+def _year_start(day):
+    return date(day.year, 1, 1)
+
+
+def _empty_hourly():
+    return np.full(HOURS, MISSING, dtype=_DTYPE)
+
+
+def _empty_daily():
+    return np.full((YEAR_DAYS, 3), MISSING, dtype=_DTYPE)
+
+
+class _Slot(Func):
+    """The ``length`` bytes of a blob starting at byte ``offset`` (0-based)."""
+    function = 'substr'
+    output_field = BinaryField()
+
+    def __init__(self, expression, offset, length):
+        super().__init__(expression, Value(offset + 1), Value(length))
+
+
+class _Splice(Func):
+    """A blob with the ``length`` bytes at byte ``offset`` replaced by ``value`` (same length).
+
+    PostgreSQL's ``bytea`` and SQLite blobs both support ``substr`` and ``||``;
+    SQLite turns the concatenation into text, so it is cast back.
+    """
+    output_field = BinaryField()
+
+    def __init__(self, expression, offset, length, value):
+        super().__init__(expression, value)
+        self.offset = offset
+        self.length = length
+
+    def as_sql(self, compiler, connection, **extra_context):
+        blob, blob_params = compiler.compile(self.source_expressions[0])
+        value, value_params = compiler.compile(self.source_expressions[1])
+        sql = f'substr({blob}, 1, %s) || {value} || substr({blob}, %s)'
+        return sql, [*blob_params, self.offset, *value_params, *blob_params, self.offset + self.length + 1]
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        sql, params = self.as_sql(compiler, connection, **extra_context)
+        return f'CAST({sql} AS BLOB)', params
+
+
+def _patch(ids_by_value, offset, length, now):
+    """Write each packed value into the rows listed for it, in one ``UPDATE``."""
+    if not ids_by_value:
+        return
+    value = Case(
+        *[When(pk__in=ids, then=Value(packed)) for packed, ids in ids_by_value.items()],
+        output_field=BinaryField(),
+    )
+    StockSeries.objects.filter(pk__in=[pk for ids in ids_by_value.values() for pk in ids]).update(
+        data=_Splice(F('data'), offset, length, value), updated_at=now,
+    )
+
+
+def _bank_chunks(batch_size):
+    """Ids of banks with inventory, ``batch_size`` at a time, in id order (a keyset walk of the unique index)."""
+    last = 0
+    while True:
+        bank_ids = list(
+            Inventory.objects.filter(bloodbank_id__gt=last)
+            .order_by('bloodbank_id').values_list('bloodbank_id', flat=True).distinct()[:batch_size]
+        )
+        if not bank_ids:
+            return
+        yield bank_ids
+        last = bank_ids[-1]
+
+
+def record_snapshot(now=None, batch_size=500):
+    """Sample every balance into today's hourly row and this year's daily row.
+
+    Works through ``batch_size`` banks at a time, each chunk in its own
+    transaction: one balance read, two series reads (today's triple only,
+    for daily rows), at most two ``UPDATE`` statements patching existing
+    rows in place and one insert per resolution for new rows. Returns the
+    number of series sampled.
+    """
+    now = timezone.localtime(now or timezone.now())
+    day = now.date()
+    year_start = _year_start(day)
+    day_index = (day - year_start).days
+    hour_offset, day_offset = now.hour * 4, day_index * 12
+
+    sampled = 0
+    for bank_ids in _bank_chunks(batch_size):
+        banks = {'bloodbank_id__gte': bank_ids[0], 'bloodbank_id__lte': bank_ids[-1]}
+        with transaction.atomic():
+            balances = list(
+                Inventory.objects.filter(**banks).values_list('bloodbank_id', 'blood_group', 'units_available')
+            )
+            series = StockSeries.objects.filter(**banks)
+            hourly = {
+                (bloodbank_id, blood_group): pk for pk, bloodbank_id, blood_group in
+                series.filter(resolution=StockSeries.HOURLY, start=day).values_list('pk', 'bloodbank_id', 'blood_group')
+            }
+            daily = {
+                (bloodbank_id, blood_group): (pk, today) for pk, bloodbank_id, blood_group, today in
+                series.filter(resolution=StockSeries.DAILY, start=year_start)
+                .annotate(today=_Slot(F('data'), day_offset, 12))
+                .values_list('pk', 'bloodbank_id', 'blood_group', 'today')
+            }
+
+            hourly_patches, daily_patches, new_rows = {}, {}, []
+            for bloodbank_id, blood_group, units in balances:
+                key = (bloodbank_id, blood_group)
+                if key in hourly:
+                    hourly_patches.setdefault(_pack([units]), []).append(hourly[key])
+                else:
+                    slots = _empty_hourly()
+                    slots[now.hour] = units
+                    new_rows.append(StockSeries(
+                        bloodbank_id=bloodbank_id, blood_group=blood_group, resolution=StockSeries.HOURLY,
+                        start=day, data=_pack(slots),
+                    ))
+
+                low, high, _ = _unpack(daily[key][1], 3) if key in daily else (MISSING, MISSING, MISSING)
+                triple = (
+                    units if low == MISSING else min(low, units),
+                    units if high == MISSING else max(high, units),
+                    units,
+                )
+                if key in daily:
+                    daily_patches.setdefault(_pack(triple), []).append(daily[key][0])
+                else:
+                    days = _empty_daily()
+                    days[day_index] = triple
+                    new_rows.append(StockSeries(
+                        bloodbank_id=bloodbank_id, blood_group=blood_group, resolution=StockSeries.DAILY,
+                        start=year_start, data=_pack(days),
+                    ))
+
+            _patch(hourly_patches, hour_offset, 4, now)
+            _patch(daily_patches, day_offset, 12, now)
+            StockSeries.objects.bulk_create(new_rows)
+        sampled += len(balances)
+    return sampled
+
+
+def compact_series(today=None):
+    """Drop hourly rows past their retention (their daily rollup stays) and expired years.
+
+    Returns ``(hourly_deleted, daily_deleted)``.
+    """
+    today = today or timezone.localdate()
+    hourly_deleted, _ = StockSeries.objects.filter(
+        resolution=StockSeries.HOURLY, start__lte=today - timedelta(days=HOURLY_RETENTION_DAYS),
+    ).delete()
+    daily_deleted, _ = StockSeries.objects.filter(
+        resolution=StockSeries.DAILY, start__lt=date(today.year - DAILY_RETENTION_YEARS + 1, 1, 1),
+    ).delete()
+    return hourly_deleted, daily_deleted
+
+
+def series_range(bloodbank_id, blood_group, start, end, resolution):
+    """Points for one series between the dates ``start`` and ``end`` (inclusive).
+
+    Hourly points are ``{'at', 'units'}``; daily points are
+    ``{'date', 'min', 'max', 'close'}``. Days or hours without a sample are omitted.
+    """
+    first = start if resolution == StockSeries.HOURLY else _year_start(start)
+    rows = (
+        StockSeries.objects
+        .filter(bloodbank_id=bloodbank_id, blood_group=blood_group, resolution=resolution,
+                start__gte=first, start__lte=end)
+        .order_by('start')
+        .values_list('start', 'data')
+    )
+    tz = timezone.get_current_timezone()
+    points = []
+    for row_start, data in rows:
+        if resolution == StockSeries.HOURLY:
+            slots = _unpack(data, HOURS)
+            midnight = timezone.make_aware(datetime.combine(row_start, time()), tz)
+            for hour in np.flatnonzero(slots != MISSING).tolist():
+                points.append({'at': midnight + timedelta(hours=hour), 'units': int(slots[hour])})
+        else:
+            days = _unpack(data, (YEAR_DAYS, 3))
+            lo = max((start - row_start).days, 0)
+            hi = min((end - row_start).days, YEAR_DAYS - 1)
+            for index in (np.flatnonzero(days[lo:hi + 1, 2] != MISSING) + lo).tolist():
+                low, high, close = days[index].tolist()
+                points.append({
+                    'date': row_start + timedelta(days=index), 'min': low, 'max': high, 'close': close,
+                })
+    return points
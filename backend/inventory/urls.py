@@ -1,10 +1,17 @@
+from django.urls import path
 from rest_framework.routers import DefaultRouter
-from .views import InventoryViewSet
+from .streams import inventory_stream
+from .views import BloodUnitViewSet, InventoryViewSet, InventoryMovementViewSet, StockForecastViewSet
 
 
 router = DefaultRouter()
 router.register(r'inventory', InventoryViewSet)
+router.register(r'movements', InventoryMovementViewSet)
+router.register(r'units', BloodUnitViewSet)
+router.register(r'forecasts', StockForecastViewSet)
 
-urlpatterns = router.urls
+urlpatterns = router.urls + [
+    path('stream/', inventory_stream, name='inventory_stream'),
+]
 
 
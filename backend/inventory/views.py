@@ -1,7 +1,22 @@
-from rest_framework import viewsets, permissions, status
+from datetime import timedelta
+from rest_framework import viewsets, mixins, permissions, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied, ValidationError
 from rest_framework.response import Response
-from .models import Inventory
-from .serializers import InventorySerializer
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from .aggregates import region_availability
+from .compatibility import compatible_donor_groups, find_compatible_stock, normalize_blood_group
+from .models import BloodUnit, Inventory, InventoryMovement, StockForecast, StockSeries
+from .serializers import (
+    BloodUnitSerializer, InventorySerializer, InventoryMovementSerializer, StockForecastSerializer,
+)
+from .services import (
+    InsufficientStock, adjust_stock, balance_at, close_stock, fefo_units, issue_units, reconcile_stock, set_stock,
+    transfer_stock,
+)
+from .timeseries import HOURLY_RETENTION_DAYS, series_range
 
 
 class InventoryViewSet(viewsets.ModelViewSet):
@@ -16,6 +31,9 @@ class InventoryViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         qs = super().get_queryset()
         user = getattr(self.request, 'user', None)
+        # ?low_stock=true keeps only rows at or below their minimum level
+        if self.request.query_params.get('low_stock', '').lower() in ('1', 'true', 'yes'):
+            qs = qs.low_stock()
         # Blood bank users see only their own inventory; others can read all
         if user and hasattr(user, 'bloodbank'):
             return qs.filter(bloodbank=user.bloodbank)
@@ -25,36 +43,324 @@ class InventoryViewSet(viewsets.ModelViewSet):
         user = request.user
         # Auto-assign the current user's blood bank
         if not hasattr(user, 'bloodbank'):
-            from rest_framework.exceptions import PermissionDenied
             raise PermissionDenied('Only blood bank users can create inventory.')
-        
+
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        
-        # Handle unique constraint: if inventory for this blood group exists, update it instead
+
+        # Upsert on (bloodbank, blood_group): if inventory for this blood group exists, update it instead
         blood_group = serializer.validated_data.get('blood_group')
         units_available = serializer.validated_data.get('units_available', 0)
         min_stock_level = serializer.validated_data.get('min_stock_level', 5)
-        
-        inventory, created = Inventory.objects.get_or_create(
-            bloodbank=user.bloodbank,
-            blood_group=blood_group,
-            defaults={
-                'units_available': units_available,
-                'min_stock_level': min_stock_level
-            }
-        )
-        
-        if not created:
-            # Update existing inventory
-            inventory.units_available = units_available
-            inventory.min_stock_level = min_stock_level
-            inventory.save()
+
+        result = set_stock(user.bloodbank, blood_group, units_available, min_stock_level, created_by=user)
+        inventory = Inventory.objects.get(bloodbank=user.bloodbank, blood_group=blood_group)
+        serializer = self.get_serializer(inventory)
+
+        if result['status'] != 'created':
             # Return updated inventory
-            serializer = self.get_serializer(inventory)
             return Response(serializer.data, status=status.HTTP_200_OK)
-        
+
         # Return created inventory
-        serializer = self.get_serializer(inventory)
         headers = self.get_success_headers(serializer.data)
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+
+    def perform_update(self, serializer):
+        # Route balance edits through the ledger instead of overwriting the row
+        instance = serializer.instance
+        data = serializer.validated_data
+        if data.get('blood_group', instance.blood_group) != instance.blood_group:
+            raise ValidationError({'blood_group': ['Blood group of an inventory row cannot be changed.']})
+        set_stock(
+            instance.bloodbank_id,
+            instance.blood_group,
+            data.get('units_available', instance.units_available),
+            data.get('min_stock_level', instance.min_stock_level),
+            created_by=self.request.user,
+        )
+        instance.refresh_from_db()
+
+    def perform_destroy(self, instance):
+        # Book the remaining units out through the ledger before the row goes
+        if getattr(self.request.user, 'bloodbank', None) != instance.bloodbank:
+            raise PermissionDenied('Only the owning blood bank can delete its inventory.')
+        close_stock(instance.bloodbank_id, instance.blood_group, created_by=self.request.user)
+
+    @action(detail=False, methods=['post'])
+    def bulk_upsert(self, request):
+        """Apply an end-of-shift stock sheet for the current bank in one transaction.
+        Body: a list of {blood_group, units_available, min_stock_level?} (or {"rows": [...]}).
+        Every row is validated before anything is written.
+        """
+        user = request.user
+        if not hasattr(user, 'bloodbank'):
+            raise PermissionDenied('Only blood bank users can update inventory.')
+
+        rows = request.data.get('rows') if isinstance(request.data, dict) else request.data
+        if not isinstance(rows, list) or not rows:
+            return Response({'error': 'Provide a non-empty list of rows'}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = self.get_serializer(data=rows, many=True)
+        serializer.is_valid(raise_exception=True)
+        validated = serializer.validated_data
+        errors = [{} for _ in validated]
+        seen = set()
+        for index, row in enumerate(validated):
+            if 'blood_group' not in row or 'units_available' not in row:
+                errors[index] = {'non_field_errors': ['blood_group and units_available are required']}
+            elif row['blood_group'] in seen:
+                errors[index] = {'blood_group': [f"Duplicate row for {row['blood_group']}"]}
+            seen.add(row.get('blood_group'))
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        results = reconcile_stock(user.bloodbank, validated, created_by=user)
+        return Response({'bloodbank': user.bloodbank.id, 'results': results})
+
+    @action(detail=False, methods=['get'])
+    def low_stock_summary(self, request):
+        """Number of low-stock rows (and units short) per blood group, scoped like the list."""
+        rows = (
+            self.get_queryset().low_stock()
+            .values('blood_group')
+            .annotate(low_stock_count=Count('id'), units_short=Sum(F('min_stock_level') - F('units_available')))
+            .order_by('blood_group')
+        )
+        return Response(list(rows))
+
+    @action(detail=False, methods=['get'])
+    def compatible(self, request):
+        """Banks able to cover a request from any ABO/Rh-compatible group.
+        Query params: ?blood_group= (recipient), ?units=, ?city=, ?state=, ?limit=
+        """
+        params = request.query_params
+        blood_group = normalize_blood_group(params.get('blood_group'))
+        if not blood_group:
+            return Response({'error': 'A valid recipient blood_group is required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            units = int(params.get('units', 1))
+            limit = min(int(params.get('limit', 50)), 200)
+        except (TypeError, ValueError):
+            return Response({'error': 'units and limit must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        if units <= 0 or limit <= 0:
+            return Response({'error': 'units and limit must be > 0'}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'blood_group': blood_group,
+            'units': units,
+            'compatible_groups': compatible_donor_groups(blood_group),
+            'results': find_compatible_stock(
+                blood_group, units, city=params.get('city'), state=params.get('state'), limit=limit,
+            ),
+        })
+
+    @action(detail=False, methods=['get'])
+    def availability(self, request):
+        """Network-wide totals per (state, city, blood_group) for approved, operational banks.
+        Query params: ?state=, ?city=, ?blood_group=
+        """
+        params = request.query_params
+        blood_group = None
+        if params.get('blood_group'):
+            blood_group = normalize_blood_group(params['blood_group'])
+            if not blood_group:
+                return Response({'error': 'Invalid blood_group'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(region_availability(
+            state=params.get('state'),
+            city=params.get('city'),
+            blood_group=blood_group,
+        ))
+
+    @action(detail=False, methods=['get'])
+    def history(self, request):
+        """Stock level history for one blood group, from the packed snapshot series.
+        Query params: ?blood_group=, ?bloodbank= (non-bloodbank users), ?start=, ?end= (YYYY-MM-DD),
+        ?resolution=hour|day (defaults to hour for ranges within the hourly retention)
+        """
+        params = request.query_params
+        user = request.user
+        if hasattr(user, 'bloodbank'):
+            bloodbank_id = user.bloodbank.id
+        else:
+            try:
+                bloodbank_id = int(params.get('bloodbank', ''))
+            except ValueError:
+                return Response({'error': 'bloodbank is required'}, status=status.HTTP_400_BAD_REQUEST)
+        blood_group = normalize_blood_group(params.get('blood_group'))
+        if not blood_group:
+            return Response({'error': 'A valid blood_group is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            end = parse_date(params['end']) if params.get('end') else timezone.localdate()
+            start = parse_date(params['start']) if params.get('start') else end - timedelta(days=365)
+        except (TypeError, ValueError):
+            start = end = None
+        if start is None or end is None or start > end:
+            return Response({'error': 'Invalid start/end. Use YYYY-MM-DD with start <= end'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        default_resolution = StockSeries.HOURLY if (end - start).days < HOURLY_RETENTION_DAYS else StockSeries.DAILY
+        resolution = params.get('resolution', default_resolution)
+        if resolution not in (StockSeries.HOURLY, StockSeries.DAILY):
+            return Response({'error': 'resolution must be hour or day'}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'bloodbank': bloodbank_id,
+            'blood_group': blood_group,
+            'resolution': resolution,
+            'start': start,
+            'end': end,
+            'points': series_range(bloodbank_id, blood_group, start, end, resolution),
+        })
+
+
+class InventoryMovementViewSet(mixins.CreateModelMixin, viewsets.ReadOnlyModelViewSet):
+    """Append-only stock ledger. Movements are never updated or deleted."""
+    queryset = InventoryMovement.objects.all().order_by('-created_at', '-id')
+    serializer_class = InventoryMovementSerializer
+    filterset_fields = ['bloodbank', 'blood_group', 'movement_type']
+    ordering_fields = ['created_at', 'quantity']
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        user = self.request.user
+        # Blood bank users see only their own ledger; others can read all
+        if hasattr(user, 'bloodbank'):
+            return qs.filter(bloodbank=user.bloodbank)
+        return qs
+
+    def create(self, request, *args, **kwargs):
+        user = request.user
+        if not hasattr(user, 'bloodbank'):
+            raise PermissionDenied('Only blood bank users can record stock movements.')
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        movement_type = data['movement_type']
+        blood_group = data['blood_group']
+        quantity = data['quantity']
+        note = data.get('note', '')
+
+        try:
+            if movement_type == InventoryMovement.TRANSFER:
+                movement, _ = transfer_stock(
+                    user.bloodbank, data['to_bloodbank'], blood_group, quantity, note=note, created_by=user
+                )
+            elif movement_type == InventoryMovement.EXPIRY:
+                movement = adjust_stock(user.bloodbank, blood_group, -quantity, movement_type, note=note, created_by=user)
+            else:
+                movement = adjust_stock(user.bloodbank, blood_group, quantity, movement_type, note=note, created_by=user)
+        except InsufficientStock as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(self.get_serializer(movement).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get'])
+    def balance(self, request):
+        """Balances per blood group as of ``?at=<ISO datetime>`` (defaults to now)
+        for the current bank, or for ``?bloodbank=<id>`` for other users.
+        """
+        user = request.user
+        if hasattr(user, 'bloodbank'):
+            bloodbank_id = user.bloodbank.id
+        else:
+            bloodbank_id = request.query_params.get('bloodbank')
+            if not bloodbank_id:
+                return Response({'error': 'bloodbank is required'}, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                bloodbank_id = int(bloodbank_id)
+            except ValueError:
+                return Response({'error': 'bloodbank must be an integer id'}, status=status.HTTP_400_BAD_REQUEST)
+        raw_at = request.query_params.get('at')
+        if raw_at:
+            at = parse_datetime(raw_at)
+            if at is None:
+                return Response({'error': 'Invalid at. Use an ISO 8601 datetime'}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            at = timezone.now()
+        return Response({
+            'bloodbank': bloodbank_id,
+            'at': at,
+            'balances': balance_at(bloodbank_id, at),
+        })
+
+
+class BloodUnitViewSet(viewsets.ReadOnlyModelViewSet):
+    """Tracked bags. Issue is first-expired-first-out; expiry is handled by ``expire_blood_units``."""
+    queryset = BloodUnit.objects.all().order_by('expires_at')
+    serializer_class = BloodUnitSerializer
+    filterset_fields = ['bloodbank', 'blood_group', 'component', 'status', 'donation']
+    search_fields = ['bag_id']
+    ordering_fields = ['expires_at', 'collected_at']
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        user = self.request.user
+        # Blood bank users see only their own bags; others can read all
+        if hasattr(user, 'bloodbank'):
+            return qs.filter(bloodbank=user.bloodbank)
+        return qs
+
+    @action(detail=False, methods=['get'], url_path='next')
+    def next_unit(self, request):
+        """The next bag to issue for ?blood_group= (and optional ?component=)."""
+        if not hasattr(request.user, 'bloodbank'):
+            raise PermissionDenied('Only blood bank users can issue units.')
+        blood_group = normalize_blood_group(request.query_params.get('blood_group'))
+        if not blood_group:
+            return Response({'error': 'A valid blood_group is required'}, status=status.HTTP_400_BAD_REQUEST)
+        ids = fefo_units(request.user.bloodbank, blood_group, 1, request.query_params.get('component'))
+        if not ids:
+            return Response({'detail': f'No available {blood_group} units'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(self.get_serializer(BloodUnit.objects.get(id=ids[0])).data)
+
+    @action(detail=False, methods=['post'])
+    def issue(self, request):
+        """Issue bags FEFO. Body: blood_group, count, component?, reference?"""
+        user = request.user
+        if not hasattr(user, 'bloodbank'):
+            raise PermissionDenied('Only blood bank users can issue units.')
+        blood_group = normalize_blood_group(request.data.get('blood_group'))
+        if not blood_group:
+            return Response({'error': 'A valid blood_group is required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            count = int(request.data.get('count', 1))
+        except (TypeError, ValueError):
+            return Response({'error': 'count must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        if count <= 0:
+            return Response({'error': 'count must be > 0'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            bag_ids = issue_units(
+                user.bloodbank, blood_group, count,
+                component=request.data.get('component') or None,
+                reference=str(request.data.get('reference', ''))[:64],
+                created_by=user,
+            )
+        except InsufficientStock as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'blood_group': blood_group, 'issued': bag_ids})
+
+
+class StockForecastViewSet(viewsets.ReadOnlyModelViewSet):
+    """Projected days of cover per bank and blood group, refreshed nightly by ``forecast_inventory``.
+    ``days_of_cover`` is null when projected supply meets or exceeds demand.
+    """
+    queryset = StockForecast.objects.select_related('bloodbank').order_by(F('days_of_cover').asc(nulls_last=True))
+    serializer_class = StockForecastSerializer
+    filterset_fields = ['bloodbank', 'blood_group']
+    ordering_fields = ['days_of_cover', 'projected_daily_demand', 'units_available']
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        user = self.request.user
+        # Blood bank users see only their own forecasts; others can read all
+        if hasattr(user, 'bloodbank'):
+            return qs.filter(bloodbank=user.bloodbank)
+        return qs
@@ -1,5 +1,17 @@
 from django.contrib import admin
-from .models import BloodRequest
+from .models import BloodRequest, RequestMatch
+
+
+class RequestMatchInline(admin.TabularInline):
+    model = RequestMatch
+    extra = 0
+    fields = ('rank', 'bloodbank', 'score', 'compatible_units', 'exact_units', 'distance_km', 'created_at')
+    readonly_fields = fields
+    can_delete = False
+    ordering = ('rank',)
+
+    def has_add_permission(self, request, obj=None):
+        return False
 
 
 @admin.register(BloodRequest)
@@ -9,6 +21,7 @@ class BloodRequestAdmin(admin.ModelAdmin):
     search_fields = ('patient_name', 'hospital_name', 'doctor_name', 'contact_number', 'requester__username')
     readonly_fields = ('request_id', 'created_at', 'approved_at', 'fulfilled_at')
     ordering = ('-created_at',)
+    inlines = [RequestMatchInline]
     
     fieldsets = (
         ('Request Information', {
@@ -18,7 +31,7 @@ class BloodRequestAdmin(admin.ModelAdmin):
             'fields': ('patient_name', 'blood_group', 'units_required', 'urgency', 'required_date')
         }),
         ('Hospital Information', {
-            'fields': ('hospital_name', 'doctor_name', 'contact_number', 'reason')
+            'fields': ('hospital_name', 'doctor_name', 'contact_number', 'reason', 'city', 'state', 'latitude', 'longitude')
         }),
         ('Documents', {
             'fields': ('prescription_document',)
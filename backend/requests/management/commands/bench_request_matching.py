@@ -0,0 +1,96 @@
+"""
+Benchmark request-to-bank matching against a synthetic network.
+
+Creates N blood banks with coordinates and stock inside a transaction,
+matches a batch of requests against them, reports timings and query counts,
+then rolls everything back.
+
+    python manage.py bench_request_matching --banks 10000 --requests 20
+"""
+import random
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from accounts.models import User
+from bloodbank.models import BloodBank
+from inventory.compatibility import GROUP_CODES
+from inventory.models import Inventory
+from requests.matching import match_request
+from requests.models import BloodRequest
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Time matching blood requests against many banks (data is rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--banks', type=int, default=10000)
+        parser.add_argument('--requests', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            self.stdout.write('Benchmark data rolled back.')
+
+    def run(self, options):
+        rng = random.Random(options['seed'])
+        n_banks = options['banks']
+        tag = f'bench{time.time_ns() % 10 ** 8}'
+
+        started = time.perf_counter()
+        users = User.objects.bulk_create([
+            User(username=f'{tag}-{i}', email=f'{tag}-{i}@bench.invalid', phone=f'{tag}{i}', user_type='bloodbank')
+            for i in range(n_banks)
+        ])
+        banks = BloodBank.objects.bulk_create([
+            BloodBank(
+                user=user, name=f'Bench Bank {i}', registration_number=f'{tag}-{i}',
+                city=f'City {i % 200}', state=f'State {i % 20}',
+                # Roughly the Indian subcontinent
+                latitude=round(rng.uniform(8, 35), 6), longitude=round(rng.uniform(68, 97), 6),
+                is_operational=rng.random() > 0.05,
+            )
+            for i, user in enumerate(users)
+        ], batch_size=2000)
+        Inventory.objects.bulk_create([
+            Inventory(bloodbank=bank, blood_group=group, units_available=rng.randint(0, 40))
+            for bank in banks for group in GROUP_CODES
+        ], batch_size=5000)
+        self.stdout.write(f'Seeded {n_banks} banks in {time.perf_counter() - started:.1f}s')
+
+        requester = users[0]
+        requests = BloodRequest.objects.bulk_create([
+            BloodRequest(
+                requester=requester, patient_name='Bench', blood_group=rng.choice(GROUP_CODES),
+                units_required=rng.randint(1, 6), urgency=rng.choice(['emergency', 'urgent', 'normal']),
+                required_date=date.today(), hospital_name='Bench', doctor_name='Bench', contact_number='0',
+                reason='bench', latitude=round(rng.uniform(8, 35), 6), longitude=round(rng.uniform(68, 97), 6),
+            )
+            for _ in range(options['requests'])
+        ])
+
+        timings, queries = [], 0
+        for blood_request in requests:
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                match_request(blood_request)
+                timings.append(time.perf_counter() - started)
+            queries = max(queries, len(captured))
+
+        timings.sort()
+        self.stdout.write(
+            f'{len(requests)} requests: median {timings[len(timings) // 2] * 1000:.1f} ms, '
+            f'max {timings[-1] * 1000:.1f} ms, at most {queries} queries per request'
+        )
+        self.stdout.write(self.style.SUCCESS('Matching benchmark complete'))
@@ -0,0 +1,133 @@
+"""
+Rank blood banks able to serve a new blood request.
+
+Candidates are approved, operational banks holding any ABO/Rh-compatible
+stock. Their compatible and exact-group totals come from one grouped
+``Inventory`` query; distances and scores are then computed for all
+candidates at once with NumPy. Matching a request therefore costs a fixed
+number of queries (one read, one delete, one bulk insert) however many
+banks there are.
+
+Score (higher is better), each term in [0, 1]:
+
+* coverage of ``units_required`` from compatible stock (weight 0.5);
+* coverage from the exact requested group, which preserves O- for those who
+  need it (weight 0.2);
+* proximity, ``exp(-distance / scale)`` with a shorter scale the more urgent
+  the request is (weight 0.3). Without coordinates on either side, a bank in
+  the same city scores 1 and one in the same state 0.5.
+"""
+import numpy as np
+from django.db import transaction
+from django.db.models import Q, Sum
+
+from geo.grid import haversine_km
+from inventory.compatibility import compatible_donor_groups
+from inventory.models import Inventory
+from .models import RequestMatch
+
+
+MATCH_LIMIT = 10
+COVERAGE_WEIGHT = 0.5
+EXACT_WEIGHT = 0.2
+PROXIMITY_WEIGHT = 0.3
+# Distance (km) at which proximity drops to 1/e, per urgency
+DISTANCE_SCALE_KM = {
+    'emergency': 15.0,
+    'urgent': 50.0,
+    'normal': 150.0,
+}
+
+
+def _location_key(value):
+    return (value or '').strip().lower()
+
+
+def candidate_stock(blood_group):
+    """One row per approved, operational bank with compatible stock."""
+    return list(
+        Inventory.objects.filter(
+            blood_group__in=compatible_donor_groups(blood_group),
+            units_available__gt=0,
+            bloodbank__status='approved',
+            bloodbank__is_operational=True,
+        )
+        .values('bloodbank_id', 'bloodbank__latitude', 'bloodbank__longitude', 'bloodbank__city', 'bloodbank__state')
+        .annotate(
+            compatible_units=Sum('units_available'),
+            exact_units=Sum('units_available', filter=Q(blood_group=blood_group), default=0),
+        )
+        .values_list(
+            'bloodbank_id', 'compatible_units', 'exact_units',
+            'bloodbank__latitude', 'bloodbank__longitude', 'bloodbank__city', 'bloodbank__state',
+        )
+        .order_by()
+    )
+
+
+def score_candidates(rows, units_required, urgency, latitude=None, longitude=None, city='', state='', limit=MATCH_LIMIT):
+    """Score ``candidate_stock`` rows and return the best ``limit`` as dicts, best first."""
+    if not rows:
+        return []
+    columns = list(zip(*rows))
+    bank_ids = np.array(columns[0], dtype=np.int64)
+    compatible = np.array(columns[1], dtype=np.float64)
+    exact = np.array(columns[2], dtype=np.float64)
+    lats = np.array([np.nan if v is None else float(v) for v in columns[3]])
+    lons = np.array([np.nan if v is None else float(v) for v in columns[4]])
+
+    units = max(units_required, 1)
+    coverage = np.minimum(compatible / units, 1.0)
+    exact_coverage = np.minimum(exact / units, 1.0)
+
+    distance = np.full(len(rows), np.nan)
+    if latitude is not None and longitude is not None:
+        distance = haversine_km(float(latitude), float(longitude), lats, lons)
+    scale = DISTANCE_SCALE_KM.get(urgency, DISTANCE_SCALE_KM['normal'])
+    proximity = np.exp(-np.nan_to_num(distance, nan=np.inf) / scale)
+    # Fall back to city/state for banks (or requests) without coordinates
+    unknown = np.isnan(distance)
+    if unknown.any() and (city or state):
+        same_city = np.array([bool(city) and _location_key(c) == _location_key(city) for c in columns[5]])
+        same_state = np.array([bool(state) and _location_key(s) == _location_key(state) for s in columns[6]])
+        proximity = np.where(unknown, np.where(same_city, 1.0, np.where(same_state, 0.5, 0.0)), proximity)
+
+    score = COVERAGE_WEIGHT * coverage + EXACT_WEIGHT * exact_coverage + PROXIMITY_WEIGHT * proximity
+    limit = min(limit, len(rows))
+    top = np.argpartition(-score, limit - 1)[:limit]
+    top = top[np.lexsort((bank_ids[top], -score[top]))]
+    return [
+        {
+            'bloodbank_id': int(bank_ids[i]),
+            'score': round(float(score[i]), 4),
+            'compatible_units': int(compatible[i]),
+            'exact_units': int(exact[i]),
+            'distance_km': None if np.isnan(distance[i]) else round(float(distance[i]), 2),
+        }
+        for i in top.tolist()
+    ]
+
+
+def rank_banks(blood_request, limit=MATCH_LIMIT):
+    """Best banks for ``blood_request`` without storing anything."""
+    return score_candidates(
+        candidate_stock(blood_request.blood_group),
+        blood_request.units_required,
+        blood_request.urgency,
+        latitude=blood_request.latitude,
+        longitude=blood_request.longitude,
+        city=blood_request.city,
+        state=blood_request.state,
+        limit=limit,
+    )
+
+
+def match_request(blood_request, limit=MATCH_LIMIT):
+    """Replace the stored top-``limit`` matches for ``blood_request`` and return them."""
+    ranked = rank_banks(blood_request, limit)
+    with transaction.atomic():
+        RequestMatch.objects.filter(request=blood_request).delete()
+        return RequestMatch.objects.bulk_create([
+            RequestMatch(request=blood_request, rank=rank, **match)
+            for rank, match in enumerate(ranked, start=1)
+        ])
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.7 on 2026-10-17 11:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bloodbank', '0006_alter_bloodbank_status_alter_campregistration_status'),
+        ('requests', '0003_alter_bloodrequest_bloodbank'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bloodrequest',
+            name='city',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='bloodrequest',
+            name='latitude',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True),
+        ),
+        migrations.AddField(
+            model_name='bloodrequest',
+            name='longitude',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True),
+        ),
+        migrations.AddField(
+            model_name='bloodrequest',
+            name='state',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.CreateModel(
+            name='RequestMatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('compatible_units', models.IntegerField()),
+                ('exact_units', models.IntegerField()),
+                ('distance_km', models.FloatField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('bloodbank', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='request_matches', to='bloodbank.bloodbank')),
+                ('request', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='matches', to='requests.bloodrequest')),
+            ],
+            options={
+                'ordering': ['request', 'rank'],
+                'indexes': [models.Index(fields=['bloodbank', 'rank'], name='requestmatch_bank_idx')],
+                'unique_together': {('request', 'bloodbank')},
+            },
+        ),
+    ]
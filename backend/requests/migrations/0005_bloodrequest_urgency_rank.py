@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-17 11:55
+
+from django.db import migrations, models
+
+
+def backfill_urgency_rank(apps, schema_editor):
+    BloodRequest = apps.get_model('requests', 'BloodRequest')
+    for urgency, rank in (('emergency', 0), ('urgent', 1)):
+        BloodRequest.objects.filter(urgency=urgency).update(urgency_rank=rank)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('requests', '0004_request_location_and_matches'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bloodrequest',
+            name='urgency_rank',
+            field=models.PositiveSmallIntegerField(default=2, editable=False),
+        ),
+        migrations.RunPython(backfill_urgency_rank, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='bloodrequest',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['urgency_rank', 'required_date', 'created_at'], name='bloodrequest_triage_idx'),
+        ),
+    ]
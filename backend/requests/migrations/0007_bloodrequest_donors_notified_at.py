@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-17 13:10
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def mark_existing_notified(apps, schema_editor):
+    # Emergencies created before the queue existed were fanned out inline
+    BloodRequest = apps.get_model('requests', 'BloodRequest')
+    BloodRequest.objects.filter(urgency='emergency').update(donors_notified_at=F('created_at'))
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('requests', '0006_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bloodrequest',
+            name='donors_notified_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(mark_existing_notified, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='bloodrequest',
+            index=models.Index(condition=models.Q(('donors_notified_at__isnull', True), ('urgency', 'emergency')), fields=['created_at'], name='bloodrequest_fanout_idx'),
+        ),
+    ]
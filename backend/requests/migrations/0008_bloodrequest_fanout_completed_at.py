@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-17 13:30
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def mark_claimed_completed(apps, schema_editor):
+    # Earlier claims were never retried, so treat them as finished
+    BloodRequest = apps.get_model('requests', 'BloodRequest')
+    BloodRequest.objects.filter(donors_notified_at__isnull=False).update(fanout_completed_at=F('donors_notified_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('requests', '0007_bloodrequest_donors_notified_at'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='bloodrequest',
+            name='bloodrequest_fanout_idx',
+        ),
+        migrations.AddField(
+            model_name='bloodrequest',
+            name='fanout_completed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(mark_claimed_completed, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='bloodrequest',
+            index=models.Index(condition=models.Q(('fanout_completed_at__isnull', True), ('urgency', 'emergency')), fields=['created_at'], name='bloodrequest_fanout_idx'),
+        ),
+    ]
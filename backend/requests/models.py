@@ -23,6 +23,13 @@ class BloodRequest(models.Model):
         ('normal', 'Normal'),
     )
 
+    # Triage order, most urgent first; stored so the queue can be read off an index
+    URGENCY_RANKS = {
+        'emergency': 0,
+        'urgent': 1,
+        'normal': 2,
+    }
+
     STATUS_CHOICES = (
         ('pending', 'Pending'),
         ('approved', 'Approved'),
@@ -37,17 +44,29 @@ class BloodRequest(models.Model):
     blood_group = models.CharField(max_length=3, choices=BLOOD_GROUPS)
     units_required = models.IntegerField()
     urgency = models.CharField(max_length=20, choices=URGENCY_LEVELS)
+    urgency_rank = models.PositiveSmallIntegerField(default=2, editable=False)
     required_date = models.DateField()
     hospital_name = models.CharField(max_length=200)
     doctor_name = models.CharField(max_length=200)
     contact_number = models.CharField(max_length=15)
     reason = models.TextField()
+    # Hospital location, used to rank nearby blood banks (see requests.matching)
+    city = models.CharField(max_length=100, blank=True)
+    state = models.CharField(max_length=100, blank=True)
+    latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     prescription_document = models.FileField(upload_to='prescriptions/', null=True, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    # Status the last transition moved the request from, set by the same UPDATE (see requests.transitions)
+    previous_status = models.CharField(max_length=20, choices=STATUS_CHOICES, blank=True, editable=False)
     admin_notes = models.TextField(blank=True)
     approved_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='approved_requests')
     approved_at = models.DateTimeField(null=True, blank=True)
     fulfilled_at = models.DateTimeField(null=True, blank=True)
+    # Set when an emergency request is claimed for the donor fan-out, and when every batch
+    # has been sent (see donors.fanout)
+    donors_notified_at = models.DateTimeField(null=True, blank=True, editable=False)
+    fanout_completed_at = models.DateTimeField(null=True, blank=True, editable=False)
     request_id = models.CharField(max_length=6, unique=True, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -55,5 +74,50 @@ class BloodRequest(models.Model):
     def __str__(self):
         return f"{self.patient_name} - {self.blood_group} - {self.status}"
 
+    def save(self, *args, **kwargs):
+        self.urgency_rank = self.URGENCY_RANKS.get(self.urgency, self.URGENCY_RANKS['normal'])
+        if kwargs.get('update_fields') is not None and 'urgency' in kwargs['update_fields']:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'urgency_rank'}
+        super().save(*args, **kwargs)
+
     class Meta:
-        ordering = ['-created_at']
\ No newline at end of file
+        ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination on the default ordering
+            models.Index(fields=['created_at', 'id'], name='bloodrequest_created_idx'),
+            # Triage queue: pending requests by urgency, due date, then age
+            models.Index(
+                fields=['urgency_rank', 'required_date', 'created_at'],
+                name='bloodrequest_triage_idx',
+                condition=models.Q(status='pending'),
+            ),
+            # Emergencies whose donor fan-out has not finished
+            models.Index(
+                fields=['created_at'],
+                name='bloodrequest_fanout_idx',
+                condition=models.Q(urgency='emergency', fanout_completed_at__isnull=True),
+            ),
+        ]
+
+
+class RequestMatch(models.Model):
+    """A blood bank ranked as able to serve a request (top-N, refreshed on create)."""
+    request = models.ForeignKey(BloodRequest, on_delete=models.CASCADE, related_name='matches')
+    bloodbank = models.ForeignKey(BloodBank, on_delete=models.CASCADE, related_name='request_matches')
+    rank = models.PositiveSmallIntegerField()  # 1 = best
+    score = models.FloatField()
+    compatible_units = models.IntegerField()  # units of any compatible group at match time
+    exact_units = models.IntegerField()  # units of the requested group itself
+    distance_km = models.FloatField(null=True, blank=True)  # null when either location is unknown
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('request', 'bloodbank')
+        ordering = ['request', 'rank']
+        indexes = [
+            # A bank's "requests you can fulfil" queue
+            models.Index(fields=['bloodbank', 'rank'], name='requestmatch_bank_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.request_id} -> {self.bloodbank_id} (#{self.rank})"
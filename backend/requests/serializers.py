@@ -1,11 +1,12 @@
 from rest_framework import serializers
-from .models import BloodRequest
+from .models import BloodRequest, RequestMatch
 
 
 class BloodRequestSerializer(serializers.ModelSerializer):
-    bloodbank_name = serializers.SerializerMethodField()
-    approved_by_username = serializers.SerializerMethodField()
-    requester_username = serializers.SerializerMethodField()
+    # Dotted sources (not method fields) so the viewset can plan the joins
+    bloodbank_name = serializers.CharField(source='bloodbank.name', read_only=True, allow_null=True)
+    approved_by_username = serializers.CharField(source='approved_by.username', read_only=True, allow_null=True)
+    requester_username = serializers.CharField(source='requester.username', read_only=True, allow_null=True)
     
     class Meta:
         model = BloodRequest
@@ -17,18 +18,18 @@ class BloodRequestSerializer(serializers.ModelSerializer):
             'request_id': {'read_only': True},
         }
 
-    def get_bloodbank_name(self, obj):
-        return obj.bloodbank.name if obj.bloodbank else None
-
-    def get_approved_by_username(self, obj):
-        return obj.approved_by.username if obj.approved_by else None
-
-    def get_requester_username(self, obj):
-        return obj.requester.username if obj.requester else None
-
     def validate_units_required(self, value: int):
         if value <= 0:
             raise serializers.ValidationError('units_required must be > 0')
         return value
 
 
+class RequestMatchSerializer(serializers.ModelSerializer):
+    bloodbank_name = serializers.CharField(source='bloodbank.name', read_only=True)
+    bloodbank_city = serializers.CharField(source='bloodbank.city', read_only=True)
+    bloodbank_phone = serializers.CharField(source='bloodbank.phone', read_only=True)
+
+    class Meta:
+        model = RequestMatch
+        fields = ('bloodbank', 'bloodbank_name', 'bloodbank_city', 'bloodbank_phone', 'rank', 'score',
+                  'compatible_units', 'exact_units', 'distance_km', 'created_at')
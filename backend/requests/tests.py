@@ -1,3 +1,468 @@
-from django.test import TestCase
+import threading
+import time
+from datetime import timedelta
 
-# Create your tests here.
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts.models import User
+from bloodbank.models import BloodBank
+from inventory.models import Inventory, InventoryMovement
+from inventory.services import set_stock
+from .matching import MATCH_LIMIT, match_request, rank_banks
+from .models import BloodRequest, RequestMatch
+from .transitions import InvalidTransition, transition
+
+
+def make_bank(n):
+    user = User.objects.create(username=f'bank{n}', email=f'bank{n}@example.com', phone=f'90000000{n:02d}',
+                               user_type='bloodbank')
+    BloodBank.objects.create(user=user, name=f'Bank {n}', registration_number=f'REG{n}')
+    return User.objects.select_related('bloodbank').get(pk=user.pk)
+
+
+def auth(user):
+    return {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(user).access_token}'}
+
+
+def make_request(requester, **kwargs):
+    fields = dict(
+        requester=requester, patient_name='Patient', blood_group='O+', units_required=2, urgency='urgent',
+        required_date=timezone.localdate(), hospital_name='City Hospital', doctor_name='Dr. Rao',
+        contact_number='9999999999', reason='Surgery',
+    )
+    fields.update(kwargs)
+    return BloodRequest.objects.create(**fields)
+
+
+class TransitionTests(TestCase):
+    def setUp(self):
+        self.bank_user = make_bank(1)
+        self.requester = User.objects.create(username='donor', email='donor@example.com', phone='8000000000',
+                                             user_type='donor')
+
+    def test_approve_costs_two_queries(self):
+        blood_request = make_request(self.requester)
+        with self.assertNumQueries(2):
+            approved = transition(blood_request.pk, 'approved', self.bank_user)
+        self.assertEqual((approved.previous_status, approved.status), ('pending', 'approved'))
+        self.assertEqual(approved.bloodbank_id, self.bank_user.bloodbank.id)
+        self.assertEqual(approved.approved_by_id, self.bank_user.id)
+
+    def test_reject_requires_pending(self):
+        blood_request = make_request(self.requester, status='approved')
+        with self.assertNumQueries(2), self.assertRaises(InvalidTransition) as ctx:
+            transition(blood_request.pk, 'rejected', self.bank_user)
+        self.assertEqual(ctx.exception.current, 'approved')
+
+    def test_approve_overrides_rejection(self):
+        blood_request = make_request(self.requester, status='rejected')
+        with self.assertNumQueries(2):
+            approved = transition(blood_request.pk, 'approved', self.bank_user)
+        self.assertEqual((approved.previous_status, approved.status), ('rejected', 'approved'))
+        self.assertEqual(make_request(self.requester).previous_status, '')
+
+    def test_unknown_request(self):
+        with self.assertRaises(BloodRequest.DoesNotExist):
+            transition(0, 'approved', self.bank_user)
+
+
+class BulkTransitionTests(TestCase):
+    def setUp(self):
+        self.bank_user = make_bank(1)
+        self.requester = User.objects.create(username='donor', email='donor@example.com', phone='8000000000',
+                                             user_type='donor')
+        token = RefreshToken.for_user(self.bank_user).access_token
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+
+    def post(self, ids, target):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/requests/requests/bulk_transition/', {'ids': ids, 'status': target},
+                                        content_type='application/json', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.json()
+
+    def test_per_id_outcomes(self):
+        pending = make_request(self.requester)
+        rejected = make_request(self.requester, status='rejected')
+        approved = make_request(self.requester, status='approved')
+        _, data = self.post([pending.pk, rejected.pk, approved.pk, 0], 'approved')
+        self.assertEqual(data['applied'], 2)
+        self.assertEqual(data['results'], [
+            {'id': pending.pk, 'outcome': 'applied', 'previous_status': 'pending'},
+            {'id': rejected.pk, 'outcome': 'applied', 'previous_status': 'rejected'},
+            {'id': approved.pk, 'outcome': 'skipped', 'status': 'approved'},
+            {'id': 0, 'outcome': 'not_found'},
+        ])
+        pending.refresh_from_db()
+        self.assertEqual(pending.approved_by_id, self.bank_user.id)
+        self.assertEqual(pending.bloodbank_id, self.bank_user.bloodbank.id)
+
+    def test_query_count_is_constant(self):
+        small, _ = self.post([make_request(self.requester).pk], 'rejected')
+        ids = [make_request(self.requester).pk for _ in range(30)]
+        large, data = self.post(ids, 'rejected')
+        self.assertEqual(data['applied'], 30)
+        self.assertEqual(small, large)
+
+
+class ListQueryCountTests(TestCase):
+    def setUp(self):
+        self.bank_user = make_bank(1)
+        self.other_bank = make_bank(2)
+        self.requester = User.objects.create(username='donor', email='donor@example.com', phone='8000000000',
+                                             user_type='donor')
+        token = RefreshToken.for_user(self.bank_user).access_token
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+
+    def list_query_count(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/requests/requests/', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.json()
+
+    def test_list_query_count_is_constant(self):
+        make_request(self.requester)
+        small, _ = self.list_query_count()
+
+        # A full page mixing assigned, approved and unassigned requests
+        for n in range(30):
+            make_request(
+                self.requester,
+                bloodbank=self.other_bank.bloodbank if n % 2 else None,
+                approved_by=self.other_bank if n % 3 else None,
+            )
+        full, data = self.list_query_count()
+
+        self.assertEqual(len(data['results']), 20)
+        self.assertEqual(small, full)
+        # user, bank lookup, count, page
+        self.assertEqual(full, 4)
+        row = next(r for r in data['results'] if r['bloodbank'])
+        self.assertEqual(row['bloodbank_name'], 'Bank 2')
+        self.assertEqual(row['requester_username'], 'donor')
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.bank_user = make_bank(1)
+        self.requester = User.objects.create(username='donor', email='donor@example.com', phone='8000000000',
+                                             user_type='donor')
+        token = RefreshToken.for_user(self.bank_user).access_token
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+        # Shared timestamps force the id tiebreaker
+        created = timezone.now()
+        self.requests = [make_request(self.requester, required_date=timezone.localdate()) for _ in range(45)]
+        BloodRequest.objects.filter(pk__in=[r.pk for r in self.requests[:25]]).update(created_at=created)
+
+    def walk(self, url, link='next'):
+        ids, queries = [], []
+        while url:
+            with CaptureQueriesContext(connection) as captured:
+                response = self.client.get(url, **self.auth)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertNotIn('count', data)
+            ids.extend(row['id'] for row in data['results'])
+            queries.append([q['sql'] for q in captured])
+            url = data[link]
+        return ids, queries
+
+    def test_pages_cover_every_row_without_count(self):
+        ids, queries = self.walk('/api/requests/requests/?cursor=')
+        expected = list(BloodRequest.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+        self.assertEqual(len(queries), 3)
+        # Same number of queries on every page, none of them a count
+        self.assertEqual(len({len(page) for page in queries}), 1)
+        self.assertFalse(any('COUNT(' in sql for page in queries for sql in page))
+
+    def test_previous_links_walk_back(self):
+        first = self.client.get('/api/requests/requests/?cursor=', **self.auth).json()
+        second = self.client.get(first['next'], **self.auth).json()
+        back = self.client.get(second['previous'], **self.auth).json()
+        self.assertEqual(back['results'], first['results'])
+        self.assertIsNone(back['previous'])
+
+    def test_supported_ordering(self):
+        ids, _ = self.walk('/api/requests/requests/?cursor=&ordering=urgency_rank')
+        self.assertEqual(ids, list(BloodRequest.objects.order_by('urgency_rank', 'id').values_list('id', flat=True)))
+
+    def test_multi_field_ordering(self):
+        # Few distinct leading values, so the secondary terms decide most of the order
+        for n, blood_request in enumerate(self.requests):
+            BloodRequest.objects.filter(pk=blood_request.pk).update(
+                urgency_rank=n % 3, required_date=timezone.localdate() + timedelta(days=n % 4),
+            )
+        url = '/api/requests/requests/?cursor=&ordering=urgency_rank,-required_date'
+        ids, _ = self.walk(url)
+        expected = list(
+            BloodRequest.objects.order_by('urgency_rank', '-required_date', '-id').values_list('id', flat=True)
+        )
+        self.assertEqual(ids, expected)
+
+        first = self.client.get(url, **self.auth).json()
+        second = self.client.get(first['next'], **self.auth).json()
+        self.assertEqual([row['id'] for row in second['results']], expected[20:40])
+        back = self.client.get(second['previous'], **self.auth).json()
+        self.assertEqual(back['results'], first['results'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/requests/requests/?cursor=bogus', **self.auth)
+        self.assertEqual(response.status_code, 404)
+
+    def test_page_numbers_unchanged(self):
+        data = self.client.get('/api/requests/requests/?page=2', **self.auth).json()
+        self.assertEqual(data['count'], 45)
+        self.assertEqual(len(data['results']), 20)
+
+
+class TriageTests(TestCase):
+    def setUp(self):
+        self.bank_user = make_bank(1)
+        self.requester = User.objects.create(username='donor', email='donor@example.com', phone='8000000000',
+                                             user_type='donor')
+        token = RefreshToken.for_user(self.bank_user).access_token
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+        today = timezone.localdate()
+        # Created in this order, so created_at breaks the remaining ties oldest first
+        self.normal_due_today = make_request(self.requester, urgency='normal', required_date=today)
+        self.urgent_due_later = make_request(self.requester, urgency='urgent', required_date=today + timedelta(days=2))
+        self.urgent_due_today = make_request(self.requester, urgency='urgent', required_date=today)
+        self.emergency = make_request(self.requester, urgency='emergency', required_date=today + timedelta(days=5))
+        self.urgent_due_today_newer = make_request(self.requester, urgency='urgent', required_date=today)
+        make_request(self.requester, urgency='emergency', status='approved')
+        self.expected = [self.emergency.id, self.urgent_due_today.id, self.urgent_due_today_newer.id,
+                         self.urgent_due_later.id, self.normal_due_today.id]
+
+    def test_pending_by_urgency_then_due_date_then_age(self):
+        response = self.client.get('/api/requests/requests/triage/', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['id'] for row in response.json()['results']], self.expected)
+
+    def test_cursor_pages_keep_the_triage_order(self):
+        # Enough for two pages, with urgency and due date ties across the page boundary
+        for n in range(20):
+            make_request(self.requester, urgency=('urgent', 'normal')[n % 2],
+                         required_date=timezone.localdate() + timedelta(days=n % 3))
+        ids, pages, url = [], 0, '/api/requests/requests/triage/?cursor='
+        while url:
+            data = self.client.get(url, **self.auth).json()
+            ids.extend(row['id'] for row in data['results'])
+            pages, url = pages + 1, data['next']
+        self.assertEqual(pages, 2)
+        first_page = self.client.get('/api/requests/requests/triage/', **self.auth).json()['results']
+        self.assertEqual(ids[:20], [row['id'] for row in first_page])
+        self.assertEqual(ids, list(
+            BloodRequest.objects.filter(status='pending')
+            .order_by('urgency_rank', 'required_date', 'created_at', 'id').values_list('id', flat=True)
+        ))
+
+    def test_reads_the_partial_index(self):
+        queryset = BloodRequest.objects.filter(status='pending').order_by('urgency_rank', 'required_date', 'created_at')
+        plan = queryset.explain()
+        self.assertIn('bloodrequest_triage_idx', plan)
+
+    def test_donors_have_no_triage_queue(self):
+        token = RefreshToken.for_user(self.requester).access_token
+        response = self.client.get('/api/requests/requests/triage/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.status_code, 403)
+
+
+class FulfilTests(TestCase):
+    def setUp(self):
+        self.bank_user = make_bank(1)
+        self.bank = self.bank_user.bloodbank
+        self.requester = User.objects.create(username='donor', email='donor@example.com', phone='8000000000',
+                                             user_type='donor')
+        token = RefreshToken.for_user(self.bank_user).access_token
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+        set_stock(self.bank, 'A+', 3)
+        set_stock(self.bank, 'O-', 1)
+
+    def approved(self, units, bloodbank=None):
+        return make_request(self.requester, blood_group='A+', units_required=units, status='approved',
+                            bloodbank=bloodbank or self.bank)
+
+    def stock(self):
+        return dict(Inventory.objects.filter(bloodbank=self.bank).values_list('blood_group', 'units_available'))
+
+    def test_fulfil_issues_compatible_stock(self):
+        blood_request = self.approved(4)
+        response = self.client.post(f'/api/requests/requests/{blood_request.id}/fulfil/', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'fulfilled')
+        self.assertEqual(response.json()['allocation'], {'A+': 3, 'O-': 1})
+        self.assertEqual(self.stock(), {'A+': 0, 'O-': 0})
+        issued = InventoryMovement.objects.filter(reference=f'request:{blood_request.id}')
+        self.assertEqual(sorted(issued.values_list('blood_group', 'quantity')), [('A+', -3), ('O-', -1)])
+
+    def test_fulfil_requires_an_approved_request_for_this_bank(self):
+        pending = make_request(self.requester, bloodbank=self.bank)
+        response = self.client.post(f'/api/requests/requests/{pending.id}/fulfil/', **self.auth)
+        self.assertEqual(response.status_code, 400)
+        elsewhere = self.approved(1, bloodbank=make_bank(2).bloodbank)
+        response = self.client.post(f'/api/requests/requests/{elsewhere.id}/fulfil/', **self.auth)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.stock(), {'A+': 3, 'O-': 1})
+
+    def test_bulk_fulfil_draws_on_what_earlier_requests_left(self):
+        first, second = self.approved(2), self.approved(2)
+        response = self.client.post('/api/requests/requests/bulk_fulfil/', {'ids': [first.id, second.id]},
+                                    content_type='application/json', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        allocations = {row['id']: row['allocation'] for row in response.json()['fulfilled']}
+        self.assertEqual(allocations, {first.id: {'A+': 2}, second.id: {'A+': 1, 'O-': 1}})
+        self.assertEqual(self.stock(), {'A+': 0, 'O-': 0})
+
+    def test_bulk_fulfil_is_all_or_nothing(self):
+        first, second, third = self.approved(2), self.approved(2), self.approved(1)
+        response = self.client.post('/api/requests/requests/bulk_fulfil/', {'ids': [first.id, second.id, third.id]},
+                                    content_type='application/json', **self.auth)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['request'], third.id)
+        self.assertEqual(self.stock(), {'A+': 3, 'O-': 1})
+        self.assertFalse(BloodRequest.objects.filter(status='fulfilled').exists())
+        self.assertFalse(InventoryMovement.objects.filter(movement_type=InventoryMovement.ISSUE).exists())
+
+
+class MatchingTests(TestCase):
+    def setUp(self):
+        self.requester = User.objects.create(username='donor', email='donor@example.com', phone='8000000000',
+                                             user_type='donor')
+        self.banks = {}
+
+    def bank(self, n, stock, **fields):
+        user = make_bank(n)
+        fields.setdefault('city', 'Pune')
+        fields.setdefault('state', 'Maharashtra')
+        BloodBank.objects.filter(pk=user.bloodbank.pk).update(**fields)
+        for group, units in stock.items():
+            set_stock(user.bloodbank, group, units)
+        self.banks[user.bloodbank.id] = n
+        return user
+
+    def ranked(self, blood_request, **kwargs):
+        return [self.banks[match['bloodbank_id']] for match in rank_banks(blood_request, **kwargs)]
+
+    def test_ranked_by_compatible_then_exact_stock(self):
+        self.bank(1, {'A+': 1})
+        self.bank(2, {'O+': 5})
+        self.bank(3, {'A+': 5})
+        self.bank(4, {'B+': 50})  # incompatible
+        blood_request = make_request(self.requester, blood_group='A+', units_required=4, city='Pune')
+        self.assertEqual(self.ranked(blood_request), [3, 2, 1])
+
+    def test_only_approved_operational_banks(self):
+        self.bank(1, {'O-': 1})
+        self.bank(2, {'O-': 9}, is_operational=False)
+        self.bank(3, {'O-': 9}, status='pending')
+        self.assertEqual(self.ranked(make_request(self.requester, blood_group='O-')), [1])
+
+    def test_urgency_weighs_distance(self):
+        # 3 of 4 units about 1 km away, all 4 about 60 km away
+        self.bank(1, {'A+': 3}, latitude='18.529000', longitude='73.860000')
+        self.bank(2, {'A+': 4}, latitude='19.060000', longitude='73.860000')
+        location = dict(blood_group='A+', units_required=4, latitude='18.520000', longitude='73.860000')
+        emergency = make_request(self.requester, urgency='emergency', **location)
+        normal = make_request(self.requester, urgency='normal', **location)
+        self.assertEqual(self.ranked(emergency), [1, 2])
+        self.assertEqual(self.ranked(normal), [2, 1])
+        self.assertEqual([round(match['distance_km']) for match in rank_banks(emergency)], [1, 60])
+
+    def test_same_city_before_same_state_without_coordinates(self):
+        self.bank(1, {'O+': 2}, city='Nagpur')
+        self.bank(2, {'O+': 2}, city='Mumbai', state='Goa')
+        self.bank(3, {'O+': 2}, city=' pune ')
+        blood_request = make_request(self.requester, city='Pune', state='Maharashtra')
+        self.assertEqual(self.ranked(blood_request), [3, 1, 2])
+
+    def test_top_matches_are_stored_and_replaced(self):
+        for n in range(1, 5):
+            self.bank(n, {'O+': n})
+        blood_request = make_request(self.requester, units_required=4, city='Pune')
+        match_request(blood_request, limit=2)
+        match_request(blood_request, limit=2)
+        stored = RequestMatch.objects.filter(request=blood_request).order_by('rank')
+        self.assertEqual([(self.banks[m.bloodbank_id], m.rank) for m in stored], [(4, 1), (3, 2)])
+
+    def test_query_count_does_not_grow_with_banks(self):
+        counts = []
+        for size in (2, 12):
+            for n in range(len(self.banks) + 1, size + 1):
+                self.bank(n, {'O+': 3, 'O-': 1})
+            blood_request = make_request(self.requester, city='Pune')
+            with CaptureQueriesContext(connection) as captured:
+                self.assertEqual(len(match_request(blood_request)), min(size, MATCH_LIMIT))
+            counts.append(len(captured))
+        # One read, one delete and one insert, inside a savepoint
+        self.assertEqual(counts, [5, 5])
+
+    def test_matched_queue_for_banks(self):
+        matched_user = self.bank(1, {'O+': 5})
+        other_user = self.bank(2, {'B+': 5})
+        response = self.client.post('/api/requests/requests/', {
+            'patient_name': 'Patient', 'blood_group': 'O+', 'units_required': 2, 'urgency': 'urgent',
+            'required_date': timezone.localdate().isoformat(), 'hospital_name': 'City Hospital',
+            'doctor_name': 'Dr. Rao', 'contact_number': '9999999999', 'reason': 'Surgery', 'city': 'Pune',
+        }, **auth(self.requester))
+        self.assertEqual(response.status_code, 201, response.content)
+        created = response.json()['id']
+        # Only pending requests are offered
+        match_request(make_request(self.requester, status='cancelled'))
+
+        def queue(user):
+            response = self.client.get('/api/requests/requests/matched/', **auth(user))
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            return [(row['id'], row['match_rank']) for row in (data['results'] if isinstance(data, dict) else data)]
+
+        self.assertEqual(queue(matched_user), [(created, 1)])
+        self.assertEqual(queue(other_user), [])
+        self.assertEqual(self.client.get('/api/requests/requests/matched/', **auth(self.requester)).status_code, 403)
+
+
+class ConcurrentTransitionTests(TransactionTestCase):
+    def test_concurrent_approvals_have_one_winner(self):
+        banks = [make_bank(n) for n in range(1, 9)]
+        requester = User.objects.create(username='donor', email='donor@example.com', phone='8000000000',
+                                        user_type='donor')
+        blood_request = make_request(requester)
+        barrier = threading.Barrier(len(banks))
+        winners, losers, errors = [], [], []
+
+        def approve(user):
+            barrier.wait()
+            try:
+                for _ in range(100):
+                    try:
+                        transition(blood_request.pk, 'approved', user)
+                    except OperationalError:
+                        # SQLite's shared-cache test database reports table locks
+                        # instead of waiting; other backends block on the row lock
+                        time.sleep(0.01)
+                        continue
+                    winners.append(user.bloodbank.id)
+                    return
+            except InvalidTransition:
+                losers.append(user.bloodbank.id)
+            except Exception as e:  # surfaced by the assertion below
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=approve, args=(user,)) for user in banks]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(winners), 1)
+        self.assertEqual(len(losers), len(banks) - 1)
+        blood_request.refresh_from_db()
+        self.assertEqual(blood_request.status, 'approved')
+        self.assertEqual(blood_request.bloodbank_id, winners[0])
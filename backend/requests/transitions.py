@@ -0,0 +1,178 @@
+"""
+Race-free status transitions for blood requests.
+
+A transition is one conditional ``UPDATE ... WHERE id = ? AND status IN
+(...)`` that also copies the old ``status`` into ``previous_status`` (the
+right-hand side of ``SET`` sees the row as it was before the update). Its
+affected row count decides the outcome, so when two banks act on the same
+request at once exactly one wins. Either way it costs two queries: a
+success fetches the updated row for serialization, and a failure looks up
+the current status so the caller can explain why.
+
+``bulk_transition`` applies the same rules to a batch with set-based
+updates. Fulfilment also draws the bank's compatible inventory down in the
+same transaction (see ``fulfil``).
+"""
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from inventory.compatibility import plan_allocation
+from inventory.models import Inventory
+from inventory.services import InsufficientStock, issue_allocations
+from .models import BloodRequest
+
+
+# target status -> statuses it may be entered from
+TRANSITIONS = {
+    'approved': ('pending', 'rejected'),
+    'rejected': ('pending',),
+}
+# Fulfilment also issues stock, so it goes through fulfil(), not transition()
+FULFILLABLE = ('approved',)
+
+
+class InvalidTransition(Exception):
+    """Raised when the request is not in a status the transition can start from."""
+
+    def __init__(self, target, current):
+        self.target = target
+        self.current = current
+        super().__init__(f'Cannot move request from {current} to {target}')
+
+
+class NotAssigned(InvalidTransition):
+    """Raised when a bank tries to fulfil a request approved by another bank."""
+
+
+def _changes(target, user, now):
+    changes = {'previous_status': F('status'), 'status': target, 'updated_at': now}
+    if target in ('approved', 'rejected'):
+        # The deciding bank takes the request, even one rejected by another bank
+        changes.update(approved_by=user, approved_at=now, bloodbank=user.bloodbank)
+    return changes
+
+
+def transition(pk, target, user, queryset=None):
+    """Move request ``pk`` to ``target`` and return it, fetched through ``queryset``.
+
+    The status the request left is on the returned instance as
+    ``previous_status``.
+
+    Raises ``BloodRequest.DoesNotExist`` for an unknown id and
+    ``InvalidTransition`` when the current status does not allow the move.
+    """
+    changes = _changes(target, user, timezone.now())
+    if not BloodRequest.objects.filter(pk=pk, status__in=TRANSITIONS[target]).update(**changes):
+        current = BloodRequest.objects.filter(pk=pk).values_list('status', flat=True).first()
+        if current is None:
+            raise BloodRequest.DoesNotExist(f'No blood request with id {pk}')
+        raise InvalidTransition(target, current)
+    return (queryset if queryset is not None else BloodRequest.objects.all()).get(pk=pk)
+
+
+def bulk_transition(pks, target, user):
+    """Move every eligible request in ``pks`` to ``target`` with set-based updates.
+
+    Runs one locked status read and one conditional ``UPDATE`` per source
+    status whatever the batch size. Returns ``{pk: (outcome, status)}`` where
+    outcome is ``'applied'`` (status is the one the request left),
+    ``'skipped'`` (status is the current one, which does not allow the move)
+    or ``'not_found'``.
+    """
+    pks = list(dict.fromkeys(pks))
+    changes = _changes(target, user, timezone.now())
+    with transaction.atomic():
+        current = dict(BloodRequest.objects.select_for_update().filter(pk__in=pks).values_list('pk', 'status'))
+        applied = {}
+        for source in TRANSITIONS[target]:
+            ids = [pk for pk in pks if current.get(pk) == source]
+            if not ids:
+                continue
+            if BloodRequest.objects.filter(pk__in=ids, status=source).update(**changes) != len(ids):
+                # Another writer moved some of them after the read (backends without row locks)
+                moved = BloodRequest.objects.filter(pk__in=ids).values_list('pk', 'status', 'updated_at')
+                ids = []
+                for pk, status, updated_at in moved:
+                    if status == target and updated_at == changes['updated_at']:
+                        ids.append(pk)
+                    else:
+                        current[pk] = status
+            applied.update(dict.fromkeys(ids, source))
+
+    outcomes = {}
+    for pk in pks:
+        if pk in applied:
+            outcomes[pk] = ('applied', applied[pk])
+        elif pk in current:
+            outcomes[pk] = ('skipped', current[pk])
+        else:
+            outcomes[pk] = ('not_found', None)
+    return outcomes
+
+
+def fulfil(pks, user, queryset=None):
+    """Fulfil approved requests assigned to ``user``'s bank and issue their stock, all or nothing.
+
+    Each request is covered from compatible groups (see ``plan_allocation``)
+    against the bank's balances, and the batch runs in a fixed number of
+    statements whatever its size: one request read, one balance read, one
+    conditional request ``UPDATE``, then ``issue_allocations`` (one
+    conditional balance ``UPDATE``, one ledger insert, bag marking) and one
+    fetch of the fulfilled rows.
+
+    Returns ``(requests, allocations)`` where ``allocations`` maps request id
+    to ``{blood_group: units}``. Raises ``BloodRequest.DoesNotExist``,
+    ``InvalidTransition``/``NotAssigned`` or ``InsufficientStock`` (carrying
+    the failing ``request_id``) and writes nothing in that case.
+    """
+    bloodbank = user.bloodbank
+    pks = list(dict.fromkeys(pks))
+    with transaction.atomic():
+        rows = {
+            pk: (group, units, current, bank_id)
+            for pk, group, units, current, bank_id in BloodRequest.objects.select_for_update()
+            .filter(pk__in=pks)
+            .values_list('pk', 'blood_group', 'units_required', 'status', 'bloodbank_id')
+        }
+        for pk in pks:
+            if pk not in rows:
+                raise BloodRequest.DoesNotExist(f'No blood request with id {pk}')
+            _, _, current, bank_id = rows[pk]
+            if current not in FULFILLABLE:
+                raise InvalidTransition('fulfilled', current)
+            if bank_id != bloodbank.id:
+                raise NotAssigned('fulfilled', current)
+
+        stock = dict(
+            Inventory.objects.select_for_update()
+            .filter(bloodbank=bloodbank)
+            .values_list('blood_group', 'units_available')
+        )
+        allocations = {}
+        for pk in pks:
+            group, units, _, _ = rows[pk]
+            allocation = plan_allocation(stock, group, units)
+            if allocation is None:
+                error = InsufficientStock(group, units)
+                error.request_id = pk
+                raise error
+            for donor_group, taken in allocation.items():
+                stock[donor_group] -= taken
+            allocations[pk] = allocation
+
+        now = timezone.now()
+        updated = BloodRequest.objects.filter(
+            pk__in=pks, status__in=FULFILLABLE, bloodbank=bloodbank,
+        ).update(previous_status=F('status'), status='fulfilled', fulfilled_at=now, updated_at=now)
+        if updated != len(pks):
+            # Another writer changed a request after it was read (backends without row locks)
+            raise InvalidTransition('fulfilled', 'changed')
+
+        issue_allocations(
+            bloodbank,
+            [(f'request:{pk}', allocations[pk]) for pk in pks],
+            created_by=user,
+        )
+        fulfilled = list((queryset if queryset is not None else BloodRequest.objects.all()).filter(pk__in=pks))
+    return fulfilled, allocations
@@ -1,17 +1,27 @@
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.utils import timezone
-from .models import BloodRequest
-from .serializers import BloodRequestSerializer
+from django.db import transaction
+from django.db.models import F
+from django.http import Http404
+from audit.log import record_change, record_changes
+from audit.models import StatusChange
+from donors.fanout import schedule_fan_out
+from ebloodbank.query_planning import QueryPlanMixin
+from inventory.services import InsufficientStock
+from .matching import match_request
+from .models import BloodRequest, RequestMatch
+from .serializers import BloodRequestSerializer, RequestMatchSerializer
+from .transitions import TRANSITIONS, InvalidTransition, NotAssigned, bulk_transition, fulfil, transition
 
 
-class BloodRequestViewSet(viewsets.ModelViewSet):
+class BloodRequestViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     queryset = BloodRequest.objects.all().order_by('-created_at')
     serializer_class = BloodRequestSerializer
     filterset_fields = ['bloodbank', 'blood_group', 'urgency', 'status']
     search_fields = ['patient_name', 'hospital_name', 'doctor_name', 'bloodbank__name']
-    ordering_fields = ['created_at', 'required_date']
+    search_index = 'bloodrequest'
+    ordering_fields = ['created_at', 'required_date', 'urgency_rank']
 
     permission_classes = [permissions.IsAuthenticated]
 
@@ -30,66 +40,99 @@ class BloodRequestViewSet(viewsets.ModelViewSet):
         if hasattr(user, 'bloodbank'):
             from rest_framework.exceptions import PermissionDenied
             raise PermissionDenied('Blood banks cannot create blood requests.')
-        serializer.save(requester=user)
+        with transaction.atomic():
+            instance = serializer.save(requester=user)
+            record_change(StatusChange.BLOOD_REQUEST, instance.id, None, instance.status, instance.bloodbank_id, user)
+        # Open requests are offered to the best-placed banks
+        if instance.bloodbank_id is None:
+            match_request(instance)
+        if instance.urgency == 'emergency':
+            # Donors are notified after the response, off this thread
+            schedule_fan_out(instance)
 
     def update(self, request, *args, **kwargs):
         # Allow blood banks to update status
-        instance = self.get_object()
         user = request.user
         
         if hasattr(user, 'bloodbank'):
-            # Blood bank can update status and assign to themselves
+            # Blood bank can approve/reject, which also assigns the request to them
             if 'status' in request.data:
                 new_status = request.data['status']
                 if new_status in ['approved', 'rejected']:
-                    instance.status = new_status
-                    instance.approved_by = user
-                    instance.approved_at = timezone.now()
-                    if not instance.bloodbank:
-                        instance.bloodbank = user.bloodbank
-                    instance.save()
-                    serializer = self.get_serializer(instance)
-                    return Response(serializer.data)
+                    return self._transition(kwargs[self.lookup_url_kwarg or self.lookup_field], new_status)
+                if new_status == 'fulfilled':
+                    return self._fulfil([kwargs[self.lookup_url_kwarg or self.lookup_field]], many=False)
         
         return super().update(request, *args, **kwargs)
 
+    def _transition(self, pk, new_status):
+        """Apply a conditional status transition and return the serialized request."""
+        user = self.request.user
+        try:
+            with transaction.atomic():
+                request_obj = transition(pk, new_status, user, self.get_queryset())
+                record_change(StatusChange.BLOOD_REQUEST, request_obj.id, request_obj.previous_status, new_status,
+                              request_obj.bloodbank_id, user)
+        except (BloodRequest.DoesNotExist, TypeError, ValueError):
+            raise Http404
+        except InvalidTransition as e:
+            return Response({'error': self._transition_error(e)}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = self.get_serializer(request_obj)
+        return Response(serializer.data)
+
+    def _fulfil(self, pks, many):
+        """Fulfil requests and draw down stock; responds with the request(s) and their allocations."""
+        user = self.request.user
+        try:
+            with transaction.atomic():
+                fulfilled, allocations = fulfil([int(pk) for pk in pks], user, self.get_queryset())
+                record_changes(StatusChange.BLOOD_REQUEST, [
+                    (request_obj.id, 'approved', 'fulfilled', request_obj.bloodbank_id) for request_obj in fulfilled
+                ], user)
+        except (BloodRequest.DoesNotExist, TypeError, ValueError):
+            if many:
+                return Response({'error': 'One or more requests were not found.'}, status=status.HTTP_400_BAD_REQUEST)
+            raise Http404
+        except NotAssigned:
+            return Response({'error': 'Request is assigned to another blood bank.'}, status=status.HTTP_400_BAD_REQUEST)
+        except InvalidTransition as e:
+            return Response({'error': f'Only approved requests can be fulfilled. Current status: {e.current}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        except InsufficientStock as e:
+            return Response({'error': str(e), 'request': getattr(e, 'request_id', None)},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        data = self.get_serializer(fulfilled, many=True).data
+        for item in data:
+            item['allocation'] = allocations[item['id']]
+        if many:
+            return Response({'fulfilled': data})
+        return Response(data[0])
+
+    @staticmethod
+    def _transition_error(error):
+        if error.current == 'approved':
+            action = 'changed' if error.target == 'approved' else 'rejected'
+            return f'Request is already approved by another blood bank and cannot be {action}.'
+        if error.target == 'approved':
+            return f'Cannot approve request with status: {error.current}'
+        return f'Can only reject pending requests. Current status: {error.current}'
+
     @action(detail=True, methods=['post'])
     def approve(self, request, pk=None):
         """Approve a blood request (blood bank only)
         - Can approve pending requests
         - Can approve rejected requests (override rejection)
         - Cannot approve already approved requests
+        Only one of several banks approving at once succeeds.
         """
-        request_obj = self.get_object()
         user = request.user
         
         if not hasattr(user, 'bloodbank'):
             from rest_framework.exceptions import PermissionDenied
             raise PermissionDenied('Only blood banks can approve requests.')
         
-        # Cannot approve if already approved by another blood bank
-        if request_obj.status == 'approved':
-            return Response(
-                {'error': 'Request is already approved by another blood bank and cannot be changed.'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Can approve pending or rejected requests
-        if request_obj.status not in ['pending', 'rejected']:
-            return Response(
-                {'error': f'Cannot approve request with status: {request_obj.status}'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        request_obj.status = 'approved'
-        request_obj.approved_by = user
-        request_obj.approved_at = timezone.now()
-        # Update bloodbank to current blood bank (even if it was rejected by another bank)
-        request_obj.bloodbank = user.bloodbank
-        request_obj.save()
-        
-        serializer = self.get_serializer(request_obj)
-        return Response(serializer.data)
+        return self._transition(pk, 'approved')
 
     @action(detail=True, methods=['post'])
     def reject(self, request, pk=None):
@@ -98,33 +141,128 @@ class BloodRequestViewSet(viewsets.ModelViewSet):
         - Cannot reject approved requests (already approved by another bank)
         - Cannot reject already rejected requests (use approve to override rejection)
         """
-        request_obj = self.get_object()
         user = request.user
         
         if not hasattr(user, 'bloodbank'):
             from rest_framework.exceptions import PermissionDenied
             raise PermissionDenied('Only blood banks can reject requests.')
         
-        # Cannot reject if already approved by another blood bank
-        if request_obj.status == 'approved':
-            return Response(
-                {'error': 'Request is already approved by another blood bank and cannot be rejected.'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Can only reject pending requests
-        if request_obj.status != 'pending':
-            return Response(
-                {'error': f'Can only reject pending requests. Current status: {request_obj.status}'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        request_obj.status = 'rejected'
-        request_obj.approved_by = user
-        request_obj.approved_at = timezone.now()
-        # Set bloodbank to current blood bank
-        request_obj.bloodbank = user.bloodbank
-        request_obj.save()
-        
-        serializer = self.get_serializer(request_obj)
-        return Response(serializer.data)
+        return self._transition(pk, 'rejected')
+
+    @action(detail=False, methods=['post'])
+    def bulk_transition(self, request):
+        """Approve or reject a batch of requests (blood bank only).
+        Body: {"ids": [...], "status": "approved" | "rejected"}. Same rules as approve/reject;
+        each id is reported as applied, skipped (with its current status) or not_found.
+        """
+        user = request.user
+        if not hasattr(user, 'bloodbank'):
+            from rest_framework.exceptions import PermissionDenied
+            raise PermissionDenied('Only blood banks can approve or reject requests.')
+        data = request.data if isinstance(request.data, dict) else {}
+        target = data.get('status')
+        if target not in TRANSITIONS:
+            return Response({'error': 'status must be approved or rejected'}, status=status.HTTP_400_BAD_REQUEST)
+        ids = data.get('ids')
+        if not isinstance(ids, list) or not ids:
+            return Response({'error': 'Provide a non-empty list of ids'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            ids = [int(pk) for pk in ids]
+        except (TypeError, ValueError):
+            return Response({'error': 'ids must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            outcomes = bulk_transition(ids, target, user)
+            record_changes(StatusChange.BLOOD_REQUEST, [
+                (pk, previous, target, user.bloodbank.id)
+                for pk, (outcome, previous) in outcomes.items() if outcome == 'applied'
+            ], user)
+
+        results = []
+        for pk, (outcome, current) in outcomes.items():
+            item = {'id': pk, 'outcome': outcome}
+            if outcome == 'applied':
+                item['previous_status'] = current
+            elif outcome == 'skipped':
+                item['status'] = current
+            results.append(item)
+        return Response({
+            'status': target,
+            'applied': sum(1 for outcome, _ in outcomes.values() if outcome == 'applied'),
+            'results': results,
+        })
+
+    @action(detail=True, methods=['post'])
+    def fulfil(self, request, pk=None):
+        """Fulfil an approved request assigned to this bank and issue compatible stock (blood bank only).
+        Fails without changing anything when compatible stock is insufficient.
+        """
+        if not hasattr(request.user, 'bloodbank'):
+            from rest_framework.exceptions import PermissionDenied
+            raise PermissionDenied('Only blood banks can fulfil requests.')
+        return self._fulfil([pk], many=False)
+
+    @action(detail=False, methods=['post'])
+    def bulk_fulfil(self, request):
+        """Fulfil a batch of approved requests in one transaction (blood bank only).
+        Body: {"ids": [...]}. All requests are fulfilled or none are.
+        """
+        if not hasattr(request.user, 'bloodbank'):
+            from rest_framework.exceptions import PermissionDenied
+            raise PermissionDenied('Only blood banks can fulfil requests.')
+        ids = request.data.get('ids') if isinstance(request.data, dict) else None
+        if not isinstance(ids, list) or not ids:
+            return Response({'error': 'Provide a non-empty list of ids'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            ids = [int(pk) for pk in ids]
+        except (TypeError, ValueError):
+            return Response({'error': 'ids must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        return self._fulfil(ids, many=True)
+
+    @action(detail=False, methods=['get'])
+    def triage(self, request):
+        """Pending requests, most urgent first, then by required date, then oldest first (blood bank only).
+        Reads the partial triage index, so the first page stays cheap however much history there is.
+        """
+        if not hasattr(request.user, 'bloodbank'):
+            from rest_framework.exceptions import PermissionDenied
+            raise PermissionDenied('Only blood banks have a triage queue.')
+
+        qs = (
+            self.filter_queryset(self.get_queryset())
+            .filter(status='pending')
+            .order_by('urgency_rank', 'required_date', 'created_at')
+        )
+        page = self.paginate_queryset(qs)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return Response(self.get_serializer(qs, many=True).data)
+
+    @action(detail=True, methods=['get'])
+    def matches(self, request, pk=None):
+        """Banks ranked as able to serve this request, best first."""
+        request_obj = self.get_object()
+        matches = RequestMatch.objects.filter(request=request_obj).select_related('bloodbank').order_by('rank')
+        return Response(RequestMatchSerializer(matches, many=True).data)
+
+    @action(detail=False, methods=['get'])
+    def matched(self, request):
+        """Pending requests this blood bank was matched to ("requests you can fulfil"), best rank first."""
+        user = request.user
+        if not hasattr(user, 'bloodbank'):
+            from rest_framework.exceptions import PermissionDenied
+            raise PermissionDenied('Only blood banks have a matched request queue.')
+
+        qs = (
+            self.filter_queryset(self.get_queryset())
+            .filter(status='pending', matches__bloodbank=user.bloodbank)
+            .annotate(match_rank=F('matches__rank'), match_score=F('matches__score'))
+            .order_by('match_rank', 'required_date', '-created_at')
+        )
+        page = self.paginate_queryset(qs)
+        rows = page if page is not None else qs
+        data = self.get_serializer(rows, many=True).data
+        for item, obj in zip(data, rows):
+            item['match_rank'] = obj.match_rank
+            item['match_score'] = obj.match_score
+        return self.get_paginated_response(data) if page is not None else Response(data)
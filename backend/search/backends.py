@@ -0,0 +1,137 @@
+"""
+Full-text index tables, one per indexed model (see ``search.index``).
+
+Each table maps an object id to one lowercased text ``body`` built from the
+model's searchable fields. How the table is stored and queried depends on
+the database:
+
+* SQLite: an FTS5 virtual table keyed by ``rowid``, ranked with BM25.
+  Terms match as prefixes, so ``"ram 98"`` finds "Ramesh" with phone
+  "98…".
+* PostgreSQL: a plain table with a generated ``tsvector`` column (GIN
+  index) for ranked prefix matches, and a ``pg_trgm`` GIN index on the
+  body so substrings (the middle of a phone number or email) still match.
+
+Backends do not run searches themselves. ``match_sql`` and ``rank_sql``
+return SQL that ``search.index.search`` embeds in the caller's own query,
+so the query's filters and the index match are planned together.
+
+Other databases get no backend and ``?search=`` keeps DRF's ``icontains``
+search.
+"""
+import re
+from functools import lru_cache
+
+from django.db import connections
+
+
+_TERM_RE = re.compile(r'\w+')
+
+
+def terms(query):
+    """Lowercased word terms of a search query (punctuation dropped)."""
+    return _TERM_RE.findall((query or '').lower())
+
+
+class SQLiteBackend:
+    vendor = 'sqlite'
+
+    def create(self, cursor, table):
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5("
+            f"body, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+
+    def drop(self, cursor, table):
+        cursor.execute(f'DROP TABLE IF EXISTS {table}')
+
+    def clear(self, cursor, table):
+        cursor.execute(f'DELETE FROM {table}')
+
+    def delete(self, cursor, table, ids):
+        ids = list(ids)
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            cursor.execute(f'DELETE FROM {table} WHERE rowid IN ({", ".join(["%s"] * len(chunk))})', chunk)
+
+    def upsert(self, cursor, table, rows, replace=True):
+        """Write ``(id, body)`` rows; ``replace=False`` when the ids are known to be new."""
+        rows = list(rows)
+        if replace:
+            self.delete(cursor, table, [object_id for object_id, _ in rows])
+        cursor.executemany(f'INSERT INTO {table}(rowid, body) VALUES (%s, %s)', rows)
+
+    def match_sql(self, table, words):
+        match = ' '.join(f'"{word}"*' for word in words)
+        return f'SELECT rowid FROM {table} WHERE {table} MATCH %s', [match]
+
+    def rank_sql(self, table, words):
+        # BM25, negated by FTS5 so that ascending is best first. A MATCH per row would rescan the
+        # term's doclist each time; the ORDER BY ... LIMIT -1 keeps SQLite from flattening the
+        # subquery, so the matches are read once and looked up through an automatic index.
+        match = ' '.join(f'"{word}"*' for word in words)
+        return [(
+            f'(SELECT hits.rank FROM (SELECT rowid AS id, rank FROM {table} WHERE {table} MATCH %s '
+            f'ORDER BY rank LIMIT -1) hits WHERE hits.id = {{pk}})',
+            [match],
+        )]
+
+
+class PostgresBackend:
+    vendor = 'postgresql'
+
+    def create(self, cursor, table):
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            f"object_id bigint PRIMARY KEY, body text NOT NULL, "
+            f"document tsvector GENERATED ALWAYS AS (to_tsvector('simple', body)) STORED)"
+        )
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {table}_document_idx ON {table} USING gin (document)')
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {table}_body_trgm_idx ON {table} USING gin (body gin_trgm_ops)')
+
+    def drop(self, cursor, table):
+        cursor.execute(f'DROP TABLE IF EXISTS {table}')
+
+    def clear(self, cursor, table):
+        cursor.execute(f'TRUNCATE {table}')
+
+    def delete(self, cursor, table, ids):
+        cursor.execute(f'DELETE FROM {table} WHERE object_id = ANY(%s)', [list(ids)])
+
+    def upsert(self, cursor, table, rows, replace=True):
+        sql = f'INSERT INTO {table} (object_id, body) VALUES (%s, %s)'
+        if replace:
+            sql += ' ON CONFLICT (object_id) DO UPDATE SET body = EXCLUDED.body'
+        cursor.executemany(sql, list(rows))
+
+    def match_sql(self, table, words):
+        tsquery = ' & '.join(f'{word}:*' for word in words)
+        phrase = ' '.join(words)
+        like = '%' + phrase.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        return (f"SELECT object_id FROM {table} WHERE document @@ to_tsquery('simple', %s) OR body LIKE %s",
+                [tsquery, like])
+
+    def rank_sql(self, table, words):
+        tsquery = ' & '.join(f'{word}:*' for word in words)
+        return [
+            (f"(SELECT -ts_rank(document, to_tsquery('simple', %s)) FROM {table} WHERE object_id = {{pk}})",
+             [tsquery]),
+            (f'(SELECT -similarity(body, %s) FROM {table} WHERE object_id = {{pk}})', [' '.join(words)]),
+        ]
+
+
+@lru_cache(maxsize=None)
+def _has_fts5(alias):
+    with connections[alias].cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+def get_backend(connection):
+    """The index backend for ``connection``, or ``None`` when it has no full-text support."""
+    if connection.vendor == 'postgresql':
+        return PostgresBackend()
+    if connection.vendor == 'sqlite' and _has_fts5(connection.alias):
+        return SQLiteBackend()
+    return None
@@ -0,0 +1,36 @@
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.filters import SearchFilter
+
+from . import index
+
+
+class IndexedSearchFilter(SearchFilter):
+    """``?search=`` from the full-text index for views that set ``search_index``, best match first.
+
+    Views without one, and databases without full-text support, keep DRF's
+    ``icontains`` search over ``search_fields``. Exact fields there (``'=id'``)
+    still match and rank first. An explicit ``?ordering=`` replaces the rank
+    order; keyset cursors cannot follow it.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        name = getattr(view, 'search_index', None)
+        search_terms = self.get_search_terms(request)
+        if not name or not search_terms:
+            return super().filter_queryset(request, queryset, view)
+        matched = index.search(name, ' '.join(search_terms))
+        if matched is None:
+            return super().filter_queryset(request, queryset, view)
+
+        condition, ranking = matched
+        for field in self.get_search_fields(view, request) or ():
+            if not field.startswith('='):
+                continue
+            for term in search_terms:
+                try:
+                    value = queryset.model._meta.get_field(field[1:]).to_python(term)
+                except (FieldDoesNotExist, ValidationError):
+                    continue
+                condition |= Q(**{field[1:]: value})
+        return queryset.filter(condition).order_by(*ranking, *queryset.query.order_by)
@@ -0,0 +1,150 @@
+"""
+Ranked search over donors, blood banks, blood requests and camp registrations.
+
+``INDEXES`` lists what is indexed: each model's searchable fields (the ones
+its viewset used to ``icontains``), joined into one lowercased body per
+row in a ``search_<name>`` table (see ``search.backends``). ``search``
+returns a filter and a best-match-first ordering that run inside the
+caller's query, so scoped querysets see every match and exact counts.
+``search.filters.IndexedSearchFilter`` serves ``?search=`` from it.
+
+The tables are kept in sync by ``search.signals`` on save and delete,
+including rows whose body reads a related name (a bank rename reindexes its
+requests). Bulk writes that skip signals call ``update`` themselves, and
+``manage.py rebuild_search_index`` rebuilds everything.
+"""
+from django.apps import apps
+from django.db import connection
+from django.db.models import F, FloatField, Func, Q
+from django.db.models.expressions import RawSQL
+
+from .backends import get_backend, terms
+
+
+BATCH_SIZE = 2000
+
+
+class SearchIndex:
+    def __init__(self, name, model, fields):
+        self.name = name
+        self.model_label = model
+        self.fields = fields
+        self.table = f'search_{name}'
+
+    @property
+    def model(self):
+        return apps.get_model(self.model_label)
+
+    def related(self):
+        """``(model, lookup)`` for each related model whose fields this index reads."""
+        seen = []
+        for field in self.fields:
+            if '__' in field:
+                lookup = field.split('__', 1)[0]
+                model = self.model._meta.get_field(lookup).related_model
+                if (model, lookup) not in seen:
+                    seen.append((model, lookup))
+        return seen
+
+    def fields_of(self, lookup):
+        """Fields of the related ``lookup`` model that this index reads."""
+        prefix = f'{lookup}__'
+        return [field[len(prefix):] for field in self.fields if field.startswith(prefix)]
+
+    def documents(self, queryset):
+        """``(id, body)`` for each row of ``queryset``, streamed."""
+        for row in queryset.values_list('id', *self.fields).iterator(chunk_size=BATCH_SIZE):
+            yield row[0], ' '.join(str(value) for value in row[1:] if value not in (None, '')).lower()
+
+
+INDEXES = {
+    index.name: index
+    for index in (
+        SearchIndex('donor', 'donors.Donor', ('full_name', 'city', 'state', 'blood_group', 'email', 'phone')),
+        SearchIndex('bloodbank', 'bloodbank.BloodBank', ('name', 'registration_number', 'city', 'state')),
+        SearchIndex('bloodrequest', 'requests.BloodRequest',
+                    ('patient_name', 'hospital_name', 'doctor_name', 'bloodbank__name')),
+        SearchIndex('campregistration', 'bloodbank.CampRegistration', ('full_name', 'email', 'phone', 'camp__name')),
+    )
+}
+
+
+def _write(backend, index, queryset, replace):
+    batch = []
+    with connection.cursor() as cursor:
+        for document in index.documents(queryset):
+            batch.append(document)
+            if len(batch) == BATCH_SIZE:
+                backend.upsert(cursor, index.table, batch, replace)
+                batch = []
+        if batch:
+            backend.upsert(cursor, index.table, batch, replace)
+
+
+def update(name, ids):
+    """Reindex the given rows of index ``name``; ids that no longer exist are dropped."""
+    backend = get_backend(connection)
+    ids = list(ids)
+    if backend is None or not ids:
+        return
+    index = INDEXES[name]
+    with connection.cursor() as cursor:
+        backend.delete(cursor, index.table, ids)
+    _write(backend, index, index.model.objects.filter(id__in=ids), replace=False)
+
+
+def update_queryset(name, queryset):
+    """Reindex every row of ``queryset`` (e.g. the requests of a renamed bank)."""
+    backend = get_backend(connection)
+    if backend is not None:
+        _write(backend, INDEXES[name], queryset, replace=True)
+
+
+def remove(name, ids):
+    backend = get_backend(connection)
+    if backend is not None:
+        with connection.cursor() as cursor:
+            backend.delete(cursor, INDEXES[name].table, list(ids))
+
+
+def rebuild(name, model=None):
+    """Empty and refill index ``name``; ``model`` overrides the live model (migrations)."""
+    backend = get_backend(connection)
+    if backend is None:
+        return
+    index = INDEXES[name]
+    with connection.cursor() as cursor:
+        backend.clear(cursor, index.table)
+    _write(backend, index, (model or index.model)._default_manager.all(), replace=False)
+
+
+class IndexRank(Func):
+    """One of a backend's ``rank_sql`` terms for each row (lower is better, ``NULL`` when it does not match)."""
+    output_field = FloatField()
+
+    def __init__(self, sql, params):
+        super().__init__(F('pk'))
+        self.sql, self.params = sql, params
+
+    def as_sql(self, compiler, connection, **extra_context):
+        pk_sql, pk_params = compiler.compile(self.source_expressions[0])
+        return self.sql.format(pk=pk_sql), [*self.params, *pk_params]
+
+
+def search(name, query):
+    """``(condition, ordering)`` for rows of index ``name`` matching ``query``; ``None`` without a backend.
+
+    ``condition`` is a ``Q`` on the index and ``ordering`` puts the best
+    matches first (rows matched some other way come before them). Both are
+    evaluated inside the caller's query, so its filters apply to every match
+    and no top-N of the whole index is taken.
+    """
+    backend = get_backend(connection)
+    if backend is None:
+        return None
+    words = terms(query)
+    if not words:
+        return Q(pk__in=[]), []
+    table = INDEXES[name].table
+    ordering = [IndexRank(sql, params).asc(nulls_first=True) for sql, params in backend.rank_sql(table, words)]
+    return Q(pk__in=RawSQL(*backend.match_sql(table, words))), ordering
@@ -0,0 +1,119 @@
+"""
+Benchmark indexed ``?search=`` against the ``icontains`` scan it replaces.
+
+Creates N donors inside a transaction, builds the donor index, then times a
+set of name, city, email and phone queries both ways (the SQL the donor
+list endpoint runs for the first page) and rolls everything back.
+
+    python manage.py bench_search --donors 1000000
+"""
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from rest_framework.filters import SearchFilter
+from rest_framework.request import Request
+
+from accounts.models import User
+from donors.models import Donor
+from donors.views import DonorViewSet
+from inventory.compatibility import GROUP_CODES
+from search.filters import IndexedSearchFilter
+from search.index import rebuild, search
+
+
+FIRST_NAMES = ('Aarav', 'Vivaan', 'Aditya', 'Ananya', 'Diya', 'Ishaan', 'Kavya', 'Rohan', 'Saanvi', 'Meera',
+               'Arjun', 'Priya', 'Rahul', 'Sneha', 'Vikram', 'Pooja', 'Karan', 'Neha', 'Siddharth', 'Riya')
+LAST_NAMES = ('Sharma', 'Verma', 'Patel', 'Reddy', 'Iyer', 'Nair', 'Gupta', 'Singh', 'Kulkarni', 'Das',
+              'Joshi', 'Mehta', 'Rao', 'Chopra', 'Banerjee', 'Menon', 'Pillai', 'Desai', 'Bose', 'Kapoor')
+CITIES = ('Pune', 'Mumbai', 'Delhi', 'Bengaluru', 'Chennai', 'Hyderabad', 'Kolkata', 'Jaipur', 'Lucknow', 'Nagpur')
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Time indexed donor search against icontains over many donors (data is rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--donors', type=int, default=1000000)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            self.stdout.write('Benchmark data rolled back.')
+
+    def seed(self, rng, n_donors):
+        tag = f'bench{time.time_ns() % 10 ** 8}'
+        for start in range(0, n_donors, 50000):
+            count = min(50000, n_donors - start)
+            users = User.objects.bulk_create([
+                User(username=f'{tag}-{i}', email=f'{tag}-{i}@bench.invalid', phone=f'{tag}{i}', user_type='donor')
+                for i in range(start, start + count)
+            ], batch_size=5000)
+            donors = []
+            for i, user in enumerate(users, start=start):
+                first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+                donors.append(Donor(
+                    user=user, full_name=f'{first} {last}', blood_group=rng.choice(GROUP_CODES),
+                    date_of_birth='1990-01-01', gender='M', phone=f'9{rng.randrange(10 ** 9):09d}',
+                    email=f'{first}.{last}{i}@example.com'.lower(), address='-', city=rng.choice(CITIES),
+                    state='Maharashtra', pincode='411001', weight=70, emergency_contact='0',
+                ))
+            Donor.objects.bulk_create(donors, batch_size=5000)
+
+    def time(self, repeat, fn):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = fn()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
+
+    def run(self, options):
+        rng = random.Random(options['seed'])
+        n_donors = options['donors']
+
+        started = time.perf_counter()
+        self.seed(rng, n_donors)
+        self.stdout.write(f'Seeded {n_donors} donors in {time.perf_counter() - started:.1f}s')
+        started = time.perf_counter()
+        rebuild('donor')
+        self.stdout.write(f'Built the donor index in {time.perf_counter() - started:.1f}s')
+
+        sample = Donor.objects.order_by('-id').values('full_name', 'email', 'phone').first()
+        queries = [
+            sample['full_name'].split()[1],
+            sample['full_name'],
+            'pune',
+            sample['email'],
+            sample['phone'][:6],
+            'nomatch',
+        ]
+        base = Donor.objects.order_by('-created_at')
+        self.stdout.write(f'{"query":<36} {"icontains":>11} {"indexed":>11} {"matches":>8}')
+        for query in queries:
+            request = Request(RequestFactory().get('/', {'search': query}))
+
+            def scan():
+                return list(SearchFilter().filter_queryset(request, base, DonorViewSet).values_list('id', flat=True)[:20])
+
+            def indexed():
+                ranked = IndexedSearchFilter().filter_queryset(request, base, DonorViewSet)
+                return list(ranked.values_list('id', flat=True)[:20])
+
+            scan_time, _ = self.time(options['repeat'], scan)
+            index_time, _ = self.time(options['repeat'], indexed)
+            matches = base.filter(search('donor', query)[0]).count()
+            self.stdout.write(f'{query[:36]:<36} {scan_time * 1000:>9.1f}ms {index_time * 1000:>9.1f}ms {matches:>8}')
+        self.stdout.write(f'Database: {connection.vendor}')
+        self.stdout.write(self.style.SUCCESS('Search benchmark complete'))
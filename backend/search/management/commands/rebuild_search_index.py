@@ -0,0 +1,28 @@
+"""
+Rebuild the full-text search tables from the database.
+
+Run after bulk loads that bypass model signals (raw SQL, loaddata):
+
+    python manage.py rebuild_search_index [--index donor ...]
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from search.index import INDEXES, rebuild
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the search index tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--index', action='append', choices=sorted(INDEXES), help='Only this index (repeatable)')
+
+    def handle(self, *args, **options):
+        for name in options['index'] or INDEXES:
+            started = time.perf_counter()
+            with transaction.atomic():
+                rebuild(name)
+            self.stdout.write(f'{name}: rebuilt in {time.perf_counter() - started:.2f}s')
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt.'))
@@ -0,0 +1,42 @@
+from django.db import migrations
+
+
+def create_indexes(apps, schema_editor):
+    from search.backends import get_backend
+    from search.index import INDEXES, rebuild
+
+    backend = get_backend(schema_editor.connection)
+    if backend is None:
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for index in INDEXES.values():
+            backend.create(cursor, index.table)
+    for name, index in INDEXES.items():
+        rebuild(name, model=apps.get_model(index.model_label))
+
+
+def drop_indexes(apps, schema_editor):
+    from search.backends import get_backend
+    from search.index import INDEXES
+
+    backend = get_backend(schema_editor.connection)
+    if backend is None:
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for index in INDEXES.values():
+            backend.drop(cursor, index.table)
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('bloodbank', '0007_keyset_pagination_indexes'),
+        ('donors', '0007_donor_next_eligible_date'),
+        ('requests', '0006_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
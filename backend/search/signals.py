@@ -0,0 +1,35 @@
+from django.db.models.signals import post_delete, post_save
+
+from . import index
+
+
+def _connect(search_index):
+    def reindex(sender, instance, raw=False, **kwargs):
+        if not raw:
+            index.update(search_index.name, [instance.pk])
+
+    def unindex(sender, instance, **kwargs):
+        index.remove(search_index.name, [instance.pk])
+
+    post_save.connect(reindex, sender=search_index.model, weak=False,
+                      dispatch_uid=f'search-{search_index.name}-save')
+    post_delete.connect(unindex, sender=search_index.model, weak=False,
+                        dispatch_uid=f'search-{search_index.name}-delete')
+
+    for related_model, lookup in search_index.related():
+        def reindex_related(sender, instance, created=False, raw=False, update_fields=None, lookup=lookup,
+                            **kwargs):
+            # Nothing can refer to a new row yet, and other field updates leave the bodies alone
+            if raw or created:
+                return
+            if update_fields is not None and not set(update_fields) & set(search_index.fields_of(lookup)):
+                return
+            index.update_queryset(search_index.name, search_index.model.objects.filter(**{lookup: instance}))
+
+        post_save.connect(reindex_related, sender=related_model, weak=False,
+                          dispatch_uid=f'search-{search_index.name}-{lookup}-save')
+
+
+def connect_signals():
+    for search_index in index.INDEXES.values():
+        _connect(search_index)
@@ -0,0 +1,92 @@
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts.models import User
+from bloodbank.models import BloodBank
+from requests.models import BloodRequest
+from . import index
+
+
+def make_bank(n):
+    user = User.objects.create(username=f'bank{n}', email=f'bank{n}@example.com', phone=f'90000000{n:02d}',
+                               user_type='bloodbank')
+    BloodBank.objects.create(user=user, name=f'Bank {n}', registration_number=f'REG{n}')
+    return User.objects.select_related('bloodbank').get(pk=user.pk)
+
+
+def make_request(requester, **kwargs):
+    fields = dict(
+        requester=requester, patient_name='Patient', blood_group='O+', units_required=2, urgency='urgent',
+        required_date=timezone.localdate(), hospital_name='City Hospital', doctor_name='Dr. Rao',
+        contact_number='9999999999', reason='Surgery',
+    )
+    fields.update(kwargs)
+    return BloodRequest.objects.create(**fields)
+
+
+class IndexedSearchTests(TestCase):
+    def setUp(self):
+        self.bank_user = make_bank(1)
+        self.requester = User.objects.create(username='donor', email='donor@example.com', phone='8000000000',
+                                             user_type='donor')
+        token = RefreshToken.for_user(self.bank_user).access_token
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+
+    def search(self, query, **params):
+        response = self.client.get('/api/requests/requests/', {'search': query, **params}, **self.auth)
+        self.assertEqual(response.status_code, 200)
+        return [row['id'] for row in response.json()['results']]
+
+    def test_ranked_prefix_matches(self):
+        weak = make_request(self.requester, patient_name='Meera', hospital_name='Ruby Hall', doctor_name='Dr. Rao')
+        strong = make_request(self.requester, patient_name='Ruby Rao', hospital_name='Ruby Hall',
+                              doctor_name='Dr. Ruby Rao')
+        make_request(self.requester, patient_name='Other', hospital_name='Sassoon', doctor_name='Dr. Iyer')
+        self.assertEqual(self.search('rub ra'), [strong.id, weak.id])
+        # An explicit ordering replaces the rank
+        self.assertEqual(self.search('ruby', ordering='created_at'), [weak.id, strong.id])
+
+    def test_index_follows_saves_and_deletes(self):
+        blood_request = make_request(self.requester, bloodbank=self.bank_user.bloodbank, hospital_name='Ruby Hall')
+        blood_request.hospital_name = 'Jehangir'
+        blood_request.save()
+        self.assertEqual(self.search('ruby'), [])
+        self.assertEqual(self.search('jehangir'), [blood_request.id])
+
+        bank = self.bank_user.bloodbank
+        bank.name = 'Lifeline Blood Centre'
+        bank.save()
+        self.assertEqual(self.search('lifeline'), [blood_request.id])
+
+        blood_request.delete()
+        self.assertEqual(self.search('jehangir'), [])
+
+    def test_search_runs_inside_the_scoped_query(self):
+        others = User.objects.create(username='others', email='others@example.com', phone='8000000001',
+                                     user_type='donor')
+        BloodRequest.objects.bulk_create([
+            BloodRequest(requester=others, patient_name=f'Ruby {i}', blood_group='O+', units_required=1,
+                         urgency='normal', required_date=timezone.localdate(), hospital_name='Ruby Hall',
+                         doctor_name='Dr. Rao', contact_number='9999999999', reason='Surgery')
+            for i in range(600)
+        ])
+        index.rebuild('bloodrequest')
+        own = make_request(self.requester, patient_name='Meera Kulkarni', hospital_name='Ruby Hall')
+
+        # The requester's own match ranks below the 600 others but is still found
+        token = RefreshToken.for_user(self.requester).access_token
+        response = self.client.get('/api/requests/requests/', {'search': 'ruby'},
+                                   HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.json()['count'], 1)
+        self.assertEqual([row['id'] for row in response.json()['results']], [own.id])
+
+        # Banks see every request: the total is exact, not a top-N of the index
+        response = self.client.get('/api/requests/requests/', {'search': 'ruby'}, **self.auth)
+        self.assertEqual(response.json()['count'], 601)
+
+    def test_query_without_words_matches_nothing(self):
+        make_request(self.requester, patient_name='Ruby')
+        condition, ordering = index.search('bloodrequest', '-- !')
+        self.assertFalse(BloodRequest.objects.filter(condition).exists())
+        self.assertEqual(ordering, [])
@@ -44,8 +44,8 @@ echo "Collecting static files..."
 echo "=========================================="
 python manage.py collectstatic --noinput || true
 
-# Start gunicorn
+# Start the ASGI server (the inventory event stream needs ASGI)
 echo "=========================================="
-echo "Starting gunicorn server..."
+echo "Starting uvicorn server..."
 echo "=========================================="
-exec gunicorn ebloodbank.wsgi:application --bind 0.0.0.0:$PORT
+exec uvicorn ebloodbank.asgi:application --host 0.0.0.0 --port $PORT
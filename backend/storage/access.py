@@ -0,0 +1,43 @@
+"""
+Who may read an uploaded file.
+
+Media is served through ``storage.views.serve_media`` rather than straight
+from ``MEDIA_ROOT``, so every read is checked against the rows that point
+at the file. Stored names are content hashes shared by every upload of the
+same bytes, so a user may read a file when any row they can see uses it:
+
+* staff: everything
+* ``profiles/``: the profile's own user
+* ``licenses/``: the blood bank's own user
+* ``prescriptions/``: the requester, and blood banks (who see all requests)
+
+Anything else, including spooled uploads under ``TMP_DIR``, is never served.
+"""
+from django.apps import apps
+
+from .backends import TMP_DIR
+
+
+def _references(user):
+    """``(model, file field, visible rows)`` for each upload field, as seen by ``user``."""
+    BloodRequest = apps.get_model('requests', 'BloodRequest')
+    yield (apps.get_model('accounts', 'UserProfile'), 'profile_picture', {'user': user})
+    yield (apps.get_model('bloodbank', 'BloodBank'), 'license_document', {'user': user})
+    if hasattr(user, 'bloodbank'):
+        yield BloodRequest, 'prescription_document', {}
+    else:
+        yield BloodRequest, 'prescription_document', {'requester': user}
+
+
+def can_read(user, name):
+    """Whether ``user`` may read the stored file ``name``."""
+    if not name or name.split('/', 1)[0] == TMP_DIR:
+        return False
+    if not (user and user.is_authenticated and user.is_active):
+        return False
+    if user.is_staff:
+        return True
+    return any(
+        model.objects.filter(**{field: name}, **visible).exists()
+        for model, field, visible in _references(user)
+    )
@@ -0,0 +1,10 @@
+from django.contrib import admin
+from .models import StoredObject
+
+
+@admin.register(StoredObject)
+class StoredObjectAdmin(admin.ModelAdmin):
+    list_display = ('name', 'content_type', 'size', 'created_at')
+    list_filter = ('content_type',)
+    search_fields = ('=sha256', 'name')
+    readonly_fields = ('sha256', 'name', 'size', 'content_type', 'created_at')
@@ -0,0 +1,131 @@
+"""
+Content-addressed file storage for uploaded documents.
+
+``ContentAddressedStorage`` is the default storage (see ``STORAGES``), so
+``BloodRequest.prescription_document``, ``BloodBank.license_document`` and
+``UserProfile.profile_picture`` all go through it. An upload is streamed in
+``CHUNK_SIZE`` pieces into a temporary file next to ``MEDIA_ROOT`` while
+it is hashed, so memory stays flat however large the PDF is. Uploads
+Django has already spooled to disk are hashed in place and moved, not copied.
+
+The file is stored once under ``objects/<aa>/<bb>/<sha256><ext>`` and
+recorded as a ``StoredObject`` with its size and sniffed MIME type.
+Uploading the same bytes again returns the existing name, so duplicates
+take no extra space. Because a name never changes content, media
+responses can be cached forever (see ``storage.views.serve_media``).
+"""
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+
+
+CHUNK_SIZE = 64 * 1024
+OBJECTS_DIR = 'objects'
+TMP_DIR = 'tmp'
+# Leading bytes of the document and image types users upload
+SIGNATURES = (
+    (b'%PDF-', 'application/pdf'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+WEBP = 'image/webp'
+# Types safe to render in the browser; anything else is served as a download
+INLINE_TYPES = frozenset([content_type for _, content_type in SIGNATURES] + [WEBP])
+_SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+def sniff_content_type(head):
+    """MIME type from the file's first bytes.
+
+    The type the client declared and the file's extension are never used:
+    unrecognised content is ``application/octet-stream``.
+    """
+    for signature, content_type in SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return WEBP
+    return 'application/octet-stream'
+
+
+def object_name(digest, ext=''):
+    return f'{OBJECTS_DIR}/{digest[:2]}/{digest[2:4]}/{digest}{ext}'
+
+
+def sha256_from_name(name):
+    """The content hash encoded in a stored object's name, or ``None`` for other files."""
+    stem = os.path.splitext(os.path.basename(name))[0]
+    return stem if _SHA256_RE.match(stem) else None
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    chunk_size = CHUNK_SIZE
+
+    def get_available_name(self, name, max_length=None):
+        # The final name comes from the content in _save, so never suffix it
+        return name
+
+    def _spool(self, content):
+        """Hash ``content`` chunk by chunk; returns ``(digest, size, head, path, owned)``.
+
+        ``path`` is a file holding the bytes: the upload's own temporary file
+        when Django already wrote one, otherwise one spooled here (``owned``).
+        """
+        digest = hashlib.sha256()
+        size = 0
+        head = b''
+        if hasattr(content, 'temporary_file_path'):
+            for chunk in content.chunks(self.chunk_size):
+                if not head:
+                    head = chunk[:16]
+                digest.update(chunk)
+                size += len(chunk)
+            return digest.hexdigest(), size, head, content.temporary_file_path(), False
+
+        tmp_dir = self.path(TMP_DIR)
+        os.makedirs(tmp_dir, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=tmp_dir, delete=False) as spool:
+            try:
+                for chunk in content.chunks(self.chunk_size):
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    if not head:
+                        head = chunk[:16]
+                    digest.update(chunk)
+                    size += len(chunk)
+                    spool.write(chunk)
+            except BaseException:
+                os.remove(spool.name)
+                raise
+        return digest.hexdigest(), size, head, spool.name, True
+
+    def _save(self, name, content):
+        from .models import StoredObject
+
+        digest, size, head, path, owned = self._spool(content)
+        existing = StoredObject.objects.filter(sha256=digest).values_list('name', flat=True).first()
+        if existing and self.exists(existing):
+            if owned:
+                os.remove(path)
+            return existing
+
+        final = object_name(digest, os.path.splitext(name)[1].lower()[:10])
+        full_path = self.path(final)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        # Same bytes under the same name, so losing a race to another upload is harmless
+        file_move_safe(path, full_path, allow_overwrite=True)
+        if self.file_permissions_mode is not None:
+            os.chmod(full_path, self.file_permissions_mode)
+
+        StoredObject.objects.update_or_create(sha256=digest, defaults={
+            'name': final,
+            'size': size,
+            'content_type': sniff_content_type(head),
+        })
+        return final
@@ -0,0 +1,17 @@
+from django.db import models
+
+
+class StoredObject(models.Model):
+    """One stored file per distinct content, keyed by its SHA-256.
+
+    Every ``FileField`` value pointing at ``name`` shares this file; uploading
+    the same bytes again reuses it instead of writing a copy.
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField()
+    content_type = models.CharField(max_length=100)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.size} bytes)"
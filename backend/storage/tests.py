@@ -0,0 +1,120 @@
+import os
+import shutil
+import tempfile
+
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts.models import User
+from bloodbank.models import BloodBank
+from requests.models import BloodRequest
+from .backends import TMP_DIR
+from .models import StoredObject
+from .views import UnsatisfiableRange, byte_range
+
+
+PDF = b'%PDF-1.4\n' + bytes(range(256)) * 4
+
+
+def make_bank(n):
+    user = User.objects.create(username=f'bank{n}', email=f'bank{n}@example.com', phone=f'90000000{n:02d}',
+                               user_type='bloodbank')
+    BloodBank.objects.create(user=user, name=f'Bank {n}', registration_number=f'REG{n}')
+    return user
+
+
+def auth(user):
+    return {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(user).access_token}'}
+
+
+class ByteRangeTests(SimpleTestCase):
+    def test_whole_file(self):
+        for header in (None, '', 'bytes=-', 'bytes=0-1,4-5', 'items=0-1', 'bytes=a-b'):
+            self.assertIsNone(byte_range(header, 100), header)
+
+    def test_ranges(self):
+        self.assertEqual(byte_range('bytes=0-9', 100), (0, 9))
+        self.assertEqual(byte_range(' bytes=90- ', 100), (90, 99))
+        # The end is clamped to the file
+        self.assertEqual(byte_range('bytes=50-500', 100), (50, 99))
+        # Suffix ranges: the last N bytes, or the whole file when N exceeds it
+        self.assertEqual(byte_range('bytes=-10', 100), (90, 99))
+        self.assertEqual(byte_range('bytes=-500', 100), (0, 99))
+
+    def test_unsatisfiable(self):
+        for header, size in (('bytes=100-', 100), ('bytes=10-5', 100), ('bytes=-0', 100), ('bytes=-5', 0)):
+            with self.assertRaises(UnsatisfiableRange, msg=header):
+                byte_range(header, size)
+
+
+class ServeMediaTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root, MEDIA_SENDFILE='')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.requester = User.objects.create(username='donor', email='donor@example.com', phone='8000000000',
+                                             user_type='donor')
+        self.other = User.objects.create(username='other', email='other@example.com', phone='8000000001',
+                                         user_type='donor')
+        self.bank_user = make_bank(1)
+        self.staff = User.objects.create(username='staff', email='staff@example.com', phone='8000000002',
+                                         user_type='admin', is_staff=True)
+
+    def prescription(self, upload):
+        name = default_storage.save(f'prescriptions/{upload.name}', upload)
+        BloodRequest.objects.create(
+            requester=self.requester, patient_name='Patient', blood_group='O+', units_required=1,
+            urgency='urgent', required_date=timezone.localdate(), hospital_name='City Hospital',
+            doctor_name='Dr. Rao', contact_number='9999999999', reason='Surgery', prescription_document=name,
+        )
+        return f'/media/{name}'
+
+    def test_only_users_who_see_the_row_may_read(self):
+        url = self.prescription(SimpleUploadedFile('rx.pdf', PDF, content_type='application/pdf'))
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.client.get(url, **auth(self.other)).status_code, 404)
+        for user in (self.requester, self.bank_user, self.staff):
+            response = self.client.get(url, **auth(user))
+            self.assertEqual(response.status_code, 200, user.username)
+            self.assertEqual(b''.join(response.streaming_content), PDF)
+
+    def test_temporary_files_are_never_served(self):
+        os.makedirs(os.path.join(self.media_root, TMP_DIR))
+        with open(os.path.join(self.media_root, TMP_DIR, 'upload.pdf'), 'wb') as f:
+            f.write(PDF)
+        self.assertEqual(self.client.get(f'/media/{TMP_DIR}/upload.pdf', **auth(self.staff)).status_code, 404)
+
+    def test_safe_types_render_inline(self):
+        url = self.prescription(SimpleUploadedFile('rx.pdf', PDF, content_type='text/html'))
+        response = self.client.get(url, **auth(self.requester))
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+        self.assertFalse(response.get('Content-Disposition', '').startswith('attachment'))
+
+    def test_other_content_is_a_download(self):
+        url = self.prescription(SimpleUploadedFile('rx.html', b'<script>alert(1)</script>', content_type='text/html'))
+        self.assertEqual(StoredObject.objects.get().content_type, 'application/octet-stream')
+
+        response = self.client.get(url, **auth(self.requester))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/octet-stream')
+        self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+        self.assertTrue(response['Content-Disposition'].startswith('attachment'))
+
+    def test_range_request(self):
+        url = self.prescription(SimpleUploadedFile('rx.pdf', PDF))
+        response = self.client.get(url, HTTP_RANGE='bytes=5-14', **auth(self.requester))
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 5-14/{len(PDF)}')
+        self.assertEqual(b''.join(response.streaming_content), PDF[5:15])
+
+        response = self.client.get(url, HTTP_RANGE=f'bytes={len(PDF)}-', **auth(self.requester))
+        self.assertEqual(response.status_code, 416)
@@ -0,0 +1,148 @@
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.views.decorators.http import require_http_methods
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .access import can_read
+from .backends import CHUNK_SIZE, INLINE_TYPES, sha256_from_name
+from .models import StoredObject
+
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class UnsatisfiableRange(Exception):
+    pass
+
+
+def byte_range(header, size):
+    """Inclusive ``(start, end)`` for a single-range ``Range`` header, or ``None`` to send the whole file.
+
+    Multi-range and malformed headers are ignored, as RFC 9110 allows.
+    Raises ``UnsatisfiableRange`` when the range lies outside the file.
+    """
+    match = _RANGE_RE.match(header.strip()) if header else None
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if not length or not size:
+            raise UnsatisfiableRange
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise UnsatisfiableRange
+    return start, end
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            data = f.read(min(CHUNK_SIZE, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+
+def _authenticated_user(request):
+    """The session user (the admin site) or the bearer of a valid access token, else ``None``."""
+    if request.user.is_authenticated:
+        return request.user
+    try:
+        authenticated = JWTAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return None
+    return authenticated[0] if authenticated else None
+
+
+def _offload(path, full_path, content_type):
+    """Hand the file to the front web server (nginx ``X-Accel-Redirect`` or Apache/lighttpd ``X-Sendfile``)."""
+    response = HttpResponse(content_type=content_type)
+    if settings.MEDIA_SENDFILE == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = settings.MEDIA_SENDFILE_PREFIX.rstrip('/') + '/' + quote(path)
+    else:
+        response['X-Sendfile'] = full_path
+    return response
+
+
+@require_http_methods(['GET', 'HEAD'])
+def serve_media(request, path):
+    """Serve an uploaded file with range support, or offload it to the front server.
+
+    Only users who can see a row using the file may read it (see
+    ``storage.access``); others get a 404 so names do not leak. Files are
+    typed from their sniffed content only, and anything but a known image
+    or PDF is sent as an attachment so it never renders in the browser.
+    Content-addressed files never change, so they carry their hash as ETag
+    and may be cached indefinitely by the client.
+    """
+    user = _authenticated_user(request)
+    if user is None:
+        response = HttpResponse(status=401)
+        response['WWW-Authenticate'] = 'Bearer realm="api"'
+        return response
+    if not can_read(user, path):
+        raise Http404
+    try:
+        full_path = default_storage.path(path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+
+    digest = sha256_from_name(path)
+    content_type = None
+    if digest:
+        content_type = StoredObject.objects.filter(sha256=digest).values_list('content_type', flat=True).first()
+    inline = content_type in INLINE_TYPES
+    if not inline:
+        content_type = 'application/octet-stream'
+    etag = f'"{digest}"' if digest else None
+
+    if etag and etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+    elif settings.MEDIA_SENDFILE:
+        # The front server handles ranges itself
+        response = _offload(path, full_path, content_type)
+    else:
+        size = os.path.getsize(full_path)
+        range_header = request.headers.get('Range')
+        if_range = request.headers.get('If-Range')
+        if if_range and if_range != etag:
+            # The client's copy is stale: send the whole file
+            range_header = None
+        try:
+            requested = byte_range(range_header, size)
+        except UnsatisfiableRange:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        if requested is None:
+            response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+        else:
+            start, end = requested
+            response = StreamingHttpResponse(_read_range(full_path, start, end - start + 1),
+                                             status=206, content_type=content_type)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = str(end - start + 1)
+        response['Accept-Ranges'] = 'bytes'
+
+    response['X-Content-Type-Options'] = 'nosniff'
+    if not inline:
+        response['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(os.path.basename(path))}"
+    if etag:
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
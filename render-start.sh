@@ -1,5 +1,5 @@
 #!/bin/bash
-# Force the correct WSGI application
+# Force the correct ASGI application
 cd backend
-exec python3.11 -m gunicorn ebloodbank.wsgi:application --bind 0.0.0.0:$PORT
+exec python3.11 -m uvicorn ebloodbank.asgi:application --host 0.0.0.0 --port $PORT
 
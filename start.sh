@@ -1,4 +1,4 @@
 #!/bin/bash
 cd backend
-exec gunicorn ebloodbank.wsgi:application --bind 0.0.0.0:$PORT
+exec uvicorn ebloodbank.asgi:application --host 0.0.0.0 --port $PORT
 